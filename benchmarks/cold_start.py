@@ -0,0 +1,106 @@
+# Cold-start budget check: time `import func` and the first request in fresh interpreters
+#
+#   python benchmarks/cold_start.py --runs 5 --import-budget-ms 300 --first-request-budget-ms 1500
+#
+# Each run starts a new interpreter that brings up the stub SQL server and GenAI client (zero
+# latency, so only our own startup work is measured), imports func, then serves one query.
+# Exits non-zero when the median import or first-request time is over budget.
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUERY = "Top 5 suppliers by PO value"
+
+
+def child(eager_warmup):
+    """One cold start: prints {"import_ms", "first_request_ms", "total_ms"} as JSON"""
+    started = time.perf_counter()
+    sys.path.insert(1, REPO_ROOT)
+    from corpus import prompt_examples
+    from stubs import StubGenAiClient, StubSqlServer
+
+    sql_server = StubSqlServer(table_rows=50)
+    os.environ["SQL_ENDPOINT"] = sql_server.start()
+    os.environ["EAGER_WARMUP"] = eager_warmup
+    os.environ.setdefault("LOG_LEVEL", "warning")
+    os.environ.setdefault("EXPORT_FORMAT", "none")
+    stubs_ready = time.perf_counter()
+
+    import func
+    from test import DummyCtx
+    imported = time.perf_counter()
+
+    # The SDK client is replaced after import, as the real one would need OCI credentials
+    func.genai_manager.set_client(StubGenAiClient(prompt_examples()))
+    ctx = DummyCtx()
+    func.handler(ctx, io.BytesIO(json.dumps({"query": QUERY}).encode("utf-8")))
+    finished = time.perf_counter()
+    func.log.flush()
+
+    print(json.dumps({
+        "import_ms": round((imported - stubs_ready) * 1000, 1),
+        "first_request_ms": round((finished - imported) * 1000, 1),
+        "total_ms": round((finished - stubs_ready) * 1000, 1),
+        "status": ctx.StatusCode(),
+        "harness_ms": round((stubs_ready - started) * 1000, 1),
+    }))
+
+
+def run(runs, eager_warmup):
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--eager-warmup", eager_warmup],
+            cwd=BENCHMARKS_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"cold start run failed:\n{completed.stderr[-2000:]}")
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start budget check for the function module")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--eager-warmup", choices=("false", "true", "background"), default="false")
+    parser.add_argument("--import-budget-ms", type=float, default=500.0)
+    parser.add_argument("--first-request-budget-ms", type=float, default=1500.0)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.eager_warmup)
+        return 0
+
+    samples = run(args.runs, args.eager_warmup)
+    report = {"runs": args.runs, "eager_warmup": args.eager_warmup, "samples": samples}
+    failures = []
+    for key, budget in (("import_ms", args.import_budget_ms), ("first_request_ms", args.first_request_budget_ms)):
+        values = [sample[key] for sample in samples]
+        report[key] = {"median": statistics.median(values), "max": max(values), "budget": budget}
+        if statistics.median(values) > budget:
+            failures.append(f"{key} median {statistics.median(values)} ms is over the {budget} ms budget")
+    report["failures"] = failures
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    print(output)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
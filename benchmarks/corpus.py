@@ -0,0 +1,62 @@
+# Replay corpus: the question/SQL examples of the SQL prompt plus the checked-in questions.json;
+# questions quoted in a requests.jsonl backlog are only added on request
+
+import json
+import os
+import re
+
+from prompts import SQL_PROMPT_SECTIONS
+
+
+EXAMPLE_PATTERN = re.compile(r'^User: "(?P<question>[^"]+)"\s*\n→ (?P<sql>[^\n]+)', re.MULTILINE)
+# Quoted phrases in change requests that read like user questions about the data
+QUESTION_PATTERN = re.compile(r'["“](?P<question>[^"”`{}:\n]{8,120})["”]')
+DOMAIN_WORDS = re.compile(r"\b(po|pos|tender|tenders|rc|supplier|suppliers|item|items|bids|vendor)\b", re.IGNORECASE)
+# Fixed questions replayed on every run, so results compare across checkouts
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.json")
+
+
+def prompt_examples():
+    """{question: sql} for every worked example in the SQL generation prompt"""
+    examples = {}
+    for _, text in SQL_PROMPT_SECTIONS:
+        for match in EXAMPLE_PATTERN.finditer(text):
+            examples[match["question"]] = match["sql"].strip()
+    return examples
+
+
+def request_questions(path):
+    """Questions quoted in the change requests (e.g. "bids in tender 161(R)")"""
+    questions = []
+    with open(path, encoding="utf-8") as requests_file:
+        for line in requests_file:
+            if not line.strip():
+                continue
+            for match in QUESTION_PATTERN.finditer(json.loads(line).get("body", "")):
+                question = match["question"].strip()
+                if DOMAIN_WORDS.search(question) and question not in questions:
+                    questions.append(question)
+    return questions
+
+
+def build_corpus(requests_path=None, extra_path=None, questions_path=QUESTIONS_PATH):
+    """Returns (queries, completions): the questions to replay and the recorded SQL per question.
+
+    questions_path and extra_path are JSON lists of {"query", "sql"} entries (extra_path e.g.
+    captured from production logs); entries without sql are answered with the closest recorded
+    question's SQL. requests_path opts in to the questions quoted in a requests.jsonl.
+    """
+    completions = prompt_examples()
+    queries = list(completions)
+    for path in (questions_path, extra_path):
+        if not path:
+            continue
+        with open(path, encoding="utf-8") as entries_file:
+            for entry in json.load(entries_file):
+                if entry.get("sql"):
+                    completions[entry["query"]] = entry["sql"]
+                if entry["query"] not in queries:
+                    queries.append(entry["query"])
+    if requests_path:
+        queries.extend(question for question in request_questions(requests_path) if question not in queries)
+    return queries, completions
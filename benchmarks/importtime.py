@@ -0,0 +1,84 @@
+# Startup profile: `python -X importtime -c "import func"` in a fresh interpreter, summarized as JSON
+#
+#   python benchmarks/importtime.py --top 25 --output importtime.json
+#
+# Reports the total import time of func, the slowest modules by cumulative and self time, and
+# which of the heavy dependencies (OCI SDK, fdk, urllib3, pyarrow, NumPy) were imported at all.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("oci", "fdk", "urllib3", "pyarrow", "numpy", "tokenizers")
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from -X importtime output"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def profile(module="func", env=None):
+    """Run the import in a fresh interpreter from the repo root; returns the parsed entries"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        env={**os.environ, **(env or {})},
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr)
+
+
+def summarize(entries, module="func", top=20):
+    total_us = next((cumulative for name, _, cumulative, _ in entries if name == module), None)
+    top_level = {name.split(".")[0] for name, _, _, _ in entries}
+    by_cumulative = sorted(entries, key=lambda entry: entry[2], reverse=True)
+    by_self = sorted(entries, key=lambda entry: entry[1], reverse=True)
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1) if total_us is not None else None,
+        "modules_imported": len(entries),
+        "heavy_modules_imported": {name: name in top_level for name in HEAVY_MODULES},
+        "top_cumulative_ms": [
+            {"module": name, "ms": round(cumulative / 1000, 1), "depth": depth}
+            for name, _, cumulative, depth in by_cumulative[:top]
+        ],
+        "top_self_ms": [{"module": name, "ms": round(self_us / 1000, 1)} for name, self_us, _, _ in by_self[:top]],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time profile of the function module")
+    parser.add_argument("--module", default="func")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--eager-warmup", choices=("false", "true", "background"), default="false",
+                        help="EAGER_WARMUP for the profiled import")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    entries = profile(args.module, {"EAGER_WARMUP": args.eager_warmup})
+    report = summarize(entries, args.module, args.top)
+    report["eager_warmup"] = args.eager_warmup
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
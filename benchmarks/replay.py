@@ -0,0 +1,274 @@
+# Offline replay benchmark: drives handler over a query corpus against stub GenAI and SQL servers
+#
+#   python benchmarks/replay.py --iterations 3 --concurrency 4 --output baseline.json
+#   python benchmarks/replay.py --compare baseline.json
+#   python benchmarks/replay.py --cold --local-engine     # SQL served from the SQLite replica
+#   python benchmarks/replay.py --cold --rollups          # covered aggregates served from the rollups
+#
+# Reports per-stage latency percentiles (from the Server-Timing header), throughput, peak RSS and
+# allocation statistics as JSON; --compare exits non-zero when a stage regressed.
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, REPO_ROOT)
+
+from corpus import build_corpus
+from stubs import StubGenAiClient, StubSqlServer
+
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentiles(values):
+    """Nearest-rank percentiles plus mean and max of values (ms)"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    summary = {f"p{p}": round(ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))], 2)
+               for p in PERCENTILES}
+    summary["mean"] = round(sum(ordered) / len(ordered), 2)
+    summary["max"] = round(ordered[-1], 2)
+    summary["count"] = len(ordered)
+    return summary
+
+
+def parse_server_timing(header):
+    """{stage: ms} from a Server-Timing header value"""
+    stages = {}
+    for metric in (header or "").split(","):
+        name, _, duration = metric.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration)
+    return stages
+
+
+def response_error(body, mode):
+    """Whether the response reports an error: top-level, per batch query or in any stream event"""
+    try:
+        documents = [json.loads(line) for line in body.splitlines() if line.strip()] if mode == "stream" else [json.loads(body)]
+    except ValueError:
+        return True
+    for document in documents:
+        if not isinstance(document, dict) or "error" in document:
+            return True
+        if any(isinstance(item, dict) and "error" in item for item in document.get("results") or []):
+            return True
+    return False
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+class Replay:
+    """Runs corpus queries through handler with DummyCtx and collects per-request timings"""
+
+    def __init__(self, func, ctx_class, mode="query", batch_size=5, cold=False):
+        self.func = func
+        self.ctx_class = ctx_class
+        self.mode = mode
+        self.batch_size = batch_size
+        self.cold = cold
+
+    def payloads(self, queries):
+        if self.mode == "batch":
+            return [{"queries": queries[start:start + self.batch_size]}
+                    for start in range(0, len(queries), self.batch_size)]
+        if self.mode == "stream":
+            return [{"query": query, "stream": True} for query in queries]
+        return [{"query": query} for query in queries]
+
+    def run_one(self, payload):
+        if self.cold:
+            self.func.sql_cache.memory.clear()
+            self.func.result_cache.memory.clear()
+        ctx = self.ctx_class()
+        data = io.BytesIO(json.dumps(payload).encode("utf-8"))
+        started = time.perf_counter()
+        result = self.func.handler(ctx, data)
+        latency_ms = (time.perf_counter() - started) * 1000
+        body = result.body_bytes().decode("utf-8")
+        error = ctx.StatusCode() != 200 or response_error(body, self.mode)
+        return {
+            "latency_ms": latency_ms,
+            "stages": parse_server_timing(ctx.ResponseHeaders().get("Server-Timing")),
+            "bytes": len(body),
+            "error": error,
+        }
+
+    def run(self, payloads, concurrency=1):
+        """Returns (samples, wall_seconds)"""
+        started = time.perf_counter()
+        if concurrency <= 1:
+            samples = [self.run_one(payload) for payload in payloads]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as pool:
+                samples = list(pool.map(self.run_one, payloads))
+        return samples, time.perf_counter() - started
+
+    def allocations(self, payloads, top_sites=10):
+        """Per-request peak traced memory, retained memory and the top allocation sites of one pass"""
+        tracemalloc.start(10)
+        before = tracemalloc.take_snapshot()
+        blocks_before = sys.getallocatedblocks()
+        peaks = []
+        for payload in payloads:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+            self.run_one(payload)
+            peaks.append((tracemalloc.get_traced_memory()[1] - start_bytes) / 1024)
+        after = tracemalloc.take_snapshot()
+        retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        sites = after.compare_to(before, "lineno")[:top_sites]
+        tracemalloc.stop()
+        return {
+            "request_peak_kib": percentiles(peaks),
+            "retained_bytes": retained,
+            "retained_blocks": sys.getallocatedblocks() - blocks_before,
+            "top_sites": [
+                {"site": str(stat.traceback[0]), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in sites
+            ],
+        }
+
+
+def summarize(samples, wall_seconds):
+    stages = {}
+    for sample in samples:
+        for name, ms in sample["stages"].items():
+            stages.setdefault(name, []).append(ms)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample["error"]),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+        "latency_ms": percentiles([sample["latency_ms"] for sample in samples]),
+        "stages_ms": {name: percentiles(values) for name, values in sorted(stages.items())},
+        "response_bytes": percentiles([sample["bytes"] for sample in samples]),
+    }
+
+
+def compare(report, baseline, max_regression, floor_ms=1.0):
+    """Stage/latency percentiles that grew by more than max_regression (and floor_ms) over baseline"""
+    regressions = []
+    pairs = [("latency", report["latency_ms"], baseline.get("latency_ms", {}))]
+    pairs += [(name, stats, baseline.get("stages_ms", {}).get(name, {})) for name, stats in report["stages_ms"].items()]
+    for name, current, previous in pairs:
+        for key in ("p50", "p95"):
+            if key not in current or key not in previous:
+                continue
+            if current[key] > previous[key] * (1 + max_regression) and current[key] - previous[key] > floor_ms:
+                regressions.append({"metric": f"{name}.{key}", "baseline": previous[key], "current": current[key]})
+    if baseline.get("throughput_rps") and report["throughput_rps"] < baseline["throughput_rps"] / (1 + max_regression):
+        regressions.append({"metric": "throughput_rps", "baseline": baseline["throughput_rps"],
+                            "current": report["throughput_rps"]})
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a query corpus through handler against stub GenAI and SQL servers")
+    parser.add_argument("--requests", help="also replay the questions quoted in this requests.jsonl")
+    parser.add_argument("--corpus", help='extra JSON list of {"query", "sql"} entries to replay')
+    parser.add_argument("--mode", choices=("query", "stream", "batch"), default="query")
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=3, help="measured passes over the corpus")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured passes before measuring")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--cold", action="store_true", help="clear the SQL and result caches before every request")
+    parser.add_argument("--local-engine", action="store_true", help="serve translatable SQL from the SQLite replica")
+    parser.add_argument("--rollups", action="store_true", help="answer the aggregates the rollups cover from memory")
+    parser.add_argument("--table-rows", type=int, default=200, help="rows of an unbounded synthetic result set")
+    parser.add_argument("--sql-latency", default="fixed:20", help="SQL endpoint latency (fixed:MS, uniform:LO:HI, lognormal:MEDIAN:SIGMA)")
+    parser.add_argument("--sql-ms-per-1000-rows", type=float, default=2.0)
+    parser.add_argument("--genai-sql-latency", default="lognormal:800:0.3")
+    parser.add_argument("--genai-response-latency", default="lognormal:1500:0.3")
+    parser.add_argument("--response-words", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-allocations", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="allowed growth of p50/p95 (fraction)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    queries, completions = build_corpus(args.requests, args.corpus)
+
+    sql_server = StubSqlServer(args.table_rows, args.sql_latency, args.sql_ms_per_1000_rows, args.seed)
+    os.environ["SQL_ENDPOINT"] = sql_server.start()
+    os.environ.setdefault("LOG_LEVEL", "warning")
+    if args.local_engine:
+        os.environ["LOCAL_ENGINE"] = "true"
+        os.environ["LOCAL_ENGINE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="replay-"), "replica.sqlite3")
+    if args.rollups:
+        os.environ["ROLLUPS"] = "true"
+
+    # func reads its configuration at import time, so it is imported once the stubs are up
+    import func
+    from test import DummyCtx
+
+    genai_client = StubGenAiClient(
+        completions,
+        sql_latency=args.genai_sql_latency,
+        response_latency=args.genai_response_latency,
+        response_words=args.response_words,
+        seed=args.seed
+    )
+    func.genai_manager.set_client(genai_client)
+    if func.local_engine is not None:
+        # The snapshot is loaded before measuring, as EAGER_WARMUP would in production
+        func.local_engine.refresh()
+    if func.rollup_store is not None:
+        func.rollup_store.refresh()
+
+    replay = Replay(func, DummyCtx, args.mode, args.batch_size, args.cold)
+    payloads = replay.payloads(queries)
+    for _ in range(args.warmup):
+        replay.run(payloads, args.concurrency)
+    samples, wall_seconds = replay.run(payloads * args.iterations, args.concurrency)
+
+    report = {
+        "config": {**vars(args), "corpus_queries": len(queries), "python": platform.python_version()},
+        **summarize(samples, wall_seconds),
+        "memory": {"peak_rss_bytes": peak_rss_bytes()},
+        "stubs": {"genai_calls": dict(genai_client.calls), "sql_requests": sql_server.requests},
+    }
+    if func.local_engine is not None:
+        report["local_engine"] = func.local_engine.stats()
+    if func.rollup_store is not None:
+        report["rollups"] = func.rollup_store.stats()
+    if not args.no_allocations:
+        report["allocations"] = replay.allocations(payloads)
+    func.log.flush()
+    sql_server.stop()
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            report["regressions"] = compare(report, json.load(baseline_file), args.max_regression)
+        exit_code = 1 if report["regressions"] else 0
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
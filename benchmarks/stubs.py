@@ -0,0 +1,246 @@
+# Local stand-ins for the GenAI service and SQL_ENDPOINT, for offline replay benchmarks
+
+import datetime
+import json
+import math
+import random
+import re
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sql_rewrite import _last_select, row_bound
+from sql_validator import SCHEMA_CATALOG, tokenize
+
+
+STATUSES = {
+    "STATUS": ["Supplied", "Partial Supplied", "Non Supplied"],
+    "TENDER_STATUS": ["Under Evaluation", "Price Bid Opened", "Cancelled", "Live"],
+    "TENDER_RC_STATUS": ["RC Valid", "RC Expired", "RC Not Valid"],
+    "ITEM_RC_STATUS": ["RC Valid", "RC Expired", "RC Not Valid"],
+    "CATEGORY": ["Drugs", "Consumables", "Reagent"],
+}
+SUPPLIERS = ["Alpha Pharma", "Bharat Biotech", "Cipla Ltd", "Dr Reddys", "Emcure", "Intas", "Lupin", "Zydus"]
+ITEMS = ["Oxytocin Injection IP", "Paracetamol Tablet IP", "Metformin Tablet", "Amlodipine Tablet",
+         "Ceftriaxone Injection", "Insulin Lispro Injection", "Calamine Lotion", "Cough Syrup"]
+
+
+class Latency:
+    """A latency distribution in milliseconds, parsed from a spec.
+
+    "fixed:MS", "uniform:LOW:HIGH", or "lognormal:MEDIAN:SIGMA" (long tail, like model calls).
+    """
+
+    def __init__(self, spec="fixed:0", seed=None):
+        self.spec = spec
+        kind, *args = spec.split(":")
+        self.kind = kind
+        self.args = [float(arg) for arg in args]
+        if kind not in ("fixed", "uniform", "lognormal") or len(self.args) != {"fixed": 1}.get(kind, 2):
+            raise ValueError(f"Invalid latency spec: {spec}")
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_ms(self):
+        with self._lock:
+            if self.kind == "fixed":
+                return self.args[0]
+            if self.kind == "uniform":
+                return self._random.uniform(*self.args)
+            median, sigma = self.args
+            return self._random.lognormvariate(math.log(max(median, 0.001)), sigma)
+
+    def wait(self):
+        time.sleep(self.sample_ms() / 1000)
+
+
+def _chat_response(text, completion_tokens):
+    """Object shaped like the SDK's non-streaming Cohere chat response"""
+    usage = types.SimpleNamespace(completion_tokens=completion_tokens)
+    return types.SimpleNamespace(data=types.SimpleNamespace(
+        chat_response=types.SimpleNamespace(text=text, usage=usage)
+    ))
+
+
+def _stream_response(chunks, delay_ms):
+    """Object shaped like the SDK's streaming chat response; events are spaced delay_ms apart"""
+    def events():
+        for chunk in chunks:
+            time.sleep(delay_ms / 1000)
+            yield types.SimpleNamespace(data=json.dumps({"text": chunk}))
+        yield types.SimpleNamespace(data=json.dumps({"text": "".join(chunks), "finishReason": "COMPLETE"}))
+    return types.SimpleNamespace(data=types.SimpleNamespace(events=events))
+
+
+class StubGenAiClient:
+    """Stand-in for GenerativeAiInferenceClient that answers chat() from recorded completions.
+
+    SQL requests get the recorded SQL of the question (or of the closest recorded question);
+    narrative requests get a canned markdown answer of about response_words words.
+    """
+
+    def __init__(self, completions, sql_latency="fixed:0", response_latency="fixed:0",
+                 response_words=120, stream_chunk_words=8, seed=0):
+        self.completions = completions
+        self.sql_latency = Latency(sql_latency, seed)
+        self.response_latency = Latency(response_latency, seed + 1)
+        self.response_words = response_words
+        self.stream_chunk_words = stream_chunk_words
+        self._lock = threading.Lock()
+        self.calls = {"sql": 0, "response": 0, "stream": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.calls[key] += 1
+
+    def recorded_sql(self, question):
+        """SQL recorded for question, else for the recorded question sharing the most words with it"""
+        sql = self.completions.get(question)
+        if sql is not None:
+            return sql
+        words = set(re.findall(r"\w+", question.lower()))
+        closest = max(self.completions, key=lambda recorded: len(words & set(re.findall(r"\w+", recorded.lower()))))
+        return self.completions[closest]
+
+    def narrative(self, question):
+        sentence = f"The data answers the question '{question}' with the figures shown in the table below."
+        words = []
+        while len(words) < self.response_words:
+            words.extend(sentence.split())
+        body = " ".join(words[:self.response_words])
+        return (
+            f"## Summary\n\n{body}\n\n"
+            "<<<VISUALIZATION>>>\n"
+            '{"chartType": "bar", "title": "Summary", "xAxis": "", "yAxis": ""}'
+        )
+
+    def chat(self, chat_details):
+        request = chat_details.chat_request
+        question = re.search(r"User Question: (.*)", request.message).group(1).strip()
+        if "Oracle SQL:" in request.message:
+            self._count("sql")
+            self.sql_latency.wait()
+            sql = self.recorded_sql(question)
+            return _chat_response(sql, len(sql) // 4)
+        text = self.narrative(question)
+        if request.is_stream:
+            self._count("stream")
+            words = text.split(" ")
+            size = self.stream_chunk_words
+            chunks = [" ".join(words[start:start + size]) + " " for start in range(0, len(words), size)]
+            # The first delta carries the time to first token; the rest spread over the remainder
+            total_ms = self.response_latency.sample_ms()
+            time.sleep(total_ms / 2000)
+            return _stream_response(chunks, total_ms / 2 / max(len(chunks), 1))
+        self._count("response")
+        self.response_latency.wait()
+        return _chat_response(text, len(text) // 4)
+
+
+def select_columns(sql):
+    """Output column names of a SELECT: aliases, bare column names, or the table's columns for *"""
+    outer = _last_select(tokenize(sql))
+    columns = []
+    expression = []
+    depth = 0
+    for kind, text in outer[1:] + [("word", "FROM")]:
+        if depth == 0 and (text == "," or (kind == "word" and text.upper() == "FROM")):
+            names = [token for token in expression if token[0] in ("word", "quoted", "op")]
+            if names and names[-1][1] == "*":
+                table = "TENDER_DATA" if "TENDER_DATA" in sql.upper() else "PO_DATA"
+                columns.extend(sorted(SCHEMA_CATALOG[table]))
+            elif names:
+                columns.append(names[-1][1].strip('"').upper())
+            if text != ",":
+                break
+            expression = []
+            continue
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and not (kind == "word" and text.upper() in ("DISTINCT", "AS")):
+            expression.append((kind, text))
+    return [column for column in columns if column] or ["VALUE"]
+
+
+def synthetic_value(column, index, rng):
+    """A plausible value for a PO_DATA / TENDER_DATA column"""
+    if column in STATUSES:
+        return STATUSES[column][index % len(STATUSES[column])]
+    if "SUPPLIER" in column:
+        return SUPPLIERS[index % len(SUPPLIERS)]
+    if "ITEMNAME" in column or column == "DRUG":
+        return ITEMS[index % len(ITEMS)]
+    if "DATE" in column or column.endswith("_DAY"):
+        return (datetime.date(2024, 1, 1) + datetime.timedelta(days=index % 700)).isoformat()
+    if column in ("PONO", "ITEMCODE", "TENDERCODE", "TENDERID"):
+        return f"{column[:2]}{100000 + index}"
+    if column.startswith("IS") or column in ("TIMLY_SUPPLIED", "NIBREQ"):
+        return "YN"[index % 2]
+    return round(rng.uniform(0, 10000), 2)
+
+
+class StubSqlServer:
+    """Local HTTP server emulating SQL_ENDPOINT with synthetic result sets.
+
+    Unbounded queries return table_rows rows; FETCH/OFFSET, COUNT(*) probes and single-row
+    aggregates are honoured, so row limiting and paging behave as against the real endpoint.
+    """
+
+    def __init__(self, table_rows=200, latency="fixed:0", ms_per_1000_rows=0.0, seed=0):
+        self.table_rows = table_rows
+        self.latency = Latency(latency, seed)
+        self.ms_per_1000_rows = ms_per_1000_rows
+        self.seed = seed
+        self.requests = 0
+        self._server = None
+
+    def result(self, sql):
+        self.requests += 1
+        if re.match(r"\s*SELECT COUNT\(\*\) AS TOTAL_ROWS FROM \(", sql):
+            return {"rows": [{"TOTAL_ROWS": self.table_rows}]}
+        columns = select_columns(sql)
+        offset = int((re.search(r"OFFSET (\d+) ROWS", sql) or [0, 0])[1])
+        fetch = re.search(r"FETCH (?:NEXT|FIRST) (\d+) ROWS", sql)
+        total = 1 if row_bound(sql) == "aggregate" else self.table_rows
+        count = max(0, min(total - offset, int(fetch[1]) if fetch else total))
+        rng = random.Random(f"{self.seed}:{sql}")
+        rows = [
+            {column: synthetic_value(column, offset + index, rng) for column in columns}
+            for index in range(count)
+        ]
+        return {"columns": columns, "rows": rows}
+
+    def start(self):
+        """Serve on a free local port; returns the endpoint URL"""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                result = stub.result(payload.get("sql", ""))
+                stub.latency.wait()
+                time.sleep(len(result["rows"]) * stub.ms_per_1000_rows / 1_000_000)
+                body = json.dumps(result).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="stub-sql-server", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}/runsql"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,309 @@
+# Caching helpers: query normalization, in-memory LRU/TTL tier, optional on-disk tier
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from result_encoding import estimate_result_bytes
+from structured_log import get_logger
+
+
+# Comparison operators carry meaning ("< 50%" vs "> 50%") and must survive punctuation stripping
+OPERATOR_TOKENS = [
+    ("<=", " op_le "),
+    (">=", " op_ge "),
+    ("!=", " op_ne "),
+    ("<>", " op_ne "),
+    ("<", " op_lt "),
+    (">", " op_gt "),
+    ("=", " op_eq "),
+    ("%", " pct "),
+]
+
+# "tender 161(R)", "tender no. 161 (r)", "tender 161-R", "tender 161R" -> "tender_161_r"
+TENDER_CODE_PATTERN = re.compile(
+    r"\btender\s*(?:no\.?|number|code)?\s*[:#]?\s*(\d+)\s*(\(\s*r\s*\)|-\s*r\b|r\b)?",
+    re.IGNORECASE
+)
+
+
+def _canonical_tender(match):
+    code = match.group(1)
+    if match.group(2):
+        code += "_r"
+    return f" tender_{code} "
+
+
+def normalize_query(text):
+    """Normalize a natural language question into a cache key"""
+    text = (text or "").lower()
+    text = TENDER_CODE_PATTERN.sub(_canonical_tender, text)
+    for operator, token in OPERATOR_TOKENS:
+        text = text.replace(operator, token)
+    # Only case, punctuation, whitespace and the tender-code format are folded: word order and
+    # words like "from"/"to" decide meaning ("from Cipla to Mankind", "bids > 5 and items < 10")
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with per-entry TTL, optional byte budget and counters"""
+
+    def __init__(self, max_entries=512, ttl_seconds=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=0):
+        """Store a value; size (bytes) counts against max_bytes when a budget is set"""
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        stats = {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+        if self.max_bytes is not None:
+            stats["bytes"] = self._bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+class DiskCache:
+    """SQLite-backed key/value tier with TTL that survives container recycling"""
+
+    def __init__(self, path, ttl_seconds=None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl_seconds and created_at + self.ttl_seconds <= time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class QueryCache:
+    """Two-tier NL question -> SQL cache (memory first, optional disk behind it)"""
+
+    def __init__(self, max_entries=512, ttl_seconds=None, disk_path=None):
+        self.memory = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.disk = None
+        if disk_path:
+            try:
+                self.disk = DiskCache(disk_path, ttl_seconds=ttl_seconds)
+            except Exception as e:
+                get_logger().warning("sql_cache_disk_open_failed", path=disk_path, error=str(e))
+
+    def get(self, user_query):
+        key = normalize_query(user_query)
+        sql = self.memory.get(key)
+        if sql is not None:
+            return sql
+        if self.disk is not None:
+            try:
+                sql = self.disk.get(key)
+            except Exception as e:
+                get_logger().warning("sql_cache_disk_read_failed", error=str(e))
+                sql = None
+            if sql is not None:
+                # Promote warm disk hits into memory
+                self.memory.set(key, sql)
+                return sql
+        return None
+
+    def set(self, user_query, sql):
+        key = normalize_query(user_query)
+        self.memory.set(key, sql)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, sql)
+            except Exception as e:
+                get_logger().warning("sql_cache_disk_write_failed", error=str(e))
+
+    def stats(self):
+        memory = self.memory.stats()
+        stats = {
+            "hits": memory["hits"] + (self.disk.hits if self.disk else 0),
+            "misses": self.disk.misses if self.disk else memory["misses"],
+            "evictions": memory["evictions"],
+            "entries": memory["entries"],
+            "memory": memory,
+        }
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+def normalize_sql(sql):
+    """Normalize SQL text for cache keys: case and whitespace outside string literals and quoted identifiers"""
+    parts = re.split(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")", (sql or "").strip().rstrip(";"))
+    normalized = []
+    for index, part in enumerate(parts):
+        if index % 2:
+            # String literal or quoted identifier ("Total" names a different column than "TOTAL"): keep as written
+            normalized.append(part)
+        else:
+            normalized.append(re.sub(r"\s+", " ", part).upper())
+    return "".join(normalized).strip()
+
+
+class DataVersion:
+    """Data snapshot version token: fixed by configuration or probed at most every interval"""
+
+    def __init__(self, static_version=None, probe=None, probe_interval_seconds=300):
+        self.static_version = static_version
+        self.probe = probe
+        self.probe_interval_seconds = probe_interval_seconds
+        self._version = static_version
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        if self.static_version or self.probe is None:
+            return self.static_version or ""
+        # One caller claims the refresh; the probe (a SQL round trip) runs outside the lock, so other
+        # requests keep the last known version instead of queueing behind it
+        with self._lock:
+            refresh = time.time() - self._checked_at >= self.probe_interval_seconds
+            if refresh:
+                self._checked_at = time.time()
+            version = self._version
+        if refresh:
+            try:
+                version = self.probe()
+            except Exception as e:
+                # Keep serving the last known version if the probe fails
+                get_logger().warning("data_version_probe_failed", error=str(e))
+            else:
+                with self._lock:
+                    self._version = version
+        return version or ""
+
+
+class ResultCache:
+    """SQL result cache keyed by normalized SQL and data version, bounded by entries and bytes"""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl_seconds=None,
+                 data_version=None):
+        self.memory = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds, max_bytes=max_bytes)
+        self.data_version = data_version or DataVersion()
+        self.invalidations = 0
+        self._active_version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        """Drop every cached result when the snapshot version changes"""
+        version = self.data_version.current()
+        with self._lock:
+            if version != self._active_version:
+                if self._active_version is not None:
+                    self.memory.clear()
+                    self.invalidations += 1
+                self._active_version = version
+        return version
+
+    def get(self, sql):
+        version = self._check_version()
+        return self.memory.get((version, normalize_sql(sql)))
+
+    def set(self, sql, result):
+        version = self._check_version()
+        return self.memory.set((version, normalize_sql(sql)), result, size=estimate_result_bytes(result))
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats["invalidations"] = self.invalidations
+        stats["data_version"] = self._active_version
+        return stats
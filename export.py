@@ -0,0 +1,415 @@
+# Full-dataset export: rows are streamed from SQL_ENDPOINT into a CSV/XLSX/Parquet file on a blob store
+
+import contextlib
+import csv
+import datetime
+import io
+import itertools
+import math
+import os
+import re
+import tempfile
+import time
+import uuid
+import zipfile
+from importlib.util import find_spec
+
+from structured_log import get_logger
+
+# pyarrow is optional (Parquet export is then unavailable) and only imported by write_parquet
+HAS_PYARROW = find_spec("pyarrow") is not None
+
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Data rows per worksheet (Excel allows 1,048,576 including the header)
+XLSX_MAX_ROWS = 1048575
+PARQUET_BATCH_ROWS = 10000
+# Characters XML 1.0 does not allow, even escaped
+XML_ILLEGAL_PATTERN = re.compile("[\\x00-\\x08\\x0b\\x0c\\x0e-\\x1f\\ufffe\\uffff]")
+# Same escapes as xml.sax.saxutils.escape, which would pull urllib.request into the cold start
+XML_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+
+def export_formats():
+    """Formats available in this environment"""
+    return [fmt for fmt in CONTENT_TYPES if fmt != "parquet" or HAS_PYARROW]
+
+
+def _with_columns(rows, columns):
+    """(columns, rows): columns default to the first row's keys; the first row is put back"""
+    rows = iter(rows)
+    if columns:
+        return [str(column) for column in columns], rows
+    first = next(rows, None)
+    if first is None:
+        return [], rows
+    if isinstance(first, dict):
+        columns = list(first.keys())
+    elif isinstance(first, (list, tuple)):
+        columns = [f"col{index + 1}" for index in range(len(first))]
+    else:
+        columns = ["value"]
+    return columns, itertools.chain([first], rows)
+
+
+def _cell_values(row, columns):
+    """Values of one row in column order, unrounded (exports keep full precision)"""
+    if isinstance(row, dict):
+        values = [row.get(column) for column in columns]
+    elif isinstance(row, (list, tuple)):
+        values = list(row)
+    else:
+        values = [row]
+    return [None if isinstance(value, float) and (math.isnan(value) or math.isinf(value)) else value for value in values]
+
+
+def write_csv(rows, columns, fileobj):
+    """Write rows as UTF-8 CSV with a header; returns the number of data rows"""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="", write_through=True)
+    try:
+        writer = csv.writer(text)
+        columns, rows = _with_columns(rows, columns)
+        writer.writerow(columns)
+        count = 0
+        for row in rows:
+            writer.writerow(["" if value is None else value for value in _cell_values(row, columns)])
+            count += 1
+        text.flush()
+        return count
+    finally:
+        # Leave fileobj open for the caller
+        text.detach()
+
+
+def _column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_cell(reference, value, style=0):
+    style_attribute = f' s="{style}"' if style else ""
+    if value is None or value == "":
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"{style_attribute}><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{reference}"{style_attribute}><v>{value!r}</v></c>'
+    text = XML_ILLEGAL_PATTERN.sub("", str(value))[:32767]
+    return f'<c r="{reference}" t="inlineStr"{style_attribute}><is><t xml:space="preserve">{text.translate(XML_ESCAPES)}</t></is></c>'
+
+
+XLSX_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Results" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Style 1: bold header
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+
+def write_xlsx(rows, columns, fileobj):
+    """Write rows as a single-sheet XLSX; returns the number of data rows.
+
+    The worksheet XML is streamed into the zip entry row by row with inline strings (no shared
+    string table), so memory stays constant regardless of the row count.
+    """
+    columns, rows = _with_columns(rows, columns)
+    letters = [_column_letter(index) for index in range(len(columns))]
+    count = 0
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/></sheetView></sheetViews>'
+                b'<sheetData>'
+            )
+            header = "".join(_xlsx_cell(f"{letter}1", column, style=1) for letter, column in zip(letters, columns))
+            sheet.write(f'<row r="1">{header}</row>'.encode("utf-8"))
+            lines = []
+            for row in rows:
+                if count >= XLSX_MAX_ROWS:
+                    break
+                count += 1
+                number = count + 1
+                cells = "".join(
+                    _xlsx_cell(f"{letter}{number}", value)
+                    for letter, value in zip(letters, _cell_values(row, columns))
+                )
+                lines.append(f'<row r="{number}">{cells}</row>')
+                if len(lines) >= 1000:
+                    sheet.write("".join(lines).encode("utf-8"))
+                    lines = []
+            sheet.write("".join(lines).encode("utf-8"))
+            sheet.write(b"</sheetData></worksheet>")
+    return count
+
+
+def write_parquet(rows, columns, fileobj):
+    """Write rows as Parquet in row groups of PARQUET_BATCH_ROWS; returns the number of data rows"""
+    if not HAS_PYARROW:
+        raise RuntimeError("Parquet export requires pyarrow")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns, rows = _with_columns(rows, columns)
+    writer = None
+    schema = None
+    count = 0
+    try:
+        while True:
+            batch = [_cell_values(row, columns) for row in itertools.islice(rows, PARQUET_BATCH_ROWS)]
+            if not batch:
+                break
+            data = {column: [values[index] if index < len(values) else None for values in batch] for index, column in enumerate(columns)}
+            # The first batch fixes the schema; later batches are converted to it
+            table = pa.table(data) if schema is None else pa.table(data, schema=schema)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(fileobj, schema)
+            writer.write_table(table)
+            count += len(batch)
+        if writer is None:
+            writer = pq.ParquetWriter(fileobj, pa.schema([(column, pa.string()) for column in columns]))
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+WRITERS = {"csv": write_csv, "xlsx": write_xlsx, "parquet": write_parquet}
+
+
+class LocalBlobStore:
+    """Exports written to a local directory (tests, local runs); optionally served under base_url.
+
+    Files older than max_age_seconds are deleted when the next export under the same prefix is written.
+    """
+
+    def __init__(self, directory, base_url=None, max_age_seconds=None):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.max_age_seconds = max_age_seconds
+
+    @contextlib.contextmanager
+    def writer(self, key, content_type=None):
+        """Binary file to write the export into; it appears under key only once complete"""
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(handle, "wb") as fileobj:
+                yield fileobj
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        prefix = key.split("/", 1)[0] if "/" in key else None
+        if prefix:
+            self.prune(prefix)
+
+    def prune(self, prefix):
+        """Delete files under prefix older than max_age_seconds (and emptied directories); returns the file count"""
+        if not self.max_age_seconds:
+            return 0
+        cutoff = time.time() - self.max_age_seconds
+        removed = 0
+        for root, _, files in os.walk(os.path.join(self.directory, prefix), topdown=False):
+            for name in files:
+                path = os.path.join(root, name)
+                with contextlib.suppress(OSError):
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                        removed += 1
+            with contextlib.suppress(OSError):
+                os.rmdir(root)
+        return removed
+
+    def exists(self, key):
+        return os.path.isfile(os.path.join(self.directory, key))
+
+    def reference(self, key):
+        if self.base_url:
+            return {"store": "local", "key": key, "url": f"{self.base_url}/{key}"}
+        return {"store": "local", "key": key, "path": os.path.join(self.directory, key)}
+
+
+class ObjectStorageBlobStore:
+    """Exports uploaded to an OCI Object Storage bucket, downloaded through a pre-authenticated request"""
+
+    def __init__(self, bucket, namespace=None, url_ttl_seconds=86400, client=None):
+        self.bucket = bucket
+        self._namespace = namespace
+        self.url_ttl_seconds = url_ttl_seconds
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = _object_storage_client()
+        return self._client
+
+    @property
+    def namespace(self):
+        if self._namespace is None:
+            self._namespace = self.client.get_namespace().data
+        return self._namespace
+
+    @contextlib.contextmanager
+    def writer(self, key, content_type=None):
+        """Spool the export to local disk, then upload it in one request"""
+        with tempfile.TemporaryFile() as fileobj:
+            yield fileobj
+            fileobj.seek(0)
+            self.client.put_object(self.namespace, self.bucket, key, fileobj, content_type=content_type)
+
+    def exists(self, key):
+        import oci
+
+        try:
+            self.client.head_object(self.namespace, self.bucket, key)
+            return True
+        except oci.exceptions.ServiceError as e:
+            if e.status == 404:
+                return False
+            raise
+
+    def reference(self, key):
+        from oci.object_storage.models import CreatePreauthenticatedRequestDetails
+
+        expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=self.url_ttl_seconds)
+        details = CreatePreauthenticatedRequestDetails(
+            name=f"export-{key.rsplit('/', 1)[-1]}",
+            object_name=key,
+            access_type="ObjectRead",
+            time_expires=expires,
+        )
+        request = self.client.create_preauthenticated_request(self.namespace, self.bucket, details).data
+        return {
+            "store": "object_storage",
+            "key": key,
+            "url": f"{self.client.base_client.endpoint}{request.access_uri}",
+            "expires": expires.isoformat(),
+        }
+
+
+def _object_storage_client():
+    """Object Storage client with resource principal auth, falling back to the config file"""
+    import oci
+
+    try:
+        signer = oci.auth.signers.get_resource_principals_signer()
+        return oci.object_storage.ObjectStorageClient(config={}, signer=signer)
+    except Exception as e:
+        get_logger().warning("object_storage_resource_principal_failed", error=str(e))
+        return oci.object_storage.ObjectStorageClient(oci.config.from_file())
+
+
+class Exporter:
+    """Streams every row of a result into a file on the blob store.
+
+    A complete result already in memory is written as is (export_rows); otherwise the SQL runs again
+    without a row limit (export). stream_rows(sql, max_rows, metrics) must yield rows without buffering them.
+    """
+
+    def __init__(self, store, stream_rows, max_rows=XLSX_MAX_ROWS, prefix="exports"):
+        self.store = store
+        self.stream_rows = stream_rows
+        self.max_rows = max_rows
+        self.prefix = prefix
+        self._key_pattern = re.compile(
+            rf"{re.escape(prefix)}/\d{{8}}/[0-9a-f]{{32}}\.(?:{'|'.join(CONTENT_TYPES)})"
+        )
+
+    def new_key(self, fmt):
+        """Blob key for a new export; also the export_id clients poll with"""
+        return f"{self.prefix}/{time.strftime('%Y%m%d')}/{uuid.uuid4().hex}.{fmt}"
+
+    def is_key(self, key):
+        """Whether key is one new_key could have issued (nothing else is looked up in the store)"""
+        return isinstance(key, str) and self._key_pattern.fullmatch(key) is not None
+
+    def _max_rows(self, fmt):
+        return min(self.max_rows, XLSX_MAX_ROWS) if fmt == "xlsx" else self.max_rows
+
+    def export(self, sql, fmt="xlsx", key=None):
+        """Write the full result of sql; returns the download reference with row/byte counts"""
+        metrics = {}
+        rows = self.stream_rows(sql, self._max_rows(fmt), metrics)
+        try:
+            return self._write(rows, fmt, key, metrics)
+        finally:
+            rows.close()
+
+    def export_rows(self, rows, fmt="xlsx", columns=None, key=None):
+        """Write rows already fetched (the complete result); returns the download reference"""
+        max_rows = self._max_rows(fmt)
+        metrics = {"columns": columns, "row_limit_reached": len(rows) > max_rows}
+        return self._write(iter(rows[:max_rows]), fmt, key, metrics)
+
+    def _write(self, rows, fmt, key, metrics):
+        started = time.perf_counter()
+        key = key or self.new_key(fmt)
+        with self.store.writer(key, content_type=CONTENT_TYPES[fmt]) as fileobj:
+            # Streamed columns arrive with the first row
+            first = next(rows, None)
+            columns = metrics.get("columns")
+            row_count = WRITERS[fmt](itertools.chain([first], rows) if first is not None else iter(()), columns, fileobj)
+            size = fileobj.tell()
+        reference = self.store.reference(key)
+        reference.update({
+            "format": fmt,
+            "content_type": CONTENT_TYPES[fmt],
+            "rows": row_count,
+            "bytes": size,
+            "truncated": bool(metrics.get("row_limit_reached")),
+            "export_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+        return reference
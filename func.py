@@ -2,178 +2,1058 @@ import json
 import io
 import os
 import re
-import urllib3
-from fdk import response
-
-# OCI SDK imports
-import oci
-from oci.generative_ai_inference import GenerativeAiInferenceClient
-from oci.generative_ai_inference.models import (
-    ChatDetails,
-    OnDemandServingMode,
-    CohereChatRequest
-)
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-# Import exact system prompts from prompts.py
-from prompts import SQL_GENERATION_PROMPT, RESPONSE_GENERATION_PROMPT
+# The OCI SDK, fdk response module and urllib3 (sql_pool) are imported on first use to keep
+# them out of the cold start; EAGER_WARMUP=true loads them during the init phase instead
 
-# Initialize HTTP client
-http = urllib3.PoolManager()
+# Import exact system prompts from prompts.py
+from prompts import (
+    SQL_GENERATION_PROMPT,
+    RESPONSE_MARKDOWN_PROMPT
+)
+from genai_client import GenerativeAiClientManager
+from cache import DataVersion, LRUCache, QueryCache, ResultCache
+from sql_templates import SqlSourceStats, match_template
+from prompt_router import ROUTE_SECTIONS, build_sql_prompt, route_sql_prompt
+from tokens import TokenBudget, fit_rows_to_budget, load_token_counter
+from result_encoding import describe_encoding, encode_row, encode_sql_result, extract_rows, replace_rows, result_columns
+from summarizer import summarize_sql_result_samples
+from visualization import default_visualization, recommend_visualization
+from narrative_templates import classify_result, render_narrative
+from sql_validator import SqlValidatorStats, validate_sql
+from sql_errors import classify_sql_error, error_message
+from sql_transport import SqlTransport
+from sql_rewrite import SqlRewriteStats, count_sql, limit_sql, page_sql, probe_count, row_bound
+from result_store import InvalidCursor, ResultStore
+from export import Exporter, LocalBlobStore, ObjectStorageBlobStore, export_formats
+from structured_log import AsyncLogWriter, StructuredLogger, SyncLogWriter, set_logger, summarize_result
+from local_engine import LocalEngine, fingerprint_sql
+from rollups import RollupStore
+import timing
 
 # Configuration from environment variables
 SQL_ENDPOINT = os.environ.get('SQL_ENDPOINT', 'http://80.225.197.97:8000/runsql')
+
+# Structured JSON logs: fields are capped at LOG_FIELD_MAX_BYTES and SQL results are logged as
+# row counts; full results and LLM output are only logged for a LOG_PAYLOAD_SAMPLE_RATE fraction
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'info').lower()
+LOG_FIELD_MAX_BYTES = int(os.environ.get('LOG_FIELD_MAX_BYTES', '2048'))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', '0.01'))
+LOG_PAYLOAD_MAX_BYTES = int(os.environ.get('LOG_PAYLOAD_MAX_BYTES', '16384'))
+LOG_SAMPLE_ROWS = int(os.environ.get('LOG_SAMPLE_ROWS', '3'))
+LOG_ASYNC = os.environ.get('LOG_ASYNC', 'true').lower() == 'true'
+LOG_QUEUE_LINES = int(os.environ.get('LOG_QUEUE_LINES', '10000'))
+
+log = StructuredLogger(
+    AsyncLogWriter(max_lines=LOG_QUEUE_LINES) if LOG_ASYNC else SyncLogWriter(),
+    level=LOG_LEVEL,
+    field_max_bytes=LOG_FIELD_MAX_BYTES,
+    payload_sample_rate=LOG_PAYLOAD_SAMPLE_RATE,
+    payload_max_bytes=LOG_PAYLOAD_MAX_BYTES
+)
+# Caches, clients and engines below log through the same logger
+set_logger(log)
+
+# Concurrency caps: batch workers, in-flight GenAI calls, in-flight SQL_ENDPOINT calls
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '16'))
+GENAI_MAX_CONCURRENCY = int(os.environ.get('GENAI_MAX_CONCURRENCY', '8'))
+SQL_MAX_CONCURRENCY = int(os.environ.get('SQL_MAX_CONCURRENCY', '8'))
+genai_slots = threading.BoundedSemaphore(GENAI_MAX_CONCURRENCY)
+batch_executor = None
+batch_executor_lock = threading.Lock()
+
+# SQL_ENDPOINT transport: a blocking keep-alive pool of SQL_MAX_CONCURRENCY connections also caps in-flight calls
+SQL_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('SQL_CONNECT_TIMEOUT_SECONDS', '3'))
+SQL_READ_TIMEOUT_SECONDS = float(os.environ.get('SQL_READ_TIMEOUT_SECONDS', '30'))
+SQL_RETRIES = int(os.environ.get('SQL_RETRIES', '2'))
+SQL_RETRY_BACKOFF_SECONDS = float(os.environ.get('SQL_RETRY_BACKOFF_SECONDS', '0.2'))
+SQL_KEEPALIVE = os.environ.get('SQL_KEEPALIVE', 'true').lower() == 'true'
+# How long a call waits for a free pooled connection before it fails with a SQL error
+SQL_POOL_TIMEOUT_SECONDS = float(os.environ.get('SQL_POOL_TIMEOUT_SECONDS', '10'))
+# Responses are parsed row by row as they stream in; reading stops at these caps. Parsed rows take
+# several times their JSON size, so the defaults keep one result well inside the 1024MB function;
+# full datasets beyond them go through the streaming export, which never holds the rows.
+SQL_MAX_RESULT_ROWS = int(os.environ.get('SQL_MAX_RESULT_ROWS', '20000'))
+SQL_MAX_RESULT_BYTES = int(os.environ.get('SQL_MAX_RESULT_BYTES', str(16 * 1024 * 1024)))
+sql_transport = SqlTransport(
+    SQL_ENDPOINT,
+    pool_size=SQL_MAX_CONCURRENCY,
+    connect_timeout=SQL_CONNECT_TIMEOUT_SECONDS,
+    read_timeout=SQL_READ_TIMEOUT_SECONDS,
+    retries=SQL_RETRIES,
+    backoff_factor=SQL_RETRY_BACKOFF_SECONDS,
+    keepalive=SQL_KEEPALIVE,
+    pool_timeout=SQL_POOL_TIMEOUT_SECONDS
+)
 OCI_COMPARTMENT_ID = os.environ.get('OCI_COMPARTMENT_ID', 'ocid1.tenancy.oc1..aaaaaaaaj5e33qgh3bwtsw27myq7sfuwsxdn5wi5c7uthylt6lhcx2go2wtq')
 MODEL_ID = "cohere.command-a-03-2025"  # Using Cohere Command R Plus model
+GENAI_ENDPOINT = os.environ.get('GENAI_ENDPOINT', 'https://inference.generativeai.ap-hyderabad-1.oci.oraclecloud.com')
+
+# One warm OCI Generative AI client shared by every invocation in this container
+genai_manager = GenerativeAiClientManager(GENAI_ENDPOINT)
+
+# NL question -> SQL cache in front of generate_sql (set SQL_CACHE_PATH to persist on disk)
+SQL_CACHE_MAX_ENTRIES = int(os.environ.get('SQL_CACHE_MAX_ENTRIES', '512'))
+SQL_CACHE_TTL_SECONDS = float(os.environ.get('SQL_CACHE_TTL_SECONDS', '86400'))
+SQL_CACHE_PATH = os.environ.get('SQL_CACHE_PATH')
+sql_cache = QueryCache(
+    max_entries=SQL_CACHE_MAX_ENTRIES,
+    ttl_seconds=SQL_CACHE_TTL_SECONDS,
+    disk_path=SQL_CACHE_PATH
+)
+
+# SQL result cache keyed on normalized SQL + data snapshot version.
+# DATA_VERSION pins the version; otherwise DATA_VERSION_SQL is probed periodically.
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '256'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', '3600'))
+DATA_VERSION = os.environ.get('DATA_VERSION')
+DATA_VERSION_SQL = os.environ.get('DATA_VERSION_SQL')
+DATA_VERSION_PROBE_SECONDS = float(os.environ.get('DATA_VERSION_PROBE_SECONDS', '300'))
+
+def probe_data_version():
+    """Run DATA_VERSION_SQL against the endpoint and turn its result into a version token"""
+    probe_result, _ = _execute_sql_remote(DATA_VERSION_SQL)
+    if is_sql_error(probe_result):
+        raise RuntimeError(probe_result["error"])
+    return json.dumps(probe_result, sort_keys=True, default=str)
+
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+    data_version=DataVersion(
+        static_version=DATA_VERSION,
+        probe=probe_data_version if DATA_VERSION_SQL else None,
+        probe_interval_seconds=DATA_VERSION_PROBE_SECONDS
+    )
+)
+
+# Local execution: LOCAL_ENGINE=true keeps an SQLite replica of PO_DATA and TENDER_DATA at LOCAL_ENGINE_PATH,
+# refreshed every LOCAL_ENGINE_REFRESH_SECONDS (a fingerprint probe skips unchanged tables; changes are
+# applied as one atomic diff), and answers the SQL it can translate from it. Untranslatable SQL, local
+# errors and queries over LOCAL_ENGINE_TIMEOUT_MS go to SQL_ENDPOINT as before
+LOCAL_ENGINE = os.environ.get('LOCAL_ENGINE', 'false').lower() == 'true'
+LOCAL_ENGINE_PATH = os.environ.get('LOCAL_ENGINE_PATH', '/tmp/local_engine.sqlite3')
+LOCAL_ENGINE_REFRESH_SECONDS = float(os.environ.get('LOCAL_ENGINE_REFRESH_SECONDS', '900'))
+LOCAL_ENGINE_TIMEOUT_MS = int(os.environ.get('LOCAL_ENGINE_TIMEOUT_MS', '2000'))
+LOCAL_ENGINE_MAX_TABLE_ROWS = int(os.environ.get('LOCAL_ENGINE_MAX_TABLE_ROWS', '500000'))
+
+def fetch_table_rows(table):
+    """Every row of a source table, streamed from the endpoint (replica snapshots)"""
+    return sql_transport.iter_rows({"sql": f"SELECT * FROM {table}"}, max_rows=LOCAL_ENGINE_MAX_TABLE_ROWS + 1)
+
+def fingerprint_table(table):
+    """Row count and content checksum of a source table, as a token for the replica"""
+    fingerprint_result, _ = _execute_sql_remote(fingerprint_sql(table))
+    if is_sql_error(fingerprint_result):
+        raise RuntimeError(fingerprint_result["error"])
+    return json.dumps(extract_rows(fingerprint_result), sort_keys=True, default=str)
+
+local_engine = LocalEngine(
+    LOCAL_ENGINE_PATH,
+    fetch_table_rows,
+    fingerprint=fingerprint_table,
+    refresh_seconds=LOCAL_ENGINE_REFRESH_SECONDS,
+    timeout_ms=LOCAL_ENGINE_TIMEOUT_MS,
+    max_table_rows=LOCAL_ENGINE_MAX_TABLE_ROWS
+) if LOCAL_ENGINE else None
+
+# Rollups: ROLLUPS=true keeps the aggregates behind the most common questions (PO value by month and financial
+# year, supplier totals, supply status counts, RC expiry buckets, bid participation by tender) in memory,
+# rebuilt every ROLLUP_REFRESH_SECONDS or as soon as the data version (the replica's, else DATA_VERSION)
+# changes. SQL they cover is answered from them, with their freshness in metadata['rollup']
+ROLLUPS = os.environ.get('ROLLUPS', 'false').lower() == 'true'
+ROLLUP_REFRESH_SECONDS = float(os.environ.get('ROLLUP_REFRESH_SECONDS', '900'))
+ROLLUP_POLL_SECONDS = float(os.environ.get('ROLLUP_POLL_SECONDS', '30'))
+ROLLUP_MAX_ROWS = int(os.environ.get('ROLLUP_MAX_ROWS', '50000'))
+
+def run_rollup_sql(sql_query):
+    """Result of a rollup's GROUP BY query, from the replica when it is enabled"""
+    rollup_result = execute_sql(sql_query, use_cache=False)
+    if is_sql_error(rollup_result):
+        raise RuntimeError(error_message(rollup_result))
+    return rollup_result
+
+def rollup_snapshot():
+    """(version, as_of) of the data the rollups are built from"""
+    if local_engine is not None and local_engine.ready:
+        snapshot = local_engine.snapshot()
+        return snapshot['version'], snapshot['checked_at']
+    return result_cache.data_version.current(), None
+
+rollup_store = RollupStore(
+    run_rollup_sql,
+    snapshot=rollup_snapshot,
+    refresh_seconds=ROLLUP_REFRESH_SECONDS,
+    poll_seconds=ROLLUP_POLL_SECONDS,
+    max_rows=ROLLUP_MAX_ROWS
+) if ROLLUPS else None
+
+# Token accounting for the narrative call. No tokenizer ships with the function: counts use the
+# 4-characters-per-token heuristic unless TOKENIZER_PATH points to the model's tokenizer.json and the
+# `tokenizers` package is installed in the image.
+TOKENIZER_PATH = os.environ.get('TOKENIZER_PATH')
+CONTEXT_WINDOW_TOKENS = int(os.environ.get('CONTEXT_WINDOW_TOKENS', '256000'))
+RESPONSE_MAX_TOKENS = int(os.environ.get('RESPONSE_MAX_TOKENS', '2000'))
+RESULT_TOKEN_BUDGET = int(os.environ.get('RESULT_TOKEN_BUDGET', '185000'))
+# Prompt encoding of SQL results: columnar (JSON columns + rows arrays), csv or tsv
+RESULT_ENCODING = os.environ.get('RESULT_ENCODING', 'columnar')
+token_counter = load_token_counter(TOKENIZER_PATH)
+response_budget = TokenBudget(CONTEXT_WINDOW_TOKENS, RESPONSE_MAX_TOKENS, data_cap=RESULT_TOKEN_BUDGET)
+# Over-budget results are summarized over all rows (stats + stratified sample) instead of truncated
+SUMMARIZE_LARGE_RESULTS = os.environ.get('SUMMARIZE_LARGE_RESULTS', 'true').lower() == 'true'
+SUMMARY_SAMPLE_ROWS = int(os.environ.get('SUMMARY_SAMPLE_ROWS', '50'))
+# Empty, scalar and few-row results are answered from markdown templates without the LLM
+NARRATIVE_TEMPLATES = os.environ.get('NARRATIVE_TEMPLATES', 'true').lower() == 'true'
+NARRATIVE_TEMPLATE_MAX_ROWS = int(os.environ.get('NARRATIVE_TEMPLATE_MAX_ROWS', '5'))
+
+# Templated vs cached vs LLM-generated SQL counters
+sql_source_stats = SqlSourceStats()
+# Local repair/rejection of generated SQL before it reaches SQL_ENDPOINT
+sql_validator_stats = SqlValidatorStats()
+
+# Failed SQL is regenerated with the database error as feedback, within a per-request wall-clock budget
+SQL_REPAIR_MAX_ATTEMPTS = int(os.environ.get('SQL_REPAIR_MAX_ATTEMPTS', '2'))
+REQUEST_LATENCY_BUDGET_SECONDS = float(os.environ.get('REQUEST_LATENCY_BUDGET_SECONDS', '60'))
+# Lower bound for the cost of one repair attempt (LLM generation + execution)
+SQL_REPAIR_MIN_ATTEMPT_SECONDS = float(os.environ.get('SQL_REPAIR_MIN_ATTEMPT_SECONDS', '3'))
+
+# Row limit: unbounded SELECTs fetch at most this many rows (per-request "limit" overrides, up to the max);
+# a COUNT(*) probe runs alongside to report the true total. 0 (the default) disables the rewrite, so
+# "data" holds every row as before; a per-request "limit" still applies. Pages are ordered by the query's
+# ORDER BY, else by every select-list column (or ROWID); queries with no stable order are not paged.
+SQL_ROW_LIMIT = int(os.environ.get('SQL_ROW_LIMIT', '0'))
+SQL_MAX_ROW_LIMIT = int(os.environ.get('SQL_MAX_ROW_LIMIT', '10000'))
+SQL_COUNT_PROBE = os.environ.get('SQL_COUNT_PROBE', 'true').lower() == 'true'
+sql_rewrite_stats = SqlRewriteStats()
+count_probe_executor = None
+count_probe_executor_lock = threading.Lock()
+
+# Result cursors: "data" carries the first RESULT_PAGE_ROWS rows plus a result_id; later pages are
+# fetched with {"result_id", "page"} from the local store, or by re-running the SQL for that page.
+# RESULT_PAGE_ROWS=0 (the default) returns every row in "data", as before.
+RESULT_PAGE_ROWS = int(os.environ.get('RESULT_PAGE_ROWS', '0'))
+RESULT_STORE_MAX_ENTRIES = int(os.environ.get('RESULT_STORE_MAX_ENTRIES', '128'))
+RESULT_STORE_MAX_BYTES = int(os.environ.get('RESULT_STORE_MAX_BYTES', str(256 * 1024 * 1024)))
+RESULT_STORE_TTL_SECONDS = float(os.environ.get('RESULT_STORE_TTL_SECONDS', '900'))
+# Shared across instances so any instance can re-run another's cursor
+RESULT_CURSOR_SECRET = os.environ.get('RESULT_CURSOR_SECRET')
+result_store = ResultStore(
+    max_entries=RESULT_STORE_MAX_ENTRIES,
+    max_bytes=RESULT_STORE_MAX_BYTES,
+    ttl_seconds=RESULT_STORE_TTL_SECONDS,
+    secret=RESULT_CURSOR_SECRET
+)
+
+# Full-dataset export: when the narrative covers only part of the rows (statistical summary or top/bottom
+# rows, the prompts that point to a downloadable file), the complete result is written to an EXPORT_FORMAT
+# file (xlsx, csv, parquet; none disables) while the narrative is generated. A complete result is written
+# from the rows already fetched; the SQL runs again only when the database has more. Requests may pass
+# "export": "<format>" to force one, or false to skip it. The response does not wait for the file: it
+# carries the reference once ready, else an export_id to poll with {"export_id": ...}.
+# Exports need a store clients can download from: object_storage (EXPORT_BUCKET), or local files served
+# under EXPORT_BASE_URL and deleted after EXPORT_URL_TTL_SECONDS. Without one they are off.
+EXPORT_FORMAT = os.environ.get('EXPORT_FORMAT', 'xlsx').lower()
+EXPORT_LOCAL_DIR = os.environ.get('EXPORT_LOCAL_DIR', '/tmp')
+EXPORT_BASE_URL = os.environ.get('EXPORT_BASE_URL')
+EXPORT_BUCKET = os.environ.get('EXPORT_BUCKET')
+EXPORT_NAMESPACE = os.environ.get('EXPORT_NAMESPACE')
+EXPORT_STORE = os.environ.get(
+    'EXPORT_STORE', 'object_storage' if EXPORT_BUCKET else 'local' if EXPORT_BASE_URL else 'none'
+).lower()
+EXPORT_URL_TTL_SECONDS = int(os.environ.get('EXPORT_URL_TTL_SECONDS', '86400'))
+EXPORT_MAX_ROWS = int(os.environ.get('EXPORT_MAX_ROWS', '1048575'))
+# Exports stream long results over their own pool of EXPORT_MAX_CONCURRENCY connections, so they never
+# hold the connections interactive queries need; further exports queue on the executor
+EXPORT_MAX_CONCURRENCY = int(os.environ.get('EXPORT_MAX_CONCURRENCY', '2'))
+export_executor = None
+export_executor_lock = threading.Lock()
+# Running and finished exports of this instance by export_id
+export_jobs = LRUCache(max_entries=256, ttl_seconds=EXPORT_URL_TTL_SECONDS)
+
+export_transport = SqlTransport(
+    SQL_ENDPOINT,
+    pool_size=EXPORT_MAX_CONCURRENCY,
+    connect_timeout=SQL_CONNECT_TIMEOUT_SECONDS,
+    read_timeout=SQL_READ_TIMEOUT_SECONDS,
+    retries=SQL_RETRIES,
+    backoff_factor=SQL_RETRY_BACKOFF_SECONDS,
+    keepalive=SQL_KEEPALIVE,
+    pool_timeout=SQL_POOL_TIMEOUT_SECONDS
+)
+
+def stream_sql_rows(sql_query, max_rows, metrics):
+    """Rows of the SQL result as they arrive from the endpoint (used by the exporter)"""
+    return export_transport.iter_rows({"sql": sql_query}, max_rows=max_rows, metrics=metrics)
+
+if EXPORT_STORE == 'object_storage':
+    export_store = ObjectStorageBlobStore(EXPORT_BUCKET, namespace=EXPORT_NAMESPACE, url_ttl_seconds=EXPORT_URL_TTL_SECONDS)
+elif EXPORT_STORE == 'local':
+    export_store = LocalBlobStore(EXPORT_LOCAL_DIR, base_url=EXPORT_BASE_URL, max_age_seconds=EXPORT_URL_TTL_SECONDS)
+else:
+    export_store = None
+exporter = Exporter(export_store, stream_sql_rows, max_rows=EXPORT_MAX_ROWS) if export_store is not None else None
 
-# Initialize OCI Generative AI client
 def get_generative_ai_client():
-    """Initialize OCI Generative AI client with resource principal authentication"""
-    try:
-        # Use resource principal for OCI Functions
-        signer = oci.auth.signers.get_resource_principals_signer()
-        return GenerativeAiInferenceClient(
-            config={},
-            signer=signer,
-            service_endpoint="https://inference.generativeai.ap-hyderabad-1.oci.oraclecloud.com"
-        )
-    except Exception as e:
-        print(f"Error initializing OCI client with resource principal: {str(e)}")
-        # Fallback to config file authentication for local testing
-        config = oci.config.from_file()
-        return GenerativeAiInferenceClient(
-            config=config,
-            service_endpoint="https://inference.generativeai.ap-hyderabad-1.oci.oraclecloud.com"
+    """Return the shared OCI Generative AI client (resource principal, config file fallback)"""
+    return genai_manager.get_client()
+
+def chat_details(message, preamble, max_tokens, temperature, top_p, is_stream=False):
+    """ChatDetails for a Cohere chat call with MODEL_ID"""
+    from oci.generative_ai_inference.models import ChatDetails, CohereChatRequest, OnDemandServingMode
+    
+    return ChatDetails(
+        compartment_id=OCI_COMPARTMENT_ID,
+        serving_mode=OnDemandServingMode(model_id=MODEL_ID),
+        chat_request=CohereChatRequest(
+            message=message,
+            preamble_override=preamble,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            is_stream=is_stream
         )
+    )
+
+def genai_chat(chat_request):
+    """Call the GenAI service, holding one of the GENAI_MAX_CONCURRENCY slots"""
+    with genai_slots:
+        return genai_manager.chat(chat_request)
+
+def record_token_usage(stage, chat_response, prompt_tokens, output_text):
+    """Count prompt/completion tokens of a chat call; completion uses the model's usage when reported"""
+    usage = getattr(getattr(chat_response.data, 'chat_response', None), 'usage', None)
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    if completion_tokens is None:
+        completion_tokens = count_tokens(output_text or "")
+    timing.count(f'{stage}_prompt_tokens', prompt_tokens)
+    timing.count(f'{stage}_completion_tokens', completion_tokens)
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Allow-Methods": "*",
+    "Timing-Allow-Origin": "*"
+}
+
+# Stage timings: every response carries a Server-Timing header and the request logs one JSON
+# timing line; the _timings block is added when enabled here or requested with "timings": true
+TIMINGS_IN_RESPONSE = os.environ.get('TIMINGS_IN_RESPONSE', 'false').lower() == 'true'
+TIMING_LOGS = os.environ.get('TIMING_LOGS', 'true').lower() == 'true'
+
+def request_id(ctx):
+    """The platform's request id (fn-call-id) for log correlation, if the context has one"""
+    for name in ('RequestID', 'CallID'):
+        getter = getattr(ctx, name, None)
+        if callable(getter):
+            try:
+                return getter()
+            except Exception:
+                pass
+    return getattr(ctx, 'request_id', None)
 
 def handler(ctx, data: io.BytesIO = None):
     """OCI Functions handler - main entry point"""
+    timer = timing.start("request")
+    log.bind(request_id=request_id(ctx))
     try:
         # Parse incoming request
         try:
-            body = json.loads(data.getvalue().decode('utf-8'))
+            with timing.span("parse_request"):
+                body = json.loads(data.getvalue().decode('utf-8'))
         except Exception as e:
-            return response.Response(
+            log.warning("invalid_request_json", error=str(e), error_type=type(e).__name__)
+            return timed_response(
                 ctx,
                 response_data=json.dumps({'error': 'Invalid JSON in request body'}),
                 headers={"Content-Type": "application/json"}
             )
         
+        try:
+            limit, offset = parse_row_limit(body)
+            export_format = parse_export_format(body)
+        except ValueError as e:
+            return timed_response(
+                ctx,
+                response_data=json.dumps({'error': str(e)}),
+                headers={"Content-Type": "application/json"}
+            )
+        
+        include_timings = TIMINGS_IN_RESPONSE or body.get('timings') is True
+        
+        # Batch mode: {"queries": [...]} runs every pipeline concurrently
+        if 'queries' in body:
+            timer.name = "batch"
+            queries = body.get('queries')
+            if not isinstance(queries, list) or not queries:
+                return timed_response(
+                    ctx,
+                    response_data=json.dumps({'error': 'Field queries must be a non-empty list'}),
+                    headers={"Content-Type": "application/json"}
+                )
+            
+            with timing.span("batch"):
+                results = run_batch(queries, limit, offset, export_format, include_timings)
+            batch_result = {'results': results}
+            if include_timings:
+                batch_result['_timings'] = timer.summary()
+            with timing.span("serialize"):
+                response_data = json.dumps(batch_result, default=str)
+            return timed_response(
+                ctx,
+                response_data=response_data,
+                headers={"Content-Type": "application/json", **CORS_HEADERS}
+            )
+        
+        # Page request: {"result_id": ..., "page": n} for a result returned earlier
+        if 'result_id' in body:
+            timer.name = "page"
+            page = body.get('page', 1)
+            if isinstance(page, bool) or not isinstance(page, int) or page < 1:
+                return timed_response(
+                    ctx,
+                    response_data=json.dumps({'error': 'Field page must be a positive integer'}),
+                    headers={"Content-Type": "application/json"}
+                )
+            try:
+                with timing.span("fetch_page"):
+                    result = fetch_result_page(body.get('result_id'), page)
+            except InvalidCursor as e:
+                return timed_response(
+                    ctx,
+                    response_data=json.dumps({'error': 'Invalid result_id', 'details': str(e)}),
+                    headers={"Content-Type": "application/json"}
+                )
+            with timing.span("serialize"):
+                response_data = json.dumps(result, default=str)
+            return timed_response(
+                ctx,
+                response_data=response_data,
+                headers={"Content-Type": "application/json", **CORS_HEADERS}
+            )
+        
+        # Export poll: {"export_id": ...} from a response whose export was still pending
+        if 'export_id' in body:
+            timer.name = "export_status"
+            export_id = body.get('export_id')
+            if exporter is None or not exporter.is_key(export_id):
+                return timed_response(
+                    ctx,
+                    response_data=json.dumps({'error': 'Invalid export_id'}),
+                    headers={"Content-Type": "application/json"}
+                )
+            with timing.span("export_status"):
+                result = export_status(export_id)
+            return timed_response(
+                ctx,
+                response_data=json.dumps(result, default=str),
+                headers={"Content-Type": "application/json", **CORS_HEADERS}
+            )
+        
         user_query = body.get('query', '').strip()
         
         if not user_query:
-            return response.Response(
+            return timed_response(
                 ctx,
                 response_data=json.dumps({'error': 'Missing required field: query'}),
                 headers={"Content-Type": "application/json"}
             )
         
-        print(f"User query: {user_query}")
-        
-        # Step 1: Generate SQL from natural language query
-        sql_query = generate_sql(user_query)
-        print(f"Generated SQL: {sql_query}")
-        
-        # Step 2: Execute the generated SQL query
-        sql_result = execute_sql(sql_query)
-        print(f"SQL Execution Result: {sql_result}")
-        
-        # Step 3: Generate natural language response from data
-        llm_result = generate_response(user_query, sql_query, sql_result)
-        print(f"LLM Result: {llm_result}")
-        
-        # Extract response and visualization from LLM result
-        if isinstance(llm_result, dict):
-            response_text = llm_result.get("response", "")
-            visualization = llm_result.get("visualization", {
-                "chartType": None,
-                "title": "Auto-generated Chart",
-                "xAxis": None,
-                "yAxis": None,
-                "mode": None
-            })
-            
-            # Handle case where response_text might be a JSON string (double-encoded)
-            if isinstance(response_text, str) and response_text.strip().startswith('{'):
-                try:
-                    inner_parsed = json.loads(response_text)
-                    if isinstance(inner_parsed, dict):
-                        if "response" in inner_parsed:
-                            response_text = inner_parsed.get("response", response_text)
-                        if "visualization" in inner_parsed and (visualization.get("chartType") is None and visualization.get("xAxis") is None):
-                            inner_viz = inner_parsed.get("visualization")
-                            if isinstance(inner_viz, dict):
-                                visualization = inner_viz
-                except (json.JSONDecodeError, ValueError, TypeError):
-                    pass
-        else:
-            response_text = str(llm_result)
-            visualization = {
-                "chartType": None,
-                "title": "Auto-generated Chart",
-                "xAxis": None,
-                "yAxis": None,
-                "mode": None
-            }
+        # Streaming mode: SQL, data and visualization first, then narrative deltas
+        if body.get('stream') is True:
+            timer.name = "stream"
+            sql_query, sql_result, metadata = prepare_query(user_query, limit, offset)
+            lines = []
+            for event in stream_query_events(user_query, sql_query, sql_result, metadata, export_format):
+                if event["event"] == "done" and include_timings:
+                    lines.append(json.dumps({"event": "timings", "_timings": timer.summary()}) + "\n")
+                with timing.span("serialize"):
+                    lines.append(json.dumps(event, default=str) + "\n")
+            return timed_response(
+                ctx,
+                response_data="".join(lines),
+                headers={"Content-Type": "application/x-ndjson", **CORS_HEADERS}
+            )
         
         # Return the final result
-        result = {
-            'query': user_query,
-            'sql': sql_query,
-            'data': sql_result,
-            'response': response_text,
-            'visualization': visualization
-        }
+        timer.name = "query"
+        result = answer_query(user_query, limit, offset, export_format)
+        if include_timings:
+            result['_timings'] = timer.summary()
         
-        return response.Response(
+        with timing.span("serialize"):
+            response_data = json.dumps(result, default=str)
+        return timed_response(
             ctx,
-            response_data=json.dumps(result, default=str),
-            headers={
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "*",
-                "Access-Control-Allow-Methods": "*"
-            }
+            response_data=response_data,
+            headers={"Content-Type": "application/json", **CORS_HEADERS}
         )
     
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("request_failed", e)
         
-        return response.Response(
+        return timed_response(
             ctx,
             response_data=json.dumps({'error': 'Internal server error', 'details': str(e)}),
             headers={"Content-Type": "application/json"}
         )
+    finally:
+        timing.finish(timer)
+        log.bind(request_id=None)
 
-def generate_sql(user_query):
-    """Generate SQL query from natural language using Cohere Command model"""
+def timed_response(ctx, response_data, headers):
+    """fdk Response with the request's Server-Timing header; logs the request's JSON timing line"""
+    from fdk import response
     
-    user_message = f"User Question: {user_query}\n\nReturn ONLY raw Oracle SQL:"
+    timer = timing.current()
+    if timer is not None:
+        timer.count('response_bytes', len(response_data))
+        headers = {**headers, "Server-Timing": timer.server_timing()}
+        if TIMING_LOGS:
+            log.info("timing", **timer.record())
+    return response.Response(
+        ctx,
+        response_data=response_data,
+        headers=headers
+    )
+
+def parse_row_limit(body):
+    """(limit, offset) from the request body; limit is None when not given. Raises ValueError"""
+    limit = body.get('limit')
+    offset = body.get('offset', 0)
+    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+        raise ValueError('Field limit must be a positive integer')
+    if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+        raise ValueError('Field offset must be a non-negative integer')
+    return (min(limit, SQL_MAX_ROW_LIMIT) if limit is not None else None), offset
+
+def parse_export_format(body):
+    """Export format requested in the body: None (default policy), False (no export) or a format"""
+    export_format = body.get('export')
+    if export_format is None or export_format is False:
+        return export_format
+    if exporter is None:
+        raise ValueError('Export is not available: no export store is configured')
+    if export_format is True:
+        export_format = EXPORT_FORMAT if EXPORT_FORMAT in export_formats() else 'xlsx'
+    if export_format not in export_formats():
+        raise ValueError(f"Field export must be one of {', '.join(export_formats())} or false")
+    return export_format
+
+def prepare_query(user_query, limit=None, offset=0):
+    """Steps 1-2: resolve SQL for the question and execute it; returns (sql, result, metadata).
+    
+    Unbounded SELECTs are limited to limit rows starting at offset (None uses SQL_ROW_LIMIT);
+    metadata['paging'] then reports the total row count and whether more rows exist.
+    """
+    log.info("query_received", query=user_query)
+    limit = SQL_ROW_LIMIT if limit is None else limit
+    deadline = time.perf_counter() + REQUEST_LATENCY_BUDGET_SECONDS
+    attempts = []
+    feedback = None
+    
+    for attempt in range(SQL_REPAIR_MAX_ATTEMPTS + 1):
+        attempt_start = time.perf_counter()
+        
+        # Step 1: Generate SQL from natural language query (cache hits skip the LLM);
+        # repair attempts regenerate it with the previous error as feedback
+        if feedback is None:
+            sql_query, sql_source = resolve_sql(user_query)
+        else:
+            try:
+                sql_query = generate_sql(user_query, error_feedback=feedback)
+            except Exception:
+                log.warning("sql_repair_failed", detail="no SQL generated; keeping the previous error")
+                break
+            sql_source = "repair"
+            sql_source_stats.record("repair")
+        log.info("sql_generated", source=sql_source, sql=sql_query)
+        generated = time.perf_counter()
+        
+        # Repair known schema pitfalls; un-repairable SQL never costs a database trip
+        with timing.span("validate_sql"):
+            sql_query, repairs, rejection = validate_sql(sql_query)
+        sql_validator_stats.record(repairs, rejection)
+        if repairs:
+            log.info("sql_repaired", repairs=repairs, sql=sql_query)
+        
+        # Step 2: Execute the generated SQL query, row-limited, with the COUNT(*) probe alongside;
+        # aggregates a rollup covers are answered from it when the whole result fits in the limit
+        transport_metrics = {}
+        executed_sql, limited, count_future, rollup = sql_query, False, None, None
+        if not rejection and rollup_store is not None and not offset:
+            with timing.span("rollup"):
+                rollup = rollup_store.answer(sql_query, max_rows=limit)
+        if rejection:
+            log.warning("sql_rejected", reason=rejection)
+            sql_result = {"error": f"SQL rejected before execution: {rejection}"}
+        elif rollup is not None:
+            sql_result, freshness = rollup
+            transport_metrics['backend'] = 'rollup'
+        else:
+            if limit:
+                with timing.span("rewrite_sql"):
+                    executed_sql, limited = limit_sql(sql_query, limit, offset)
+                sql_rewrite_stats.record("limited" if limited else "bounded" if row_bound(sql_query) else "unordered")
+            if limited and SQL_COUNT_PROBE:
+                count_future = get_count_probe_executor().submit(execute_sql, count_sql(sql_query))
+            with timing.span("execute_sql"):
+                sql_result = execute_sql(executed_sql, metrics=transport_metrics)
+            timing.count('sql_bytes', transport_metrics.get('bytes'))
+            timing.count('sql_decoded_bytes', transport_metrics.get('decoded_bytes'))
+        log.info(
+            "sql_executed",
+            result=summarize_result(sql_result, LOG_SAMPLE_ROWS),
+            bytes=transport_metrics.get('bytes'),
+            backend=transport_metrics.get('backend') or ('cache' if transport_metrics.get('result_cache') else 'remote'),
+            payload={"result": sql_result}
+        )
+        finished = time.perf_counter()
+        
+        attempt_timing = {
+            'attempt': attempt + 1,
+            'source': sql_source,
+            'repairs': repairs,
+            'generate_ms': round((generated - attempt_start) * 1000, 1),
+            'execute_ms': round((finished - generated) * 1000, 1),
+            'total_ms': round((finished - attempt_start) * 1000, 1),
+            'sql_transport': transport_metrics
+        }
+        attempts.append(attempt_timing)
+        if not is_sql_error(sql_result):
+            break
+        if count_future is not None:
+            count_future.cancel()
+        
+        error_code, retryable = classify_sql_error(sql_result)
+        attempt_timing['error_code'] = error_code
+        attempt_timing['retryable'] = retryable
+        if not retryable or attempt == SQL_REPAIR_MAX_ATTEMPTS:
+            break
+        
+        # Abandon the repair when another attempt cannot finish within the request budget
+        expected_seconds = max(SQL_REPAIR_MIN_ATTEMPT_SECONDS, max(a['total_ms'] for a in attempts) / 1000)
+        remaining_seconds = deadline - time.perf_counter()
+        if remaining_seconds < expected_seconds:
+            log.warning(
+                "sql_repair_abandoned",
+                remaining_s=round(remaining_seconds, 1),
+                expected_s=round(expected_seconds, 1)
+            )
+            attempt_timing['abandoned'] = 'latency_budget'
+            break
+        
+        log.info("sql_repair_retry", error_code=error_code)
+        feedback = (sql_query, error_message(sql_result))
+    
+    # Only cache SQL that the database accepted (before the row limit, which is per request)
+    if sql_source in ("llm", "repair") and not is_sql_error(sql_result):
+        sql_cache.set(user_query, sql_query)
+    
+    paging = None
+    if limited and not is_sql_error(sql_result):
+        sql_result, paging = apply_row_limit(sql_result, limit, offset, count_future, deadline)
+    with timing.span("result_store"):
+        paging = open_result_cursor(sql_query, sql_result, paging, offset if limited else 0)
+    timing.count('result_rows', len(extract_rows(sql_result) or []))
+    
+    metadata = {
+        'sql_source': sql_source,
+        'sql_sources': sql_source_stats.stats(),
+        'sql_repairs': repairs,
+        'sql_attempts': attempts,
+        'sql_validator': sql_validator_stats.stats(),
+        'sql_rewrite': sql_rewrite_stats.stats(),
+        'sql_transport': sql_transport.stats(),
+        'sql_cache': sql_cache.stats(),
+        'result_cache': result_cache.stats(),
+        'result_store': result_store.stats(),
+        'logging': log.stats()
+    }
+    if local_engine is not None:
+        metadata['local_engine'] = local_engine.stats()
+    if rollup_store is not None:
+        metadata['rollups'] = rollup_store.stats()
+    if rollup is not None:
+        metadata['rollup'] = freshness
+    if paging is not None:
+        metadata['paging'] = paging
+    if executed_sql != sql_query:
+        metadata['sql_generated'] = sql_query
+    return executed_sql, sql_result, metadata
+
+def apply_row_limit(sql_result, limit, offset, count_future, deadline):
+    """Drop the look-ahead row of a limited result; returns (result, paging).
+    
+    The COUNT(*) probe is only awaited when rows beyond the limit exist; otherwise the total is known.
+    """
+    rows = extract_rows(sql_result) or []
+    has_more = len(rows) > limit
+    total_rows = None
+    if not has_more:
+        total_rows = offset + len(rows)
+        if count_future is not None and count_future.cancel():
+            sql_rewrite_stats.record("count_probes_skipped")
+    else:
+        sql_rewrite_stats.record("has_more")
+        sql_result = replace_rows(sql_result, rows[:limit])
+        if count_future is not None:
+            sql_rewrite_stats.record("count_probes")
+            try:
+                with timing.span("count_probe_wait"):
+                    total_rows = probe_count(count_future.result(timeout=max(0.0, deadline - time.perf_counter())))
+            except Exception as e:
+                log.warning("count_probe_failed", error=str(e))
+        if not isinstance(sql_result, dict):
+            sql_result = {"rows": sql_result}
+        sql_result["_has_more"] = True
+        if total_rows is not None:
+            sql_result["_total_query_rows"] = total_rows
+    paging = {
+        'limit': limit,
+        'offset': offset,
+        'returned_rows': min(len(rows), limit),
+        'total_rows': total_rows,
+        'has_more': has_more
+    }
+    return sql_result, paging
+
+def open_result_cursor(sql_query, sql_result, paging, offset):
+    """Keep results longer than one page in the result store; returns paging with the result_id"""
+    rows = extract_rows(sql_result)
+    if not RESULT_PAGE_ROWS or rows is None:
+        return paging
+    more_in_database = bool(paging and paging['has_more']) or bool(isinstance(sql_result, dict) and sql_result.get('_row_limit_reached'))
+    # A per-request limit below the page size is the page size
+    page_size = min(RESULT_PAGE_ROWS, paging['limit']) if paging and paging.get('limit') else RESULT_PAGE_ROWS
+    if len(rows) <= page_size and not more_in_database:
+        return paging
+    
+    total_rows = paging['total_rows'] if paging else (None if more_in_database else len(rows))
+    template = {key: value for key, value in replace_rows(sql_result, []).items() if not key.startswith('_')} if isinstance(sql_result, dict) else {}
+    result_id = result_store.create(
+        sql_query,
+        rows,
+        complete=not more_in_database,
+        page_size=page_size,
+        offset=offset,
+        total_rows=total_rows,
+        template=template
+    )
+    paging = dict(paging or {'limit': None, 'offset': offset})
+    paging.update({
+        'result_id': result_id,
+        'page': 1,
+        'page_size': page_size,
+        'returned_rows': min(len(rows), page_size),
+        'total_rows': total_rows,
+        'has_more': True
+    })
+    return paging
+
+def first_page(sql_result, paging):
+    """The rows of the result that go into the response "data" field"""
+    if not paging or 'result_id' not in paging:
+        return sql_result
+    return replace_rows(sql_result, extract_rows(sql_result)[:paging['page_size']])
+
+def fetch_result_page(result_id, page):
+    """Rows of page (1-based) of an earlier result: from the result store, else by re-running the SQL"""
+    state, entry = result_store.open(result_id)
+    page_size = state['page_size']
+    start = (page - 1) * page_size
+    
+    if entry is not None and (entry[1] or start + page_size <= len(entry[0])):
+        rows, complete, template = entry
+        page_rows = rows[start:start + page_size]
+        has_more = start + page_size < len(rows) or not complete
+        data = replace_rows(template, page_rows) if template else page_rows
+        source = 'store'
+    else:
+        # Expired, evicted, issued by another instance, or past the rows fetched initially
+        paged_sql = page_sql(state['sql'], page_size, state['offset'] + start)
+        if paged_sql is None:
+            return {
+                'result_id': result_id,
+                'error': 'Could not fetch the page',
+                'details': 'The query has no ORDER BY, so this page cannot be fetched again consistently; run the query again'
+            }
+        result_store.record_rerun()
+        data = execute_sql(paged_sql)
+        if is_sql_error(data):
+            return {'result_id': result_id, 'error': 'Could not fetch the page', 'details': error_message(data)}
+        fetched = extract_rows(data) or []
+        page_rows = fetched[:page_size]
+        has_more = len(fetched) > page_size
+        data = replace_rows(data, page_rows)
+        source = 'sql'
+    
+    return {
+        'result_id': result_id,
+        'data': data,
+        'paging': {
+            'page': page,
+            'page_size': page_size,
+            'returned_rows': len(page_rows),
+            'total_rows': state['total_rows'],
+            'has_more': has_more,
+            'source': source
+        }
+    }
+
+def start_export(sql_query, sql_result, metadata, export_format=None):
+    """Submit the full-dataset export; returns its export_id, or None when there is nothing to export"""
+    if export_format is None:
+        export_format = EXPORT_FORMAT if EXPORT_FORMAT in export_formats() else None
+    if not export_format or exporter is None or is_sql_error(sql_result):
+        return None
+    rows = extract_rows(sql_result)
+    paging = metadata.get('paging') or {}
+    complete = (
+        isinstance(rows, list) and not paging.get('offset')
+        and not (isinstance(sql_result, dict) and (sql_result.get('_has_more') or sql_result.get('_row_limit_reached')))
+    )
+    export_id = exporter.new_key(export_format)
+    if complete:
+        future = get_export_executor().submit(exporter.export_rows, rows, export_format, result_columns(sql_result), export_id)
+    else:
+        # Export the SQL as generated, without the per-request row limit
+        future = get_export_executor().submit(exporter.export, metadata.get('sql_generated', sql_query), export_format, export_id)
+    export_jobs.set(export_id, future)
+    log.info("export_started", export_id=export_id, format=export_format, source='rows' if complete else 'sql')
+    return export_id
+
+def plan_export(sql_query, sql_result, metadata, export_format=None):
+    """Start a requested export now; returns (export_ids, on_partial_prompt).
+    
+    With the default policy (export_format None) the export starts from on_partial_prompt, which the
+    narrative calls when its prompt covers only part of the rows and points to the downloadable file.
+    """
+    export_ids = []
+    
+    def on_partial_prompt():
+        if export_format is None and not export_ids:
+            export_ids.append(start_export(sql_query, sql_result, metadata))
     
+    if export_format:
+        export_ids.append(start_export(sql_query, sql_result, metadata, export_format))
+    return export_ids, on_partial_prompt
+
+def finish_export(export_ids):
+    """Status of the export started for this response (without waiting for it), or None"""
+    export_id = next((export_id for export_id in export_ids if export_id), None)
+    return export_status(export_id) if export_id is not None else None
+
+def export_status(export_id):
+    """ready (with the download reference), pending, failed or not_found; never waits"""
+    future = export_jobs.get(export_id)
+    if future is None:
+        # Started by another instance, or no longer tracked: the store has the file once it is complete
+        if exporter.store.exists(export_id):
+            return {'status': 'ready', 'export_id': export_id, **exporter.store.reference(export_id)}
+        return {'status': 'not_found', 'export_id': export_id}
+    if not future.done():
+        return {'status': 'pending', 'export_id': export_id}
     try:
-        # Initialize Generative AI client
-        gen_ai_client = get_generative_ai_client()
-        
-        # Create chat request for Cohere using EXACT prompt from lambda_K.py
-        chat_request = ChatDetails(
-            compartment_id=OCI_COMPARTMENT_ID,
-            serving_mode=OnDemandServingMode(model_id=MODEL_ID),
-            chat_request=CohereChatRequest(
-                message=user_message,
-                preamble_override=SQL_GENERATION_PROMPT,
-                max_tokens=512,
-                temperature=0.3,
-                top_p=1.0,
-                is_stream=False
+        return {'status': 'ready', 'export_id': export_id, **future.result()}
+    except Exception as e:
+        log.error("export_failed", export_id=export_id, error=str(e))
+        return {'status': 'failed', 'export_id': export_id, 'error': str(e)}
+
+def answer_query(user_query, limit=None, offset=0, export_format=None):
+    """Run the full pipeline for one question and return the response dict"""
+    sql_query, sql_result, metadata = prepare_query(user_query, limit, offset)
+    
+    # The export streams the full result to the blob store while the narrative is generated
+    export_ids, on_partial_prompt = plan_export(sql_query, sql_result, metadata, export_format)
+    
+    # Step 3: Generate natural language response from data
+    llm_result = generate_response(user_query, sql_query, sql_result, on_partial_prompt)
+    log.info(
+        "response_generated",
+        narrative_source=llm_result.get("narrative_source"),
+        response_chars=len(llm_result.get("response") or ""),
+        payload={"response": llm_result}
+    )
+    
+    response_text = llm_result.get("response", "")
+    visualization = llm_result.get("visualization") or default_visualization()
+    metadata['narrative_source'] = llm_result.get("narrative_source")
+    
+    result = {
+        'query': user_query,
+        'sql': sql_query,
+        'data': first_page(sql_result, metadata.get('paging')),
+        'response': response_text,
+        'visualization': visualization,
+        'metadata': metadata
+    }
+    if 'paging' in metadata:
+        result['paging'] = metadata.pop('paging')
+    export = finish_export(export_ids)
+    if export is not None:
+        result['export'] = export
+    return result
+
+def run_batch(queries, limit=None, offset=0, export_format=None, include_timings=False):
+    """Answer many questions concurrently; results (or per-query errors) keep input order.
+    
+    Items may be strings or {"query", "limit", "offset"} objects; limit/offset default to the batch's.
+    """
+    futures = []
+    for item in queries:
+        user_query = item.get('query', '') if isinstance(item, dict) else item
+        user_query = user_query.strip() if isinstance(user_query, str) else ''
+        if not user_query:
+            futures.append((user_query, 'Missing required field: query'))
+            continue
+        item_limit, item_offset = limit, offset
+        if isinstance(item, dict) and ('limit' in item or 'offset' in item):
+            try:
+                item_limit, item_offset = parse_row_limit({'limit': limit, 'offset': offset, **item})
+            except ValueError as e:
+                futures.append((user_query, str(e)))
+                continue
+        futures.append((user_query, get_batch_executor().submit(
+            timed_answer_query, user_query, item_limit, item_offset, export_format, include_timings,
+            log.context()
+        )))
+    
+    results = []
+    for user_query, future in futures:
+        if isinstance(future, str):
+            results.append({'query': user_query, 'error': future})
+            continue
+        try:
+            results.append(future.result())
+        except Exception as e:
+            log.error("batch_query_failed", query=user_query, error=str(e))
+            results.append({'query': user_query, 'error': 'Internal server error', 'details': str(e)})
+    return results
+
+def timed_answer_query(user_query, limit=None, offset=0, export_format=None, include_timings=False,
+                       log_context=None):
+    """answer_query for a batch worker thread, timed as its own request and logged with log_context"""
+    timer = timing.start("batch_query")
+    log.bind(**(log_context or {}))
+    try:
+        result = answer_query(user_query, limit, offset, export_format)
+        if include_timings:
+            result['_timings'] = timer.summary()
+        return result
+    finally:
+        if TIMING_LOGS:
+            log.info("timing", **timer.record())
+        timing.finish(timer)
+        log.bind(**{key: None for key in log_context or {}})
+
+def get_batch_executor():
+    """Shared worker pool for batch requests, created on first use"""
+    global batch_executor
+    with batch_executor_lock:
+        if batch_executor is None:
+            batch_executor = ThreadPoolExecutor(
+                max_workers=BATCH_MAX_WORKERS,
+                thread_name_prefix="batch-query"
+            )
+        return batch_executor
+
+def get_export_executor():
+    """Worker pool for full-dataset exports, created on first use"""
+    global export_executor
+    with export_executor_lock:
+        if export_executor is None:
+            export_executor = ThreadPoolExecutor(
+                max_workers=EXPORT_MAX_CONCURRENCY,
+                thread_name_prefix="sql-export"
+            )
+        return export_executor
+
+def get_count_probe_executor():
+    """Worker pool for COUNT(*) probes that run alongside the limited query, created on first use"""
+    global count_probe_executor
+    with count_probe_executor_lock:
+        if count_probe_executor is None:
+            count_probe_executor = ThreadPoolExecutor(
+                max_workers=SQL_MAX_CONCURRENCY,
+                thread_name_prefix="sql-count-probe"
             )
+        return count_probe_executor
+
+def is_known_item(words):
+    """True when the replica has an item whose name contains every word (item templates without an "item" cue)"""
+    if local_engine is None or not local_engine.ready:
+        return False
+    try:
+        _, rows = local_engine.query(
+            "SELECT 1 FROM PO_DATA WHERE " + " AND ".join("UPPER(ITEMNAME) LIKE ?" for _ in words) + " LIMIT 1",
+            [f"%{word}%" for word in words]
         )
+    except Exception as e:
+        log.warning("known_item_lookup_failed", error=str(e))
+        return False
+    return bool(rows)
+
+def resolve_sql(user_query):
+    """Return (sql, source): deterministic template first, then the SQL cache, then the LLM"""
+    with timing.span("sql_template"):
+        template = match_template(user_query, known_item=is_known_item, rollup_intents=rollup_store is not None)
+    if template is not None:
+        template_name, sql = template
+        sql_source_stats.record("template", template_name)
+        return sql, "template"
+    
+    with timing.span("sql_cache"):
+        cached_sql = sql_cache.get(user_query)
+    if cached_sql is not None:
+        sql_source_stats.record("cache")
+        return cached_sql, "cache"
+    
+    sql = generate_sql(user_query)
+    sql_source_stats.record("llm")
+    return sql, "llm"
+
+def is_sql_error(sql_result):
+    """True when execute_sql returned an error payload"""
+    return isinstance(sql_result, dict) and "error" in sql_result
+
+def generate_sql(user_query, error_feedback=None):
+    """Generate SQL query from natural language using Cohere Command model.
+    
+    error_feedback is (failed_sql, error_message) from a previous attempt; the model is asked to correct it.
+    """
+    
+    user_message = f"User Question: {user_query}\n\nReturn ONLY raw Oracle SQL:"
+    if error_feedback is not None:
+        failed_sql, failed_error = error_feedback
+        user_message = (
+            f"User Question: {user_query}\n\n"
+            f"This SQL failed:\n{failed_sql}\n\n"
+            f"Error: {failed_error}\n\n"
+            "Fix the error using only the documented columns. Return ONLY the corrected raw Oracle SQL:"
+        )
+    
+    # Send only the prompt sections this question needs (PO / tender / join / financial)
+    route = route_sql_prompt(user_query)
+    preamble = build_sql_prompt(route)
+    log.debug("sql_prompt_routed", route=route, prompt_chars=len(preamble), full_prompt_chars=len(SQL_GENERATION_PROMPT))
+    
+    try:
+        # Create chat request for Cohere using the routed sections of the lambda_K.py prompt
+        chat_request = chat_details(user_message, preamble, max_tokens=512, temperature=0.3, top_p=1.0)
         
-        # Invoke the model
-        chat_response = gen_ai_client.chat(chat_request)
+        # Invoke the model on the shared client
+        with timing.span("generate_sql"):
+            chat_response = genai_chat(chat_request)
         
         # Extract the generated SQL
         output_text = chat_response.data.chat_response.text.strip()
+        record_token_usage("sql", chat_response, count_prompt_tokens(preamble) + count_tokens(user_message), output_text)
         
         # Clean up the output (same logic as lambda_K.py)
         sql = output_text.replace("```sql", "").replace("```", "").strip().rstrip(";")
@@ -182,35 +1062,81 @@ def generate_sql(user_query):
         return sql
         
     except Exception as e:
-        print(f"Error generating SQL: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("sql_generation_failed", e)
         raise
 
-def execute_sql(sql_query):
-    """Execute SQL query via HTTP endpoint"""
-    try:
-        sql_payload = {"sql": sql_query}
-        
-        # Forward SQL to endpoint
-        http_response = http.request(
-            "POST",
-            SQL_ENDPOINT,
-            body=json.dumps(sql_payload),
-            headers={"Content-Type": "application/json"},
-            timeout=30.0
-        )
-        
-        result = json.loads(http_response.data.decode("utf-8"))
-        return result
+def execute_sql(sql_query, use_cache=True, metrics=None):
+    """Execute SQL query, serving repeats from the result cache and what it can from the local replica.
     
-    except Exception as e:
-        print(f"Error executing SQL: {str(e)}")
-        return {"error": f"SQL execution failed: {str(e)}"}
+    When a metrics dict is passed it receives the transport timings (queue, connect, TTFB, bytes),
+    or backend='local' when the replica answered.
+    """
+    if use_cache:
+        cached_result = result_cache.get(sql_query)
+        if cached_result is not None:
+            if metrics is not None:
+                metrics['result_cache'] = 'hit'
+            return cached_result
+    
+    # Replica answers take milliseconds, so they are not worth a result cache entry
+    if local_engine is not None:
+        with timing.span("execute_local"):
+            result = local_engine.execute(sql_query, max_rows=SQL_MAX_RESULT_ROWS, metrics=metrics)
+        if result is not None:
+            return result
+    
+    result, transport_metrics = _execute_sql_remote(sql_query)
+    if metrics is not None:
+        metrics.update(transport_metrics)
+    if use_cache and not is_sql_error(result):
+        result_cache.set(sql_query, result)
+    return result
+
+def _execute_sql_remote(sql_query):
+    """Execute SQL query via HTTP endpoint; returns (result, transport_metrics)"""
+    result, transport_metrics = sql_transport.post_json(
+        {"sql": sql_query},
+        max_rows=SQL_MAX_RESULT_ROWS,
+        max_bytes=SQL_MAX_RESULT_BYTES
+    )
+    if is_sql_error(result):
+        log.warning("sql_execution_error", error=result['error'])
+    return result, transport_metrics
 
 def count_tokens(text):
-    """Approximate token count (4 characters per token)"""
-    return len(text) // 4
+    """Token count from the bundled tokenizer (falls back to 4 characters per token).
+    
+    SQL results may be passed directly; they are counted in their compact prompt encoding.
+    """
+    if not isinstance(text, str):
+        text = encode_sql_result(text, RESULT_ENCODING)
+    return token_counter.count(text)
+
+@lru_cache(maxsize=32)
+def count_prompt_tokens(prompt):
+    """Token count for the (few, static) system prompts, computed once each"""
+    return count_tokens(prompt)
+
+def fit_sql_result_to_budget(sql_result, budget_tokens):
+    """Truncate to the head/tail rows that fill budget_tokens; returns (result, top_n, bottom_n)"""
+    rows = extract_rows(sql_result)
+    if not rows:
+        return sql_result, None, None
+    
+    columns = result_columns(sql_result, rows)
+    top_n, bottom_n = fit_rows_to_budget(
+        rows,
+        budget_tokens,
+        lambda row: count_tokens(encode_row(row, columns, RESULT_ENCODING)) + 1
+    )
+    truncated_result = truncate_sql_result(sql_result, top_n=top_n, bottom_n=bottom_n)
+    
+    # Per-row counts ignore header and separators; shrink until the whole block fits
+    while top_n + bottom_n > 0 and count_tokens(truncated_result) > budget_tokens:
+        top_n = top_n * 9 // 10
+        bottom_n = bottom_n * 9 // 10
+        truncated_result = truncate_sql_result(sql_result, top_n=top_n, bottom_n=bottom_n)
+    return truncated_result, top_n, bottom_n
 
 def truncate_sql_result(sql_result, top_n=20, bottom_n=20):
     """Truncate SQL result to top N and bottom N rows"""
@@ -240,7 +1166,7 @@ def truncate_sql_result(sql_result, top_n=20, bottom_n=20):
             return sql_result
         
         top_rows = rows[:top_n]
-        bottom_rows = rows[-bottom_n:]
+        bottom_rows = rows[-bottom_n:] if bottom_n else []
         
         if isinstance(sql_result, list):
             truncated_result = top_rows + bottom_rows
@@ -274,178 +1200,404 @@ def truncate_sql_result(sql_result, top_n=20, bottom_n=20):
         return truncated_result
         
     except Exception as e:
-        print(f"Error truncating SQL result: {str(e)}")
+        log.error("result_truncation_failed", error=str(e))
         return sql_result
 
-def get_truncated_system_prompt():
+def summarize_sql_result_to_budget(sql_result, budget_tokens):
+    """Statistical summary of all rows that fits budget_tokens; returns (encoded_summary, summary) or (None, None)"""
+    try:
+        # Halve the sample until the summary fits; the column statistics are computed only once
+        sample_sizes = [SUMMARY_SAMPLE_ROWS >> shift for shift in range(SUMMARY_SAMPLE_ROWS.bit_length())] + [0]
+        for summary in summarize_sql_result_samples(sql_result, sample_sizes):
+            encoded = json.dumps(summary, separators=(",", ":"), ensure_ascii=False, default=str)
+            if count_tokens(encoded) <= budget_tokens:
+                return encoded, summary
+        return None, None
+    except Exception as e:
+        log.error("result_summary_failed", error=str(e))
+        return None, None
+
+def get_summary_system_prompt(total_rows, sample_rows, capped=False, query_rows=None):
+    """Get summary context to prepend to system prompt.
+    
+    capped: only the first total_rows rows of a larger result were read (query_rows is the database's
+    count when known), so the statistics must not be presented as covering the whole result.
+    """
+    if capped:
+        returned = f"**{query_rows} rows**" if query_rows is not None else "more rows than could be read"
+        scope = f"the first {total_rows} rows read"
+        overview = f"The SQL query returned {returned}; only the first **{total_rows} rows** were read. The data below is a statistical summary computed over **{scope}** (not the whole result), plus a stratified sample of **{sample_rows} rows**."
+        basis = f"- Base totals, counts, averages and rankings on the summary statistics, and state that they cover {scope}; the query returned more, so do not present them as totals for the whole result"
+        download = "- Mention that the full dataset is available in a downloadable Excel file"
+    else:
+        overview = f"The SQL query returned **{total_rows} rows**, too many to include individually. The data below is a statistical summary computed over **all {total_rows} rows**, plus a stratified sample of **{sample_rows} rows**."
+        basis = "- Base totals, counts, averages and rankings on the summary statistics, which cover the complete result"
+        download = f"- Mention that the full dataset of {total_rows} rows is available in a downloadable Excel file"
+    return f"""## CRITICAL CONTEXT - SUMMARIZED DATA ANALYSIS:
+
+**IMPORTANT**: {overview}
+
+**The Summary Contains:**
+- "columns": per-column statistics (numeric: count, nulls, sum, min, max, mean, p25/p50/p75/p95; text: count, distinct values and the most frequent values with their counts)
+- "top_groups_by_value": the top groups by monetary columns (values in Lakhs), as [group, total, row count]
+- "status_distributions": the row count for every status value
+- "sample": representative rows, stratified by the column named in "stratified_by"
+
+**Your Analysis Should:**
+{basis}
+- Use the sample rows only as illustrative examples; do not compute totals from them
+- Keep the same format and structure as you would for a full analysis, using tables for the top groups and distributions
+{download}
+
+"""
+
+def get_row_limit_system_prompt(returned_rows, total_rows=None):
+    """Get row-limit context to prepend to system prompt"""
+    total = f"**{total_rows} rows** in total" if total_rows is not None else "more rows than were fetched"
+    return f"""## CRITICAL CONTEXT - ROW-LIMITED RESULT:
+
+**IMPORTANT**: The SQL query matches {total}; only the first **{returned_rows} rows** were fetched.
+
+**Your Analysis Should:**
+- Report counts and totals over all rows only when the total row count is given above; otherwise describe them as covering the first {returned_rows} rows
+- Mention that more rows are available (the user can request the next page)
+
+"""
+
+def get_truncated_system_prompt(top_n=20, bottom_n=20):
     """Get truncated context to prepend to system prompt"""
-    return """## CRITICAL CONTEXT - TRUNCATED DATA ANALYSIS:
+    return f"""## CRITICAL CONTEXT - TRUNCATED DATA ANALYSIS:
 
-**IMPORTANT**: The data provided below contains ONLY the **top 20 rows and bottom 20 rows** from the full SQL query result. The complete dataset is too large to process in a single analysis.
+**IMPORTANT**: The data provided below contains ONLY the **top {top_n} rows and bottom {bottom_n} rows** from the full SQL query result. The complete dataset is too large to process in a single analysis.
 
 **Your Analysis Should:**
-- Analyze the provided top 20 and bottom 20 rows
+- Analyze the provided top {top_n} and bottom {bottom_n} rows
 - Keep the same format and structure as you would for a full analysis
-- Clearly indicate in your response that this is an analysis of the top 20 and bottom 20 rows
+- Clearly indicate in your response that this is an analysis of the top {top_n} and bottom {bottom_n} rows
 - Mention that the full dataset is available in a downloadable Excel file for complete data review
 - Provide insights based on the sample data while acknowledging the limitation
 
 **Response Format:**
-- Start your response with a note: "Below is the analysis of the top 20 and bottom 20 rows from the query results. For the complete dataset, please refer to the downloadable Excel file."
+- Start your response with a note: "Below is the analysis of the top {top_n} and bottom {bottom_n} rows from the query results. For the complete dataset, please refer to the downloadable Excel file."
 - Maintain the same professional format and table structure as you would for full data
 - Include all provided rows in your analysis
 - Provide meaningful insights based on the sample data
 
 """
 
-def generate_response(user_query, sql_query, sql_result):
-    """Generate natural language response using Cohere Command model"""
-    
-    # Format the query results
-    formatted_results = json.dumps(sql_result, indent=2, default=str)
-    
-    # Count tokens
-    token_count = count_tokens(formatted_results)
-    print(f"Token count of SQL result: {token_count}")
-    
-    TOKEN_THRESHOLD = 185000
-    is_truncated = False
-    truncated_result = sql_result
-    
-    if token_count > TOKEN_THRESHOLD:
-        print(f"Token count ({token_count}) exceeds threshold. Truncating data...")
-        truncated_result = truncate_sql_result(sql_result, top_n=20, bottom_n=20)
-        formatted_results = json.dumps(truncated_result, indent=2, default=str)
-        is_truncated = True
-        print(f"Data truncated. New token count: {count_tokens(formatted_results)}")
-    
-    # Select system prompt based on truncation
-    if is_truncated:
-        system_prompt_to_use = get_truncated_system_prompt() + RESPONSE_GENERATION_PROMPT
-    else:
-        system_prompt_to_use = RESPONSE_GENERATION_PROMPT
-    
-    user_message = f"""DATA ANALYSIS TASK
+def build_response_message(user_query, sql_query, formatted_results, output_instruction, results_description=None):
+    """User message for the narrative LLM call"""
+    return f"""DATA ANALYSIS TASK
 
 User Question: {user_query}
 
 SQL Query Executed: {sql_query}
 
-Query Results:
+Query Results ({results_description or describe_encoding(RESULT_ENCODING)}):
 {formatted_results}
 
 Based on the above data, provide a clear and helpful response to the user's question.
 
-**CRITICAL**: You MUST return your response as a valid JSON object with exactly two fields: "response" (your analysis as markdown text) and "visualization" (the visualization configuration object). Return ONLY the JSON object, no additional text before or after."""
+{output_instruction}"""
 
-    try:
-        gen_ai_client = get_generative_ai_client()
-        
-        # Create chat request using EXACT prompt from lambda_K.py
-        chat_request = ChatDetails(
-            compartment_id=OCI_COMPARTMENT_ID,
-            serving_mode=OnDemandServingMode(model_id=MODEL_ID),
-            chat_request=CohereChatRequest(
-                message=user_message,
-                preamble_override=system_prompt_to_use,
-                max_tokens=2000,
-                temperature=0.3,
-                top_p=0.9,
-                is_stream=False
+def build_response_prompt(user_query, sql_query, sql_result):
+    """Build (system_prompt, user_message, formatted_results, partial) for the narrative LLM call.
+    
+    partial is True when the prompt carries a summary or the top/bottom rows instead of every row.
+    """
+    
+    base_prompt = RESPONSE_MARKDOWN_PROMPT
+    output_instruction = """**CRITICAL**: Return your analysis as plain markdown text only, with no JSON wrapper."""
+    
+    # Row-limited results: tell the model the rows are the first page of a larger result
+    if isinstance(sql_result, dict) and sql_result.get("_has_more"):
+        returned_rows = len(extract_rows(sql_result) or [])
+        base_prompt = get_row_limit_system_prompt(returned_rows, sql_result.get("_total_query_rows")) + base_prompt
+    
+    # Format the query results compactly (column names once, normalized numbers)
+    formatted_results = encode_sql_result(sql_result, RESULT_ENCODING)
+    
+    # Count tokens
+    token_count = count_tokens(formatted_results)
+    log.debug("result_tokens", tokens=token_count, counter=token_counter.name)
+    
+    # Result budget: context window minus preamble, message template and max_tokens
+    message_tokens = count_tokens(build_response_message(user_query, sql_query, "", output_instruction))
+    data_budget = response_budget.available_for_data(count_prompt_tokens(base_prompt), message_tokens)
+    system_prompt_to_use = base_prompt
+    results_description = None
+    
+    if token_count > data_budget and SUMMARIZE_LARGE_RESULTS:
+        preamble_tokens = count_prompt_tokens(base_prompt) + count_prompt_tokens(get_summary_system_prompt(0, 0, capped=True))
+        summary_budget = response_budget.available_for_data(preamble_tokens, message_tokens)
+        original_tokens = token_count
+        encoded_summary, summary = summarize_sql_result_to_budget(sql_result, summary_budget)
+        if encoded_summary is not None:
+            formatted_results = encoded_summary
+            token_count = count_tokens(formatted_results)
+            sample_rows = len(summary["sample"]["rows"])
+            # Capped by the transport/local engine limits, or row-limited with more rows in the database
+            capped = isinstance(sql_result, dict) and bool(sql_result.get("_row_limit_reached") or sql_result.get("_has_more"))
+            query_rows = sql_result.get("_total_query_rows") if capped else None
+            system_prompt_to_use = get_summary_system_prompt(summary["total_rows"], sample_rows, capped, query_rows) + base_prompt
+            if capped:
+                results_description = f"statistical summary of the first {summary['total_rows']} rows read as compact JSON; the query returned more rows; sample rows are arrays in the order of sample.columns"
+            else:
+                results_description = "statistical summary of all rows as compact JSON; sample rows are arrays in the order of sample.columns"
+            log.info(
+                "result_summarized",
+                total_rows=summary['total_rows'],
+                capped=capped,
+                sample_rows=sample_rows,
+                tokens=original_tokens,
+                budget=summary_budget,
+                summary_tokens=token_count
             )
+    
+    if token_count > data_budget and results_description is None:
+        # The truncation notice is part of the preamble, so reserve room for it as well
+        preamble_tokens = count_prompt_tokens(base_prompt) + count_prompt_tokens(get_truncated_system_prompt())
+        data_budget = response_budget.available_for_data(preamble_tokens, message_tokens)
+        original_tokens = token_count
+        truncated_result, top_n, bottom_n = fit_sql_result_to_budget(sql_result, data_budget)
+        if top_n is not None:
+            formatted_results = encode_sql_result(truncated_result, RESULT_ENCODING)
+            token_count = count_tokens(formatted_results)
+            system_prompt_to_use = get_truncated_system_prompt(top_n, bottom_n) + base_prompt
+            log.info(
+                "result_truncated",
+                top_rows=top_n,
+                bottom_rows=bottom_n,
+                tokens=original_tokens,
+                budget=data_budget,
+                truncated_tokens=token_count
+            )
+    
+    user_message = build_response_message(user_query, sql_query, formatted_results, output_instruction, results_description)
+    timing.count('response_prompt_tokens', count_prompt_tokens(system_prompt_to_use) + message_tokens + token_count)
+    timing.count('prompt_result_bytes', len(formatted_results.encode('utf-8')))
+    
+    return system_prompt_to_use, user_message, formatted_results, system_prompt_to_use != base_prompt
+
+def generate_response(user_query, sql_query, sql_result, on_partial_prompt=None):
+    """Generate natural language response using Cohere Command model.
+    
+    on_partial_prompt() is called before the LLM call when the prompt holds only part of the rows.
+    """
+    
+    # The chart is picked locally from the result shape; the LLM only writes the narrative
+    with timing.span("visualization"):
+        visualization = recommend_visualization(sql_result, user_query)
+    
+    # Trivial result shapes are rendered locally; no second LLM call
+    shape = template_narrative_shape(sql_result)
+    if shape:
+        log.info("narrative_template", shape=shape)
+        with timing.span("narrative_template"):
+            narrative = render_narrative(shape, sql_query, sql_result)
+        return {
+            "response": narrative,
+            "visualization": visualization,
+            "narrative_source": f"template:{shape}"
+        }
+    
+    with timing.span("build_prompt"):
+        system_prompt_to_use, user_message, formatted_results, partial = build_response_prompt(
+            user_query, sql_query, sql_result
+        )
+    if partial and on_partial_prompt is not None:
+        on_partial_prompt()
+    
+    try:
+        chat_request = chat_details(
+            user_message, system_prompt_to_use, max_tokens=RESPONSE_MAX_TOKENS, temperature=0.3, top_p=0.9
         )
         
-        chat_response = gen_ai_client.chat(chat_request)
+        with timing.span("generate_response"):
+            chat_response = genai_chat(chat_request)
         output_text = chat_response.data.chat_response.text.strip()
+        record_token_usage("response", chat_response, None, output_text)
         
-        # Parse JSON response (same logic as lambda_K.py)
-        try:
-            cleaned_text = output_text
-            if "```json" in cleaned_text:
-                cleaned_text = cleaned_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in cleaned_text:
-                cleaned_text = cleaned_text.split("```")[1].split("```")[0].strip()
-            
-            parsed_response = json.loads(cleaned_text)
-            
-            if isinstance(parsed_response, dict):
-                response_text = parsed_response.get("response", output_text)
-                visualization = parsed_response.get("visualization", None)
-                
-                # Handle case where response_text might be a JSON string that needs parsing
-                if isinstance(response_text, str) and response_text.strip().startswith('{'):
-                    try:
-                        inner_parsed = json.loads(response_text)
-                        if isinstance(inner_parsed, dict) and "response" in inner_parsed:
-                            response_text = inner_parsed.get("response", response_text)
-                            if "visualization" in inner_parsed and visualization is None:
-                                visualization = inner_parsed.get("visualization")
-                    except (json.JSONDecodeError, ValueError):
-                        pass
-                
-                # Validate visualization structure
-                if visualization is not None and isinstance(visualization, dict):
-                    default_viz = {
-                        "chartType": None,
-                        "title": "Auto-generated Chart",
-                        "xAxis": None,
-                        "yAxis": None,
-                        "mode": None
-                    }
-                    for key in default_viz:
-                        if key not in visualization:
-                            visualization[key] = default_viz[key]
-                else:
-                    visualization = {
-                        "chartType": None,
-                        "title": "Auto-generated Chart",
-                        "xAxis": None,
-                        "yAxis": None,
-                        "mode": None
-                    }
-                
-                return {
-                    "response": response_text,
-                    "visualization": visualization
-                }
-            else:
-                return {
-                    "response": output_text,
-                    "visualization": {
-                        "chartType": None,
-                        "title": "Auto-generated Chart",
-                        "xAxis": None,
-                        "yAxis": None,
-                        "mode": None
-                    }
-                }
-        except json.JSONDecodeError as json_err:
-            print(f"Warning: Could not parse LLM response as JSON: {str(json_err)}")
-            print(f"Raw response (first 500 chars): {output_text[:500]}...")
-            
-            return {
-                "response": output_text,
-                "visualization": {
-                    "chartType": None,
-                    "title": "Auto-generated Chart",
-                    "xAxis": None,
-                    "yAxis": None,
-                    "mode": None
-                }
-            }
+        return {
+            "response": extract_response_text(output_text),
+            "visualization": visualization,
+            "narrative_source": "llm"
+        }
     
     except Exception as e:
-        print(f"Error generating response: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("response_generation_failed", e)
         
         return {
             "response": f"Query executed successfully. Results: {formatted_results}",
-            "visualization": {
-                "chartType": None,
-                "title": "Auto-generated Chart",
-                "xAxis": None,
-                "yAxis": None,
-                "mode": None
-            }
+            "visualization": visualization,
+            "narrative_source": "fallback"
         }
+
+def template_narrative_shape(sql_result):
+    """Result shape answerable by a narrative template ("empty", "scalar", ...), or None"""
+    # Failures never get an LLM narrative
+    if is_sql_error(sql_result):
+        return "error"
+    if not NARRATIVE_TEMPLATES:
+        return None
+    return classify_result(sql_result, max_rows=NARRATIVE_TEMPLATE_MAX_ROWS)
+
+def extract_response_text(output_text):
+    """Markdown narrative from the model output, unwrapping a JSON {"response": ...} the model may still emit"""
+    cleaned_text = output_text
+    if cleaned_text.startswith("```json"):
+        cleaned_text = cleaned_text.split("```json")[1].split("```")[0].strip()
+    if not cleaned_text.startswith("{"):
+        return output_text
+    try:
+        parsed_response = json.loads(cleaned_text)
+    except (json.JSONDecodeError, ValueError):
+        return output_text
+    if isinstance(parsed_response, dict) and isinstance(parsed_response.get("response"), str):
+        return parsed_response["response"]
+    return output_text
+
+def iter_chat_stream_text(chat_response):
+    """Yield text deltas from a streaming Cohere chat response (server-sent events)"""
+    for event in chat_response.data.events():
+        try:
+            payload = json.loads(event.data)
+        except (json.JSONDecodeError, ValueError, TypeError):
+            continue
+        # The final event repeats the full text alongside finishReason
+        if "finishReason" in payload:
+            break
+        text = payload.get("text")
+        if text:
+            yield text
+
+def generate_response_stream(user_query, sql_query, sql_result, on_partial_prompt=None, on_source=None):
+    """Stream the narrative as markdown text deltas (on_partial_prompt as in generate_response).
+    
+    on_source(narrative_source) reports where the narrative came from once it is known: "template:<shape>",
+    "llm", or "fallback" when the LLM stream failed.
+    """
+    report_source = on_source or (lambda source: None)
+    
+    shape = template_narrative_shape(sql_result)
+    if shape:
+        log.info("narrative_template", shape=shape)
+        with timing.span("narrative_template"):
+            narrative = render_narrative(shape, sql_query, sql_result)
+        report_source(f"template:{shape}")
+        yield narrative
+        return
+    
+    with timing.span("build_prompt"):
+        system_prompt_to_use, user_message, formatted_results, partial = build_response_prompt(
+            user_query, sql_query, sql_result
+        )
+    if partial and on_partial_prompt is not None:
+        on_partial_prompt()
+    
+    chat_request = chat_details(
+        user_message, system_prompt_to_use, max_tokens=RESPONSE_MAX_TOKENS, temperature=0.3, top_p=0.9,
+        is_stream=True
+    )
+    
+    try:
+        # Spans cannot wrap a generator that yields, so the stream is timed by hand
+        started = time.perf_counter()
+        chat_response = genai_chat(chat_request)
+        deltas = []
+        for delta in iter_chat_stream_text(chat_response):
+            if not deltas:
+                timing.add("generate_response_first_delta", (time.perf_counter() - started) * 1000)
+            deltas.append(delta)
+            yield delta
+        timing.add("generate_response", (time.perf_counter() - started) * 1000)
+        record_token_usage("response", chat_response, None, "".join(deltas))
+        report_source("llm")
+    
+    except Exception as e:
+        log.exception("response_stream_failed", e)
+        
+        report_source("fallback")
+        yield f"Query executed successfully. Results: {formatted_results}"
+
+def stream_query_events(user_query, sql_query, sql_result, metadata, export_format=None):
+    """Yield NDJSON-ready events: sql, data, visualization, narrative deltas, export, done"""
+    export_ids, on_partial_prompt = plan_export(sql_query, sql_result, metadata, export_format)
+    yield {"event": "sql", "query": user_query, "sql": sql_query}
+    paging = metadata.pop('paging', None)
+    yield {"event": "data", "data": first_page(sql_result, paging), "paging": paging}
+    with timing.span("visualization"):
+        visualization = recommend_visualization(sql_result, user_query)
+    yield {"event": "visualization", "visualization": visualization}
+    narrative_sources = []
+    for delta in generate_response_stream(user_query, sql_query, sql_result, on_partial_prompt, narrative_sources.append):
+        yield {"event": "narrative", "delta": delta}
+    export = finish_export(export_ids)
+    if export is not None:
+        yield {"event": "export", "export": export}
+    metadata['narrative_source'] = narrative_sources[-1] if narrative_sources else None
+    yield {"event": "done", "metadata": metadata}
+
+# Cold start: EAGER_WARMUP=true runs warm_up() during the init phase, so the first request does not
+# pay for SDK imports, client construction or the first SQL connection; "background" runs it on a
+# thread instead, so the init phase returns at once and the first request waits only for what it needs
+EAGER_WARMUP = os.environ.get('EAGER_WARMUP', 'false').lower()
+WARMUP_SQL_CONNECTIONS = int(os.environ.get('WARMUP_SQL_CONNECTIONS', '1'))
+
+def warm_up():
+    """Import the SDKs, build the GenAI client, SQL pool and worker pools, count the static prompts, load the replica and build the rollups.
+    
+    Returns per-step ms; a step that fails is logged and left to happen on first use.
+    """
+    def import_modules():
+        import fdk.response
+        import oci.generative_ai_inference.models
+    
+    def count_static_prompts():
+        for route in ROUTE_SECTIONS:
+            count_prompt_tokens(build_sql_prompt(route))
+        for prompt in (RESPONSE_MARKDOWN_PROMPT, get_summary_system_prompt(0, 0), get_summary_system_prompt(0, 0, capped=True), get_truncated_system_prompt()):
+            count_prompt_tokens(prompt)
+    
+    def start_executors():
+        get_batch_executor()
+        get_count_probe_executor()
+        get_export_executor()
+    
+    def load_local_engine():
+        local_engine.refresh()
+        local_engine.start(delay=LOCAL_ENGINE_REFRESH_SECONDS)
+    
+    def build_rollups():
+        rollup_store.refresh()
+        rollup_store.start()
+    
+    steps = [
+        ("imports", import_modules),
+        ("genai_client", genai_manager.get_client),
+        ("sql_pool", lambda: sql_transport.warm_up(WARMUP_SQL_CONNECTIONS)),
+        ("prompts", count_static_prompts),
+        ("executors", start_executors),
+    ]
+    if EXPORT_STORE == 'object_storage':
+        steps.append(("object_storage", lambda: export_store.namespace))
+    if local_engine is not None:
+        steps.append(("local_engine", load_local_engine))
+    if rollup_store is not None:
+        steps.append(("rollups", build_rollups))
+    
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            log.warning("warm_up_step_failed", step=name, error=str(e))
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    log.info("warm_up", steps_ms=timings, total_ms=round(sum(timings.values()), 1))
+    return timings
+
+if EAGER_WARMUP == 'true':
+    warm_up()
+elif EAGER_WARMUP == 'background':
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
@@ -0,0 +1,153 @@
+# Shared OCI Generative AI client for the life of the function container.
+# The OCI SDK is imported when the client is first built, keeping it out of the cold start.
+
+import base64
+import json
+import threading
+import time
+
+from structured_log import get_logger
+
+
+# Refresh the resource principal token this many seconds before it expires
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+# Poll interval used when the token expiry cannot be read
+TOKEN_REFRESH_FALLBACK_SECONDS = 600
+# Never re-check the token more often than this
+TOKEN_REFRESH_MIN_SECONDS = 30
+# HTTP status codes that mean the signer/token is no longer accepted
+AUTH_FAILURE_STATUSES = (401, 403)
+
+
+def _token_expiry(signer):
+    """Read the expiry (epoch seconds) from the signer's security token JWT"""
+    try:
+        token = signer.get_security_token()
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload.encode("utf-8")))
+        return float(claims["exp"])
+    except Exception:
+        return None
+
+
+def _is_auth_or_transport_error(error):
+    """Return True for failures that a fresh signer/client can fix"""
+    import oci
+
+    if isinstance(error, oci.exceptions.ServiceError):
+        return error.status in AUTH_FAILURE_STATUSES
+    transport_errors = (
+        oci.exceptions.RequestException,
+        oci.exceptions.ConnectTimeout,
+        ConnectionError,
+        TimeoutError,
+    )
+    return isinstance(error, transport_errors)
+
+
+class GenerativeAiClientManager:
+    """Builds the signer and GenerativeAiInferenceClient once and keeps them warm"""
+
+    def __init__(self, service_endpoint):
+        self.service_endpoint = service_endpoint
+        self._lock = threading.Lock()
+        self._client = None
+        self._signer = None
+        self._refresh_thread = None
+
+    def get_client(self):
+        """Return the shared client, building it on first use"""
+        client = self._client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._client is None:
+                self._build()
+            return self._client
+
+    def set_client(self, client):
+        """Use client instead of building one (local benchmarks and tests); None restores the default"""
+        with self._lock:
+            self._client = client
+            self._signer = None
+
+    def chat(self, chat_details):
+        """Invoke chat on the shared client, rebuilding once on auth/transport failure"""
+        client = self.get_client()
+        try:
+            return client.chat(chat_details)
+        except Exception as e:
+            if not _is_auth_or_transport_error(e):
+                raise
+            get_logger().warning("genai_client_rebuild", error=str(e), error_type=type(e).__name__)
+            self.invalidate(client)
+            return self.get_client().chat(chat_details)
+
+    def invalidate(self, client=None):
+        """Drop the cached client so the next call rebuilds it"""
+        with self._lock:
+            if client is None or client is self._client:
+                self._client = None
+                self._signer = None
+
+    def _build(self):
+        """Create signer and client; caller must hold the lock"""
+        import oci
+        from oci.generative_ai_inference import GenerativeAiInferenceClient
+
+        try:
+            # Use resource principal for OCI Functions
+            signer = oci.auth.signers.get_resource_principals_signer()
+            self._client = GenerativeAiInferenceClient(
+                config={},
+                signer=signer,
+                service_endpoint=self.service_endpoint
+            )
+            self._signer = signer
+            self._start_token_refresher()
+        except Exception as e:
+            get_logger().warning("genai_resource_principal_failed", error=str(e))
+            # Fallback to config file authentication for local testing
+            config = oci.config.from_file()
+            self._client = GenerativeAiInferenceClient(
+                config=config,
+                service_endpoint=self.service_endpoint
+            )
+            self._signer = None
+
+    def _start_token_refresher(self):
+        """Start the background token refresher once per container"""
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_loop,
+            name="genai-token-refresher",
+            daemon=True
+        )
+        self._refresh_thread.start()
+
+    def _refresh_loop(self):
+        """Refresh the resource principal token shortly before it expires"""
+        while True:
+            signer = self._signer
+            if signer is None:
+                time.sleep(TOKEN_REFRESH_FALLBACK_SECONDS)
+                continue
+            expiry = _token_expiry(signer)
+            if expiry is None:
+                delay = TOKEN_REFRESH_FALLBACK_SECONDS
+            else:
+                delay = max(expiry - time.time() - TOKEN_REFRESH_MARGIN_SECONDS, TOKEN_REFRESH_MIN_SECONDS)
+            time.sleep(delay)
+            if signer is not self._signer:
+                continue
+            try:
+                refresh = getattr(signer, "refresh_security_token", None)
+                if refresh is not None:
+                    refresh()
+            except Exception as e:
+                get_logger().error("genai_token_refresh_failed", error=str(e))
+                # Let the next request rebuild the signer from scratch
+                self.invalidate()
+                time.sleep(TOKEN_REFRESH_FALLBACK_SECONDS)
@@ -0,0 +1,138 @@
+# Incremental parser for SQL endpoint responses: rows are decoded as the body arrives
+
+import codecs
+import json
+
+from result_encoding import ROW_KEYS
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class IncompleteJson(Exception):
+    """The buffered text ends before the next JSON value does"""
+
+
+class RowStreamParser:
+    """Feed response bytes; parsed rows are returned as soon as each one is complete.
+
+    Handles {"rows"|"data"|"results": [...], ...other keys} and bare [...] bodies. Only the
+    current row is ever buffered as text, so memory is bounded by the rows kept, not the body.
+    """
+
+    def __init__(self):
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = "start"
+        self._after_rows = "end"
+        self.row_key = None
+        self.envelope = None
+        self.done = False
+
+    def feed(self, data, final=False):
+        """Consume a chunk of bytes; returns the rows completed by it"""
+        self._buffer = self._buffer[self._pos:] + self._utf8.decode(data, final=final)
+        self._pos = 0
+        rows = []
+        try:
+            while not self.done and self._step(rows, final):
+                pass
+        except IncompleteJson:
+            if final:
+                raise json.JSONDecodeError("Unexpected end of response", self._buffer, self._pos)
+        return rows
+
+    def finish(self):
+        """Signal end of body; returns any rows still buffered"""
+        rows = self.feed(b"", final=True)
+        if not self.done:
+            raise json.JSONDecodeError("Unexpected end of response", self._buffer, self._pos)
+        return rows
+
+    def result(self, rows):
+        """Rebuild the response in its original shape around the collected rows"""
+        if self.envelope is None:
+            return rows
+        result = dict(self.envelope)
+        if self.row_key is not None:
+            result[self.row_key] = rows
+        return result
+
+    def _skip(self):
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        if pos >= len(buffer):
+            raise IncompleteJson()
+        return buffer[pos]
+
+    def _value(self, final):
+        """Decode the next complete JSON value at the cursor"""
+        self._skip()
+        try:
+            value, end = _decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            # Invalid and truncated text look alike until the body has ended
+            if not final:
+                raise IncompleteJson()
+            raise
+        # A number that ends exactly at the end of the buffer may continue in the next chunk
+        if end == len(self._buffer) and not final and isinstance(value, (int, float)):
+            raise IncompleteJson()
+        self._pos = end
+        return value
+
+    def _step(self, rows, final):
+        """Advance the state machine by one token or value"""
+        char = self._skip()
+        if self._state == "start":
+            self._pos += 1
+            if char == "[":
+                self._state = "rows"
+                self._after_rows = "end"
+            elif char == "{":
+                self.envelope = {}
+                self._state = "key"
+            else:
+                raise json.JSONDecodeError("Expected a JSON object or array", self._buffer, self._pos - 1)
+        elif self._state == "key":
+            if char == ",":
+                self._pos += 1
+            elif char == "}":
+                self._pos += 1
+                self.done = True
+            else:
+                self._member(final)
+        elif char == ",":
+            self._pos += 1
+        elif char == "]":
+            self._pos += 1
+            self._state = self._after_rows
+            self.done = self._after_rows == "end"
+        else:
+            rows.append(self._value(final))
+        return True
+
+    def _member(self, final):
+        """Parse '"key": value' of the top-level object; the row array switches to row-by-row mode"""
+        start = self._pos
+        try:
+            key = self._value(final)
+            if self._skip() != ":":
+                raise json.JSONDecodeError("Expected ':'", self._buffer, self._pos)
+            self._pos += 1
+            if key in ROW_KEYS and self.row_key is None and self._skip() == "[":
+                self.row_key = key
+                self._pos += 1
+                self._state = "rows"
+                self._after_rows = "key"
+            else:
+                self.envelope[key] = self._value(final)
+        except IncompleteJson:
+            # Re-read the whole member once more text has arrived
+            self._pos = start
+            raise
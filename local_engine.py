@@ -0,0 +1,394 @@
+# Embedded SQLite replica of PO_DATA and TENDER_DATA: periodic, incremental and atomic snapshot
+# refreshes from SQL_ENDPOINT, and local execution of the generated SQL that sql_dialect can translate
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sql_dialect import DATE_COLUMNS, ISO_FORMAT, SQLITE_FUNCTIONS, Untranslatable, translate
+from sql_validator import SCHEMA_CATALOG
+from structured_log import get_logger
+
+
+# How the endpoint renders DATE values: (pattern, style, strptime format); fractional seconds are dropped
+DATE_STYLES = [
+    (re.compile(r"^\d{4}-\d{2}-\d{2}$"), "iso_date", "%Y-%m-%d"),
+    (re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?$"), "iso_t", "%Y-%m-%dT%H:%M:%S"),
+    (re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d+)?$"), "iso_datetime", "%Y-%m-%d %H:%M:%S"),
+    (re.compile(r"^[A-Z][a-z]{2}, \d{2} [A-Z][a-z]{2} \d{4} \d{2}:\d{2}:\d{2} GMT$"), "rfc1123", "%a, %d %b %Y %H:%M:%S GMT"),
+    (re.compile(r"^\d{2}-\d{2}-\d{4}$"), "dmy", "%d-%m-%Y"),
+]
+DATE_STYLE_FORMATS = {style: fmt for _, style, fmt in DATE_STYLES}
+REPLICA_DATE = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$")
+
+
+def fingerprint_sql(table):
+    """Cheap change probe: row count and the sum of a hash of every catalog column"""
+    columns = " || '|' || ".join(
+        f'"{column}"' if not re.match(r"^[A-Z_][A-Z0-9_]*$", column) else column
+        for column in sorted(SCHEMA_CATALOG[table])
+    )
+    return f"SELECT COUNT(*) AS ROW_COUNT, SUM(ORA_HASH({columns})) AS CHECKSUM FROM {table}"
+
+
+def parse_date(value):
+    """Endpoint DATE value -> (replica text, style); raises ValueError for unknown formats"""
+    if value is None or value == "":
+        return None, None
+    text = str(value).strip()
+    for pattern, style, fmt in DATE_STYLES:
+        if pattern.match(text):
+            text = text[:19] if style in ("iso_t", "iso_datetime") else text
+            return datetime.strptime(text, fmt).strftime(ISO_FORMAT), style
+    raise ValueError(f"unrecognized date {text!r}")
+
+
+def _row_hash(values):
+    return hashlib.sha1(json.dumps(values, default=str, separators=(",", ":")).encode("utf-8")).hexdigest()[:24]
+
+
+def _storage_value(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    # Oracle has no empty strings
+    return None if value == "" else value
+
+
+def _output_value(value, date_format):
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str) and REPLICA_DATE.match(value):
+        return datetime.strptime(value, ISO_FORMAT).strftime(date_format)
+    return value
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class LocalEngine:
+    """SQLite replica of the source tables, refreshed in the background, queried through sql_dialect.
+
+    fetch_rows(table) yields the table's rows as dicts; fingerprint(table) returns a token that
+    changes whenever the table does (None when unknown, which forces a download). Each refresh
+    diffs the downloaded rows against the replica by row hash and applies every table's inserts
+    and deletes in one transaction, so readers (WAL mode) never see a half-applied snapshot.
+    """
+
+    def __init__(self, path, fetch_rows, fingerprint=None, tables=("PO_DATA", "TENDER_DATA"),
+                 refresh_seconds=900, timeout_ms=2000, max_table_rows=500000):
+        self.path = path
+        self.fetch_rows = fetch_rows
+        self.fingerprint = fingerprint
+        self.tables = tuple(tables)
+        self.refresh_seconds = refresh_seconds
+        self.timeout_ms = timeout_ms
+        self.max_table_rows = max_table_rows
+        self.version = None
+        self.refreshed_at = None
+        self.checked_at = None
+        self.date_format = DATE_STYLE_FORMATS["iso_date"]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.counters = Counter()
+        self.reasons = Counter()
+        self.last_error = None
+        self._writer = self._open_writer()
+        self._load_metadata()
+
+    # Storage
+
+    def _open_writer(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS __snapshot (table_name TEXT PRIMARY KEY, fingerprint TEXT, columns TEXT, "
+            "date_style TEXT, row_count INTEGER, content_hash TEXT, loaded_at REAL, checked_at REAL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS DUAL (DUMMY TEXT)")
+        if conn.execute("SELECT COUNT(*) FROM DUAL").fetchone()[0] == 0:
+            conn.execute("INSERT INTO DUAL VALUES ('X')")
+        return conn
+
+    def _metadata(self):
+        rows = self._writer.execute(
+            "SELECT table_name, fingerprint, columns, date_style, row_count, content_hash, loaded_at, checked_at "
+            "FROM __snapshot"
+        ).fetchall()
+        return {
+            row[0]: {
+                "fingerprint": row[1], "columns": json.loads(row[2]), "date_style": row[3], "row_count": row[4],
+                "content_hash": row[5], "loaded_at": row[6], "checked_at": row[7],
+            }
+            for row in rows
+        }
+
+    def _load_metadata(self):
+        """Adopt a replica left by an earlier process, so it serves before the first refresh"""
+        metadata = self._metadata()
+        if not all(table in metadata for table in self.tables):
+            return
+        self._set_version(metadata)
+
+    def _set_version(self, metadata):
+        digest = hashlib.sha1()
+        for table in self.tables:
+            digest.update(f"{table}:{metadata[table]['content_hash']};".encode("utf-8"))
+        styles = [metadata[table]["date_style"] for table in self.tables if metadata[table]["date_style"]]
+        with self._lock:
+            self.version = digest.hexdigest()[:16]
+            self.refreshed_at = max(metadata[table]["loaded_at"] for table in self.tables)
+            self.checked_at = min(metadata[table]["checked_at"] for table in self.tables)
+            if styles:
+                self.date_format = DATE_STYLE_FORMATS[styles[0]]
+
+    @property
+    def ready(self):
+        return self.version is not None
+
+    # Refresh
+
+    def _download(self, table):
+        """All rows of table as (hash, values) plus the column list and the endpoint's date style"""
+        columns = None
+        date_style = None
+        rows = []
+        for row in self.fetch_rows(table):
+            if columns is None:
+                columns = list(row)
+            values = []
+            for column in columns:
+                value = _storage_value(row.get(column))
+                if column in DATE_COLUMNS and value is not None:
+                    value, style = parse_date(value)
+                    date_style = date_style or style
+                values.append(value)
+            rows.append((_row_hash(values), values))
+            if len(rows) > self.max_table_rows:
+                raise RuntimeError(f"{table} has more than {self.max_table_rows} rows")
+        if columns is None:
+            raise RuntimeError(f"{table} returned no rows")
+        return columns, date_style, rows
+
+    def _column_types(self, columns, rows):
+        types = []
+        for index, column in enumerate(columns):
+            values = [values[index] for _, values in rows if values[index] is not None]
+            numeric = bool(values) and column not in DATE_COLUMNS and all(
+                isinstance(value, (int, float)) for value in values
+            )
+            types.append("REAL" if numeric else "TEXT")
+        return types
+
+    def _apply(self, table, columns, rows, existing):
+        """Statements of one table's diff (run inside the refresh transaction); returns counts"""
+        conn = self._writer
+        hash_table = _quote(f"__row_hash_{table}")
+        rebuild = existing is None or existing["columns"] != columns
+        if rebuild:
+            conn.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+            conn.execute(f"DROP TABLE IF EXISTS {hash_table}")
+            definitions = ", ".join(f"{_quote(column)} {kind}" for column, kind in zip(columns, self._column_types(columns, rows)))
+            conn.execute(f"CREATE TABLE {_quote(table)} ({definitions})")
+            conn.execute(f"CREATE TABLE {hash_table} (row_id INTEGER PRIMARY KEY, row_hash TEXT)")
+            conn.execute(f"CREATE INDEX {_quote(f'__row_hash_{table}_idx')} ON {hash_table} (row_hash)")
+            current = Counter()
+        else:
+            current = Counter(dict(conn.execute(f"SELECT row_hash, COUNT(*) FROM {hash_table} GROUP BY row_hash")))
+        wanted = Counter(row_hash for row_hash, _ in rows)
+        removed = current - wanted
+        added = wanted - current
+
+        for row_hash, count in removed.items():
+            row_ids = [row_id for row_id, in conn.execute(
+                f"SELECT row_id FROM {hash_table} WHERE row_hash = ? LIMIT ?", (row_hash, count)
+            )]
+            conn.executemany(f"DELETE FROM {_quote(table)} WHERE rowid = ?", [(row_id,) for row_id in row_ids])
+            conn.executemany(f"DELETE FROM {hash_table} WHERE row_id = ?", [(row_id,) for row_id in row_ids])
+
+        insert = f"INSERT INTO {_quote(table)} ({', '.join(_quote(column) for column in columns)}) " \
+                 f"VALUES ({', '.join('?' for _ in columns)})"
+        pending = Counter(added)
+        for row_hash, values in rows:
+            if pending[row_hash] <= 0:
+                continue
+            pending[row_hash] -= 1
+            cursor = conn.execute(insert, values)
+            conn.execute(f"INSERT INTO {hash_table} (row_id, row_hash) VALUES (?, ?)", (cursor.lastrowid, row_hash))
+        return {"inserted": sum(added.values()), "deleted": sum(removed.values()), "rebuilt": rebuild}
+
+    def refresh(self):
+        """Bring the replica up to date; returns per-table changes ({"unchanged": True} when skipped)"""
+        with self._refresh_lock:
+            started = time.time()
+            metadata = self._metadata()
+            downloads = {}
+            fingerprints = {}
+            for table in self.tables:
+                fingerprint = None
+                if self.fingerprint is not None:
+                    try:
+                        fingerprint = self.fingerprint(table)
+                    except Exception as e:
+                        # Without a fingerprint the table is downloaded and diffed anyway
+                        get_logger().warning("local_engine_fingerprint_failed", table=table, error=str(e))
+                fingerprints[table] = fingerprint
+                existing = metadata.get(table)
+                if fingerprint is not None and existing and existing["fingerprint"] == fingerprint:
+                    continue
+                downloads[table] = self._download(table)
+
+            changes = {table: {"unchanged": True} for table in self.tables if table not in downloads}
+            conn = self._writer
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table, (columns, date_style, rows) in downloads.items():
+                    changes[table] = self._apply(table, columns, rows, metadata.get(table))
+                    content_hash = hashlib.sha1("".join(sorted(row_hash for row_hash, _ in rows)).encode("ascii")).hexdigest()
+                    changed = changes[table]["inserted"] or changes[table]["deleted"] or changes[table]["rebuilt"]
+                    loaded_at = started if changed or table not in metadata else metadata[table]["loaded_at"]
+                    conn.execute(
+                        "INSERT OR REPLACE INTO __snapshot VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (table, fingerprints[table], json.dumps(columns), date_style, len(rows), content_hash,
+                         loaded_at, started)
+                    )
+                conn.execute(
+                    f"UPDATE __snapshot SET checked_at = ? WHERE table_name IN ({', '.join('?' for _ in self.tables)})",
+                    (started, *self.tables)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._set_version(self._metadata())
+            self.counters["refreshes"] += 1
+            if any(not change.get("unchanged") for change in changes.values()):
+                self.counters["snapshot_changes"] += 1
+            return changes
+
+    def start(self, delay=0):
+        """Refresh after delay seconds and then every refresh_seconds on a daemon thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(delay,), name="local-engine-refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self, delay):
+        if self._stop.wait(delay):
+            return
+        while True:
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.counters["refresh_errors"] += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                get_logger().error("local_engine_refresh_failed", error=str(e), error_type=type(e).__name__)
+            if self._stop.wait(self.refresh_seconds):
+                return
+
+    def stop(self):
+        self._stop.set()
+
+    # Queries
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            # Oracle LIKE is case-sensitive
+            conn.execute("PRAGMA case_sensitive_like=ON")
+            for name, (arguments, function) in SQLITE_FUNCTIONS.items():
+                conn.create_function(name, arguments, function, deterministic=True)
+            conn.set_progress_handler(lambda: time.perf_counter() > self._local.deadline, 1000)
+            self._local.conn = conn
+        return conn
+
+    def query(self, sql, parameters=()):
+        """Run SQLite SQL against the replica; returns (columns, rows as tuples)"""
+        conn = self._reader()
+        self._local.deadline = time.perf_counter() + self.timeout_ms / 1000
+        cursor = conn.execute(sql, parameters)
+        columns = [description[0] for description in cursor.description or ()]
+        return columns, cursor.fetchall()
+
+    def execute(self, sql, max_rows=None, metrics=None):
+        """Result of Oracle SQL from the replica, or None when it has to go to the endpoint.
+
+        metrics, when given, receives backend="local" and local_ms, or local_fallback with the reason.
+        """
+        metrics = {} if metrics is None else metrics
+        if not self.ready:
+            self.start()
+            return self._fallback("not_ready", metrics)
+        try:
+            sqlite_sql, names = translate(sql)
+        except Untranslatable as e:
+            self.reasons[str(e)] += 1
+            return self._fallback("untranslatable", metrics)
+        started = time.perf_counter()
+        try:
+            conn = self._reader()
+            self._local.deadline = started + self.timeout_ms / 1000
+            cursor = conn.execute(sqlite_sql)
+            rows = cursor.fetchmany(max_rows + 1) if max_rows is not None else cursor.fetchall()
+            columns = [description[0] for description in cursor.description]
+        except sqlite3.OperationalError as e:
+            reason = "timeout" if "interrupted" in str(e) else "error"
+            self.reasons[f"{reason}: {e}"] += 1
+            return self._fallback(reason, metrics)
+        except sqlite3.Error as e:
+            self.reasons[f"error: {e}"] += 1
+            return self._fallback("error", metrics)
+        if names is None or len(names) != len(columns):
+            names = [column.upper() for column in columns]
+        capped = max_rows is not None and len(rows) > max_rows
+        if capped:
+            del rows[max_rows:]
+        date_format = self.date_format
+        result = {
+            "columns": names,
+            "rows": [dict(zip(names, (_output_value(value, date_format) for value in row))) for row in rows],
+        }
+        if capped:
+            result["_row_limit_reached"] = True
+            result["_rows_received"] = len(rows)
+        metrics["backend"] = "local"
+        metrics["local_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        metrics["rows"] = len(rows)
+        self.counters["local"] += 1
+        return result
+
+    def _fallback(self, reason, metrics):
+        metrics["local_fallback"] = reason
+        self.counters[reason] += 1
+        return None
+
+    def snapshot(self):
+        """Version and freshness of the replica (epoch seconds)"""
+        with self._lock:
+            return {"version": self.version, "refreshed_at": self.refreshed_at, "checked_at": self.checked_at}
+
+    def stats(self):
+        stats = {**self.snapshot(), **self.counters, "ready": self.ready}
+        stats["fallback_reasons"] = dict(self.reasons.most_common(10))
+        if self.last_error:
+            stats["last_error"] = self.last_error
+        return stats
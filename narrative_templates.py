@@ -0,0 +1,220 @@
+# Templated markdown answers for trivial result shapes (empty, scalar, a few rows) - skips the LLM
+
+import re
+
+from result_encoding import extract_rows, normalize_number, result_columns, row_values
+from sql_errors import classify_sql_error
+
+
+# Columns stored in Lakhs of rupees
+LAKHS_COLUMNS = {"TOTAL_PO_VALUE", "TOTAL_RECEEVED_VALUE", "TOTAL_PIPELINE_VALUE"}
+# Display names for the common PO_DATA / TENDER_DATA columns
+COLUMN_LABELS = {
+    "PONO": "PO No",
+    "PODATE": "PO Date",
+    "POQTY": "PO Qty",
+    "RECEIVEDQTY": "Received Qty",
+    "SUPPLIERNAME": "Supplier Name",
+    "ITEMNAME": "Item Name",
+    "ITEMCODE": "Item Code",
+    "TENDERCODE": "Tender Code",
+    "TENDERID": "Tender ID",
+    "PO_LAST_DAY": "PO Last Day",
+    "PO_FIN_YEAR": "PO Financial Year",
+    "TOTAL_PO_VALUE": "Total PO Value",
+    "TOTAL_RECEEVED_VALUE": "Total Received Value",
+    "TOTAL_PIPELINE_VALUE": "Total Pipeline Value",
+    "ISEDL2025": "EDL 2025",
+    "ITEM_RC_STATUS": "Item RC Status",
+    "TENDER_RC_STATUS": "Tender RC Status",
+    "ITEM_RC_END_DATE": "Item RC End Date",
+    "ITEM_RC_DAYS_REMAINING": "Item RC Days Remaining",
+}
+ISO_DATE_PATTERN = re.compile(r"^(\d{4})-(\d{2})-(\d{2})(?:[ T]00:00(?::00(?:\.0+)?)?(?:Z|[+-]00:?00)?)?$")
+
+MAX_TABLE_ROWS = 5
+MAX_TABLE_COLUMNS = 8
+MAX_RECORD_COLUMNS = 12
+
+
+def classify_result(sql_result, max_rows=MAX_TABLE_ROWS):
+    """Return "error", "empty", "scalar", "record" or "table" for shapes a template can answer, else None"""
+    if isinstance(sql_result, dict) and "error" in sql_result:
+        return "error"
+    rows = extract_rows(sql_result)
+    if rows is None:
+        return None
+    if isinstance(sql_result, dict) and any(key.startswith("_") for key in sql_result):
+        # Truncated, summarized or paged results need the full analysis
+        return None
+    if not rows:
+        return "empty"
+    columns = result_columns(sql_result, rows)
+    if len(rows) == 1 and len(columns) == 1:
+        return "scalar"
+    if len(rows) == 1 and len(columns) <= MAX_RECORD_COLUMNS:
+        return "record"
+    if len(rows) <= max_rows and len(columns) <= MAX_TABLE_COLUMNS:
+        return "table"
+    return None
+
+
+def column_label(column):
+    """Readable column header with its unit"""
+    upper = column.upper()
+    label = COLUMN_LABELS.get(upper) or column.replace("_", " ").strip().title()
+    unit = column_unit(column)
+    if unit == "lakhs":
+        return f"{label} (₹ Lakhs)" if "lakh" not in label.lower() else label.replace("Lakhs", "(₹ Lakhs)")
+    if unit == "crores":
+        return f"{label} (₹ Crores)" if "crore" not in label.lower() else label.replace("Crores", "(₹ Crores)")
+    return label
+
+
+def column_unit(column):
+    upper = column.upper()
+    if "CRORE" in upper:
+        return "crores"
+    if upper in LAKHS_COLUMNS or "LAKH" in upper or upper.endswith("_VALUE"):
+        return "lakhs"
+    if "PERCENT" in upper or "PCT" in upper or upper.endswith("%"):
+        return "percent"
+    return None
+
+
+def format_value(value, column=None):
+    """Format one cell following the narrative prompt's rules (units, commas, DD-MM-YYYY dates)"""
+    value = normalize_number(value)
+    if value is None or value == "":
+        return "N/A"
+    unit = column_unit(column or "")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if unit == "lakhs":
+            return f"₹{value:,.2f} Lakhs"
+        if unit == "crores":
+            return f"₹{value:,.2f} Crores"
+        if unit == "percent":
+            return f"{value:.2f}%"
+        return f"{value:,}" if isinstance(value, int) else f"{value:,.2f}"
+    text = str(value)
+    match = ISO_DATE_PATTERN.match(text)
+    if match:
+        return f"{match.group(3)}-{match.group(2)}-{match.group(1)}"
+    return text.replace("|", "\\|").replace("\n", " ")
+
+
+def _table_cell(value, column):
+    # Units live in the header, so table cells show the bare number
+    text = format_value(value, column)
+    if column_unit(column) in ("lakhs", "crores"):
+        text = text.replace("₹", "").replace(" Lakhs", "").replace(" Crores", "")
+    return text
+
+
+def empty_reasons(sql_query):
+    """Likely reasons for an empty result, from the filters used in the SQL"""
+    sql = (sql_query or "").upper()
+    reasons = []
+    if "TENDERCODE" in sql:
+        reasons.append("The specified tender code does not exist in the system")
+    if "ITEMNAME" in sql and "LIKE" in sql:
+        reasons.append("The item name may be spelled differently in the records")
+    if "SUPPLIERNAME" in sql and "WHERE" in sql:
+        reasons.append("No POs were issued for the specified supplier")
+    if "RC_STATUS" in sql:
+        reasons.append("No items currently have a rate contract in the requested status")
+    if re.search(r"DATE|SYSDATE|_DAY\b|FIN_YEAR", sql):
+        reasons.append("The specified date range has no matching records")
+    if not reasons:
+        reasons.append("No records match the filters in your question")
+    return reasons
+
+
+def _sentence_case(label):
+    """Lowercase a label for use mid-sentence, keeping acronyms (PO, RC, EDL)"""
+    return " ".join(word if word.isupper() else word.lower() for word in label.split())
+
+
+def render_empty(sql_query):
+    reasons = "\n".join(f"- {reason}" for reason in empty_reasons(sql_query))
+    return f"""## No Data Found
+
+No data found matching your query criteria. This could be because:
+{reasons}
+
+Would you like to broaden the search (for example, remove a filter or expand the date range)?"""
+
+
+def render_error(sql_result):
+    """User-friendly failure message; the raw database error stays in the response data"""
+    code, _ = classify_sql_error(sql_result)
+    if code in ("TRANSPORT", "ORA-01013", "ORA-12170", "ORA-03113", "ORA-03114", "ORA-12541", "ORA-12514"):
+        reason = "The database did not respond in time. Please try again in a moment."
+    elif code == "REJECTED":
+        reason = "The generated query was not a valid read-only query on the purchase order and tender data."
+    else:
+        reason = "The generated query could not be run against the purchase order and tender data, even after automatic corrections."
+    return f"""## Query Could Not Be Completed
+
+I was unable to retrieve data for this question. {reason}
+
+Would you like to:
+- Rephrase the question, naming the item, supplier or tender code explicitly?
+- Narrow the question to purchase orders or to tenders only?"""
+
+
+def render_scalar(column, value):
+    label = COLUMN_LABELS.get(column.upper()) or column.replace("_", " ").strip().title()
+    # "Total_Lakhs" -> "Total": the unit is shown with the value
+    label = re.sub(r"\s*\b(in\s+)?(lakhs?|crores?)\b", "", label, flags=re.IGNORECASE).strip() or "Result"
+    return f"""## {label}
+
+The {_sentence_case(label)} is **{format_value(value, column)}**."""
+
+
+def render_record(columns, values):
+    lines = "\n".join(f"- **{column_label(column)}**: {format_value(value, column)}" for column, value in zip(columns, values))
+    return f"""## Query Result
+
+{lines}"""
+
+
+def render_table(columns, value_rows):
+    header = "| " + " | ".join(f"**{column_label(column)}**" for column in columns) + " |"
+    alignment = "|" + "|".join(":-------------" for _ in columns) + "|"
+    body = "\n".join(
+        "| " + " | ".join(_table_cell(value, column) for column, value in zip(columns, values)) + " |"
+        for values in value_rows
+    )
+    insights = [f"- {len(value_rows)} records match your query"]
+    for index, column in enumerate(columns):
+        if column_unit(column) not in ("lakhs", "crores"):
+            continue
+        numbers = [values[index] for values in value_rows if isinstance(values[index], (int, float))]
+        if numbers:
+            insights.append(f"- Combined {_sentence_case(column_label(column).split(' (')[0])}: **{format_value(sum(numbers), column)}**")
+    insight_lines = "\n".join(insights)
+    return f"""## Query Results
+
+{header}
+{alignment}
+{body}
+
+### Key Insights
+{insight_lines}"""
+
+
+def render_narrative(shape, sql_query, sql_result):
+    """Markdown answer for a shape returned by classify_result"""
+    if shape == "error":
+        return render_error(sql_result)
+    if shape == "empty":
+        return render_empty(sql_query)
+    rows = extract_rows(sql_result)
+    columns = result_columns(sql_result, rows)
+    value_rows = [row_values(row, columns) for row in rows]
+    if shape == "scalar":
+        return render_scalar(columns[0], value_rows[0][0])
+    if shape == "record":
+        return render_record(columns, value_rows[0])
+    return render_table(columns, value_rows)
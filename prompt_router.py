@@ -0,0 +1,70 @@
+# Local keyword router that picks which SQL prompt sections a question needs
+
+import re
+from functools import lru_cache
+
+from prompts import SQL_PROMPT_SECTIONS
+
+
+# Section kinds sent for each route ("full" sends the whole original prompt)
+ROUTE_SECTIONS = {
+    "po": ("core", "po"),
+    "tender": ("core", "tender"),
+    "financial": ("core", "po", "financial"),
+    "join": ("core", "po", "tender", "join"),
+    "full": ("core", "po", "tender", "join", "financial"),
+}
+
+TENDER_PATTERN = re.compile(
+    r"\b(tenders?|re-?tender\w*|rate contracts?|rcs?|bids?|bidders?|cover[\s-]*[abc]|edl|essential|"
+    r"participation|tendercode|price bid|tec|single[\s-]vendor|disqualified)\b",
+    re.IGNORECASE
+)
+PO_PATTERN = re.compile(
+    r"\b(pos?|purchase orders?|suppliers?|vendors?|received|receipts?|pipeline|supply|supplied|supplies|"
+    r"delivery|delivered|inward|mrc|extensions?|extended|timel(?:y|iness)|overdue|ordered|quantity|qty|"
+    r"awarded|ved|shortages?|stock\w*)\b",
+    re.IGNORECASE
+)
+FINANCIAL_PATTERN = re.compile(
+    r"(\b(value|values|lakhs?|crores?|amount|rupees|inr|cost|spend|spent|worth)\b|\b(rates?|prices?)\b(?!\s+(contract|bid))|₹)",
+    re.IGNORECASE
+)
+# Topics whose rules/limitations are spread across several sections
+FULL_PATTERN = re.compile(r"\b(qc|nsq|quality|batch(?:es)?|escalation|transition|gap)\b", re.IGNORECASE)
+RC_EXPIRY_PATTERN = re.compile(r"\b(rc|rate contract)s?\b.*\b(expir\w*|valid\w*)\b|\bexpir\w*\b.*\b(rc|rate contract)s?\b", re.IGNORECASE)
+ITEM_REFERENCE_PATTERN = re.compile(r"\b(for|of)\s+(the\s+)?items?\s+\w", re.IGNORECASE)
+
+
+def route_sql_prompt(user_query):
+    """Classify a question as po / tender / financial / join / full"""
+    text = user_query or ""
+    if FULL_PATTERN.search(text):
+        return "full"
+
+    # Generic words ("supply", "vendor") also appear in tender questions; only count
+    # PO signals that remain once tender vocabulary is removed
+    tender = bool(TENDER_PATTERN.search(text))
+    po = bool(PO_PATTERN.search(TENDER_PATTERN.sub(" ", text)))
+    financial = bool(FINANCIAL_PATTERN.search(text))
+    explicit_tender = re.search(r"\btenders?\b", text, re.IGNORECASE) is not None
+
+    # RC expiry for an item without tender context joins PO_DATA with TENDER_DATA
+    if RC_EXPIRY_PATTERN.search(text) and not explicit_tender and (po or ITEM_REFERENCE_PATTERN.search(text)):
+        return "join"
+    if tender and (po or financial):
+        return "full" if financial else "join"
+    if tender:
+        return "tender"
+    if financial:
+        return "financial"
+    if po:
+        return "po"
+    return "full"
+
+
+@lru_cache(maxsize=None)
+def build_sql_prompt(route):
+    """Assemble (and cache) the SQL generation preamble for a route"""
+    kinds = ROUTE_SECTIONS.get(route, ROUTE_SECTIONS["full"])
+    return "".join(text for kind, text in SQL_PROMPT_SECTIONS if kind in kinds)
@@ -0,0 +1,145 @@
+# Compact encodings of SQL results for LLM prompts (column names once, no indentation)
+
+import csv
+import io
+import json
+import math
+
+
+ROW_KEYS = ("rows", "data", "results")
+
+ENCODING_DESCRIPTIONS = {
+    "columnar": 'columnar JSON: "columns" lists the column names once and each entry of "rows" is an array of values in that order',
+    "csv": "CSV: the first line is the header with column names, each following line is one row",
+    "tsv": "TSV (tab-separated): the first line is the header with column names, each following line is one row",
+}
+
+
+def extract_rows(sql_result):
+    """Return the row list inside a SQL result (rows/data/results/bare list), or None"""
+    if isinstance(sql_result, list):
+        return sql_result
+    if isinstance(sql_result, dict) and "error" not in sql_result:
+        for key in ROW_KEYS:
+            if key in sql_result:
+                rows = sql_result[key]
+                return rows if isinstance(rows, list) else None
+    return None
+
+
+# Approximate memory of one parsed row (dict or list object) and of each cell (slot plus boxed value)
+ROW_OVERHEAD_BYTES = 120
+CELL_BYTES = 80
+
+
+def estimate_result_bytes(sql_result):
+    """Memory held by a parsed result, estimated from its row and column counts (nothing is serialized)"""
+    rows = extract_rows(sql_result)
+    if not rows:
+        return 1024
+    first = rows[0]
+    if isinstance(sql_result, dict) and isinstance(sql_result.get("columns"), list):
+        columns = len(sql_result["columns"])
+    else:
+        columns = len(first) if isinstance(first, (dict, list, tuple)) else 1
+    return 1024 + len(rows) * (ROW_OVERHEAD_BYTES + columns * CELL_BYTES)
+
+
+def replace_rows(sql_result, rows):
+    """Copy of sql_result with its row list replaced, keeping the original shape"""
+    if isinstance(sql_result, dict):
+        for key in ROW_KEYS:
+            if key in sql_result:
+                replaced = sql_result.copy()
+                replaced[key] = rows
+                return replaced
+    return rows
+
+
+def result_metadata(sql_result):
+    """Non-row keys of a dict-shaped result (e.g. _truncated, _total_rows)"""
+    if not isinstance(sql_result, dict):
+        return {}
+    row_key = next((key for key in ROW_KEYS if key in sql_result), None)
+    return {key: value for key, value in sql_result.items() if key not in (row_key, "columns")}
+
+
+def result_columns(sql_result, rows=None):
+    """Column names in first-seen order (explicit "columns", dict keys, or a single "value")"""
+    if rows is None:
+        rows = extract_rows(sql_result) or []
+    if isinstance(sql_result, dict) and isinstance(sql_result.get("columns"), list):
+        return [str(column) for column in sql_result["columns"]]
+    columns = []
+    seen = set()
+    for row in rows:
+        if isinstance(row, dict):
+            for key in row:
+                if key not in seen:
+                    seen.add(key)
+                    columns.append(key)
+        elif isinstance(row, (list, tuple)):
+            for index in range(len(columns), len(row)):
+                columns.append(f"col{index + 1}")
+    if not columns and rows:
+        columns = ["value"]
+    return columns
+
+
+def normalize_number(value):
+    """Drop float noise: integral floats become ints, others keep at most 4 decimals"""
+    if isinstance(value, bool) or not isinstance(value, float):
+        return value
+    if math.isnan(value) or math.isinf(value):
+        return None
+    if value.is_integer():
+        return int(value)
+    return round(value, 4)
+
+
+def row_values(row, columns):
+    """Values of one row in column order"""
+    if isinstance(row, dict):
+        return [normalize_number(row.get(column)) for column in columns]
+    if isinstance(row, (list, tuple)):
+        return [normalize_number(value) for value in row]
+    return [normalize_number(row)]
+
+
+def encode_row(row, columns, fmt="columnar"):
+    """Encode a single row the way encode_sql_result would (used for budget accounting)"""
+    values = row_values(row, columns)
+    if fmt == "columnar":
+        return json.dumps(values, separators=(",", ":"), ensure_ascii=False, default=str)
+    return _delimited([values], fmt)
+
+
+def _delimited(value_rows, fmt):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter="\t" if fmt == "tsv" else ",", lineterminator="\n")
+    for values in value_rows:
+        writer.writerow(["" if value is None else value for value in values])
+    return buffer.getvalue()
+
+
+def encode_sql_result(sql_result, fmt="columnar"):
+    """Encode a SQL result compactly as columnar JSON, CSV or TSV"""
+    rows = extract_rows(sql_result)
+    if rows is None:
+        # Errors and unrecognized shapes: plain compact JSON
+        return json.dumps(sql_result, separators=(",", ":"), ensure_ascii=False, default=str)
+
+    columns = result_columns(sql_result, rows)
+    metadata = result_metadata(sql_result)
+    if fmt == "columnar":
+        encoded = {"columns": columns, "rows": [row_values(row, columns) for row in rows]}
+        encoded.update(metadata)
+        return json.dumps(encoded, separators=(",", ":"), ensure_ascii=False, default=str)
+
+    lines = "".join(f"# {key}: {value}\n" for key, value in metadata.items())
+    return lines + _delimited([columns], fmt) + _delimited((row_values(row, columns) for row in rows), fmt)
+
+
+def describe_encoding(fmt="columnar"):
+    """One-line description of the encoding for the prompt"""
+    return ENCODING_DESCRIPTIONS.get(fmt, ENCODING_DESCRIPTIONS["columnar"])
@@ -0,0 +1,75 @@
+# Result cursors: the response carries one page of rows and a result_id; later pages are served
+# from a local TTL store, or by re-running the SQL for just that page once the entry is gone
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import zlib
+
+from cache import LRUCache
+from result_encoding import estimate_result_bytes
+
+
+class InvalidCursor(Exception):
+    """A result_id that was not issued by this service (or was altered)"""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class ResultStore:
+    """Rows of recent results by result_id, bounded by entries, bytes and TTL.
+
+    The result_id is a signed, compressed copy of the cursor state (SQL, offset, page size, total),
+    so any instance can serve later pages by re-running the SQL, even after eviction or a restart.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=256 * 1024 * 1024, ttl_seconds=900, secret=None):
+        self.memory = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds, max_bytes=max_bytes)
+        # Without a shared secret, result_ids only verify on the instance that issued them
+        self.secret = (secret or "").encode("utf-8") or os.urandom(32)
+        self.reruns = 0
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()[:16]
+
+    def create(self, sql, rows, complete, page_size, offset=0, total_rows=None, template=None):
+        """Store the fetched rows; returns the result_id.
+
+        complete is False when the database has rows beyond the fetched ones. template is the
+        result without its rows (e.g. {"columns": [...]}) that pages are built from.
+        """
+        state = {"sql": sql, "offset": offset, "page_size": page_size, "total_rows": total_rows}
+        payload = zlib.compress(json.dumps(state, separators=(",", ":")).encode("utf-8"))
+        signature = self._sign(payload)
+        result_id = f"{_b64encode(signature)}.{_b64encode(payload)}"
+        self.memory.set(signature, (rows, complete, template or {}), size=estimate_result_bytes(rows))
+        return result_id
+
+    def open(self, result_id):
+        """Return (state, entry); entry is (rows, complete, template), or None once expired or evicted"""
+        try:
+            signature_text, payload_text = result_id.split(".", 1)
+            signature = _b64decode(signature_text)
+            payload = _b64decode(payload_text)
+        except (AttributeError, ValueError):
+            raise InvalidCursor("malformed result_id")
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidCursor("result_id signature mismatch")
+        state = json.loads(zlib.decompress(payload))
+        return state, self.memory.get(signature)
+
+    def record_rerun(self):
+        self.reruns += 1
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats["reruns"] = self.reruns
+        return stats
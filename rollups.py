@@ -0,0 +1,983 @@
+# Materialized rollups of the most asked procurement aggregates, rebuilt on a schedule or when the
+# source snapshot changes, and a matcher that answers the SQL they cover without touching the tables
+
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from decimal import ROUND_CEILING, ROUND_DOWN, ROUND_FLOOR, ROUND_HALF_UP, Decimal, InvalidOperation, localcontext
+from functools import lru_cache
+
+from result_encoding import extract_rows, result_columns
+from sql_dialect import output_names
+from sql_validator import RC_EXPIRY_BUCKET, tokenize
+from structured_log import get_logger
+
+
+class NotCovered(Exception):
+    """SQL the rollups cannot answer exactly (it runs against the tables as usual)"""
+
+
+class Rollup:
+    """GROUP BY of one table: dimensions and measures are (name, Oracle expression) pairs.
+
+    SUM and COUNT measures re-aggregate to any coarser grouping of the dimensions (MIN and MAX too);
+    other measures, such as COUNT(DISTINCT ...), only answer queries grouped by exactly these dimensions.
+    """
+
+    def __init__(self, name, table, dimensions, measures):
+        self.name = name
+        self.table = table
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+        self.columns = [name for name, _ in self.dimensions + self.measures]
+        self.dimension_index = {parse_expression(expression): position for position, (_, expression) in enumerate(self.dimensions)}
+        self.measure_index = {
+            parse_expression(expression): len(self.dimensions) + position
+            for position, (_, expression) in enumerate(self.measures)
+        }
+
+    def sql(self):
+        select = ", ".join(f"{expression} AS {name}" for name, expression in self.dimensions + self.measures)
+        group_by = ", ".join(expression for _, expression in self.dimensions)
+        return f"SELECT {select} FROM {self.table} GROUP BY {group_by}"
+
+
+# Parsing: Oracle SQL -> nested tuples, so equal expressions compare equal whatever their spelling
+
+AGGREGATES = {"SUM", "COUNT", "AVG", "MIN", "MAX"}
+SCALAR_FUNCTIONS = {"ROUND", "TRUNC", "NVL", "COALESCE", "NULLIF", "ABS", "CEIL", "FLOOR", "UPPER", "LOWER", "TRIM"}
+COMPARISONS = {"=", "!=", "<>", "<", ">", "<=", ">="}
+RESERVED = {
+    "SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "BY", "FETCH", "OFFSET", "AND", "OR", "NOT", "IS",
+    "IN", "LIKE", "BETWEEN", "CASE", "WHEN", "THEN", "ELSE", "END", "AS", "ASC", "DESC", "NULLS", "JOIN", "ON",
+    "UNION", "INTERSECT", "MINUS", "CONNECT", "START", "WITH", "INNER", "LEFT", "RIGHT", "FULL", "CROSS",
+}
+
+
+class _Parser:
+    def __init__(self, sql):
+        tokens = tokenize(sql)
+        if any(kind == "other" for kind, _ in tokens):
+            raise NotCovered("unsupported character")
+        self.tokens = [(kind, text) for kind, text in tokens if kind not in ("space", "comment")]
+        self.position = 0
+        self.qualifiers = set()
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        return self.tokens[position] if position < len(self.tokens) else ("", "")
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def at(self, *words):
+        kind, text = self.peek()
+        return kind == "word" and text.upper() in words
+
+    def accept(self, *words):
+        if self.at(*words):
+            return self.next()[1].upper()
+        return None
+
+    def expect(self, text):
+        kind, token = self.next()
+        if token.upper() != text:
+            raise NotCovered(f"expected {text}")
+
+    def integer(self):
+        kind, text = self.next()
+        if kind != "number" or "." in text:
+            raise NotCovered("expected an integer")
+        return int(text)
+
+    # Expressions, by Oracle precedence: OR < AND < NOT < comparison < + - || < * / < unary
+
+    def expression(self):
+        node = self.conjunction()
+        while self.accept("OR"):
+            node = ("or", node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.accept("AND"):
+            node = ("and", node, self.negation())
+        return node
+
+    def negation(self):
+        if self.accept("NOT"):
+            return ("not", self.negation())
+        return self.predicate()
+
+    def predicate(self):
+        node = self.additive()
+        kind, text = self.peek()
+        if text in COMPARISONS:
+            self.next()
+            return ("cmp", "!=" if text == "<>" else text, node, self.additive())
+        if self.accept("IS"):
+            negated = bool(self.accept("NOT"))
+            self.expect("NULL")
+            return ("is_null", node, negated)
+        negated = bool(self.accept("NOT"))
+        if self.accept("IN"):
+            self.expect("(")
+            if self.at("SELECT"):
+                raise NotCovered("subquery")
+            items = [self.additive()]
+            while self.peek()[1] == ",":
+                self.next()
+                items.append(self.additive())
+            self.expect(")")
+            return ("in", node, tuple(items), negated)
+        if self.accept("BETWEEN"):
+            low = self.additive()
+            self.expect("AND")
+            return ("between", node, low, self.additive(), negated)
+        if self.accept("LIKE"):
+            pattern = self.additive()
+            if self.at("ESCAPE"):
+                raise NotCovered("LIKE ... ESCAPE")
+            return ("like", node, pattern, negated)
+        if negated:
+            raise NotCovered("NOT without IN, BETWEEN or LIKE")
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while self.peek()[1] in ("+", "-", "||"):
+            operator = self.next()[1]
+            node = ("op", operator, node, self.multiplicative())
+        return node
+
+    def multiplicative(self):
+        node = self.unary()
+        while self.peek()[1] in ("*", "/"):
+            operator = self.next()[1]
+            node = ("op", operator, node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek()[1] == "-":
+            self.next()
+            return ("neg", self.unary())
+        if self.peek()[1] == "+":
+            self.next()
+            return self.unary()
+        return self.primary()
+
+    def primary(self):
+        kind, text = self.next()
+        if kind == "number":
+            return ("num", Decimal(text))
+        if kind == "string":
+            value = text[1:-1].replace("''", "'")
+            # Oracle has no empty strings
+            return ("str", value) if value else ("null",)
+        if text == "(":
+            if self.at("SELECT"):
+                raise NotCovered("subquery")
+            node = self.expression()
+            self.expect(")")
+            return node
+        if kind == "quoted":
+            return ("col", text[1:-1])
+        if kind != "word":
+            raise NotCovered(f"unexpected {text!r}")
+        word = text.upper()
+        if word == "NULL":
+            return ("null",)
+        if word == "CASE":
+            return self.case()
+        if word in RESERVED:
+            raise NotCovered(f"unexpected {word}")
+        if self.peek()[1] == "(":
+            self.next()
+            return self.call(word)
+        if self.peek()[1] == ".":
+            self.next()
+            column_kind, column = self.next()
+            if column_kind not in ("word", "quoted"):
+                raise NotCovered("qualified *")
+            self.qualifiers.add(word)
+            return ("col", column[1:-1] if column_kind == "quoted" else column.upper())
+        if self.peek()[0] in ("string", "number"):
+            raise NotCovered(f"typed literal {word}")
+        return ("col", word)
+
+    def call(self, name):
+        distinct = bool(self.accept("DISTINCT"))
+        self.accept("ALL")
+        if self.peek()[1] == "*":
+            self.next()
+            self.expect(")")
+            return ("call", name, distinct, (("star",),))
+        arguments = []
+        if self.peek()[1] != ")":
+            arguments.append(self.expression())
+            while self.peek()[1] == ",":
+                self.next()
+                arguments.append(self.expression())
+        self.expect(")")
+        return ("call", name, distinct, tuple(arguments))
+
+    def case(self):
+        operand = None if self.at("WHEN") else self.expression()
+        branches = []
+        while self.accept("WHEN"):
+            condition = self.expression()
+            self.expect("THEN")
+            branches.append((condition, self.expression()))
+        default = self.expression() if self.accept("ELSE") else ("null",)
+        self.expect("END")
+        if not branches:
+            raise NotCovered("CASE without WHEN")
+        return ("case", operand, tuple(branches), default)
+
+    # Statement
+
+    def alias(self):
+        if self.accept("AS"):
+            kind, text = self.next()
+        elif self.peek()[0] == "quoted" or (self.peek()[0] == "word" and self.peek()[1].upper() not in RESERVED):
+            kind, text = self.next()
+        else:
+            return None
+        if kind not in ("word", "quoted"):
+            raise NotCovered("alias")
+        return text[1:-1] if kind == "quoted" else text.upper()
+
+    def statement(self):
+        self.expect("SELECT")
+        distinct = self.accept("DISTINCT", "UNIQUE", "ALL") in ("DISTINCT", "UNIQUE")
+        items = []
+        while True:
+            if self.peek()[1] == "*":
+                raise NotCovered("SELECT *")
+            node = self.expression()
+            items.append((node, self.alias()))
+            if self.peek()[1] != ",":
+                break
+            self.next()
+        self.expect("FROM")
+        kind, table = self.next()
+        if kind != "word":
+            raise NotCovered("FROM is not a table")
+        table = table.upper()
+        alias = self.alias()
+        if self.qualifiers - {table, alias}:
+            raise NotCovered("unknown qualifier")
+        plan = {
+            "distinct": distinct, "items": items, "table": table, "where": None, "group_by": [],
+            "having": None, "order_by": [], "offset": 0, "fetch": None,
+        }
+        if self.accept("WHERE"):
+            plan["where"] = self.expression()
+        if self.accept("GROUP"):
+            self.expect("BY")
+            plan["group_by"].append(self.expression())
+            while self.peek()[1] == ",":
+                self.next()
+                plan["group_by"].append(self.expression())
+        if self.accept("HAVING"):
+            plan["having"] = self.expression()
+        if self.accept("ORDER"):
+            self.expect("BY")
+            while True:
+                node = self.expression()
+                descending = self.accept("ASC", "DESC") == "DESC"
+                nulls_first = descending
+                if self.accept("NULLS"):
+                    nulls_first = self.accept("FIRST", "LAST") == "FIRST"
+                plan["order_by"].append((node, descending, nulls_first))
+                if self.peek()[1] != ",":
+                    break
+                self.next()
+        if self.accept("OFFSET"):
+            plan["offset"] = self.integer()
+            if not self.accept("ROW", "ROWS"):
+                raise NotCovered("OFFSET without ROWS")
+        if self.accept("FETCH"):
+            if not self.accept("FIRST", "NEXT"):
+                raise NotCovered("FETCH")
+            plan["fetch"] = self.integer()
+            if not self.accept("ROW", "ROWS") or not self.accept("ONLY"):
+                raise NotCovered("FETCH ... WITH TIES or PERCENT")
+        if self.peek()[1] == ";":
+            self.next()
+        if self.position != len(self.tokens):
+            raise NotCovered(f"unsupported clause at {self.peek()[1]!r}")
+        if self.qualifiers - {table, alias}:
+            raise NotCovered("unknown qualifier")
+        return plan
+
+
+def parse_expression(expression):
+    parser = _Parser(expression)
+    node = parser.expression()
+    if parser.position != len(parser.tokens):
+        raise NotCovered(f"trailing {parser.peek()[1]!r}")
+    return node
+
+
+@lru_cache(maxsize=1024)
+def plan_query(sql):
+    """Parsed single-table SELECT with Oracle's output labels, or the reason it cannot be (a string)"""
+    try:
+        plan = _Parser(sql).statement()
+    except NotCovered as e:
+        return str(e)
+    names = output_names(tokenize(sql))
+    if names is None or len(names) != len(plan["items"]):
+        return "output names"
+    plan["names"] = names
+    return plan
+
+
+# Evaluation over rollup rows, with Oracle's NULL, rounding and comparison semantics
+
+def _number(value):
+    if value is None or isinstance(value, Decimal):
+        return value
+    if isinstance(value, bool):
+        return Decimal(int(value))
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    raise NotCovered("non-numeric operand")
+
+
+def _stored(value):
+    """Rollup cell from a database value: numbers as Decimal, text as is"""
+    if isinstance(value, (bool, int, float)):
+        return _number(value)
+    if value == "":
+        return None
+    return value
+
+
+def _cells(row, columns, names):
+    """Values of the named columns from a dict or positional result row"""
+    if isinstance(row, dict):
+        row = {str(key).upper(): value for key, value in row.items()}
+        return [row.get(name) for name in names]
+    return [row[columns.index(name)] if columns.index(name) < len(row) else None for name in names]
+
+
+def _output(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _comparable(left, right):
+    if isinstance(left, Decimal) and isinstance(right, Decimal):
+        return left, right
+    if isinstance(left, str) and isinstance(right, str):
+        return left, right
+    # Oracle would convert implicitly, and may raise; leave that to the database
+    raise NotCovered("mixed-type comparison")
+
+
+def _compare(operator, left, right):
+    if left is None or right is None:
+        return None
+    left, right = _comparable(left, right)
+    return {
+        "=": left == right, "!=": left != right, "<": left < right,
+        ">": left > right, "<=": left <= right, ">=": left >= right,
+    }[operator]
+
+
+def _like(value, pattern):
+    if value is None or pattern is None:
+        return None
+    if not isinstance(value, str) or not isinstance(pattern, str):
+        raise NotCovered("LIKE on a number")
+    regex = "".join(".*" if char == "%" else "." if char == "_" else re.escape(char) for char in pattern)
+    return re.fullmatch(regex, value, re.DOTALL) is not None
+
+
+def _not(value):
+    return None if value is None else not value
+
+
+def _round(value, places, rounding):
+    if value is None or places is None:
+        return None
+    places = int(places)
+    return value.quantize(Decimal(1).scaleb(-places), rounding=rounding)
+
+
+def _scalar(name, values):
+    if name in ("NVL", "COALESCE"):
+        return next((value for value in values if value is not None), None)
+    if name == "NULLIF":
+        return None if _compare("=", values[0], values[1]) else values[0]
+    if values[0] is None:
+        return None
+    if name in ("UPPER", "LOWER", "TRIM"):
+        if not isinstance(values[0], str):
+            raise NotCovered(f"{name} of a number")
+        text = values[0].upper() if name == "UPPER" else values[0].lower() if name == "LOWER" else values[0].strip(" ")
+        return text or None
+    number = _number(values[0])
+    if name in ("ROUND", "TRUNC"):
+        places = _number(values[1]) if len(values) > 1 else Decimal(0)
+        return _round(number, places, ROUND_HALF_UP if name == "ROUND" else ROUND_DOWN)
+    if name == "ABS":
+        return abs(number)
+    if name == "CEIL":
+        return number.to_integral_value(rounding=ROUND_CEILING)
+    return number.to_integral_value(rounding=ROUND_FLOOR)
+
+
+ARITY = {
+    "ROUND": (1, 2), "TRUNC": (1, 2), "NVL": (2, 2), "COALESCE": (1, 99), "NULLIF": (2, 2),
+    "ABS": (1, 1), "CEIL": (1, 1), "FLOOR": (1, 1), "UPPER": (1, 1), "LOWER": (1, 1), "TRIM": (1, 1),
+}
+
+
+def evaluate(node, leaf):
+    """Value of an expression; leaf(node) returns the value of dimensions and aggregates, else _EXPAND"""
+    value = leaf(node)
+    if value is not _EXPAND:
+        return value
+    kind = node[0]
+    if kind == "num":
+        return node[1]
+    if kind == "str":
+        return node[1]
+    if kind == "null":
+        return None
+    if kind == "and":
+        left, right = evaluate(node[1], leaf), evaluate(node[2], leaf)
+        if left is False or right is False:
+            return False
+        return None if left is None or right is None else True
+    if kind == "or":
+        left, right = evaluate(node[1], leaf), evaluate(node[2], leaf)
+        if left is True or right is True:
+            return True
+        return None if left is None or right is None else False
+    if kind == "not":
+        return _not(evaluate(node[1], leaf))
+    if kind == "cmp":
+        return _compare(node[1], evaluate(node[2], leaf), evaluate(node[3], leaf))
+    if kind == "is_null":
+        return (evaluate(node[1], leaf) is None) != node[2]
+    if kind == "in":
+        value = evaluate(node[1], leaf)
+        matches = [_compare("=", value, evaluate(item, leaf)) for item in node[2]]
+        found = True if True in matches else None if None in matches else False
+        return _not(found) if node[3] else found
+    if kind == "between":
+        value = evaluate(node[1], leaf)
+        low = _compare(">=", value, evaluate(node[2], leaf))
+        high = _compare("<=", value, evaluate(node[3], leaf))
+        inside = False if low is False or high is False else None if low is None or high is None else True
+        return _not(inside) if node[4] else inside
+    if kind == "like":
+        matched = _like(evaluate(node[1], leaf), evaluate(node[2], leaf))
+        return _not(matched) if node[3] else matched
+    if kind == "neg":
+        value = _number(evaluate(node[1], leaf))
+        return None if value is None else -value
+    if kind == "op":
+        left, right = evaluate(node[2], leaf), evaluate(node[3], leaf)
+        if node[1] == "||":
+            if not all(value is None or isinstance(value, str) for value in (left, right)):
+                raise NotCovered("|| of a number")
+            return ((left or "") + (right or "")) or None
+        left, right = _number(left), _number(right)
+        if left is None or right is None:
+            return None
+        with localcontext() as context:
+            # Oracle NUMBER precision
+            context.prec = 38
+            try:
+                if node[1] == "+":
+                    return left + right
+                if node[1] == "-":
+                    return left - right
+                if node[1] == "*":
+                    return left * right
+                return left / right
+            except (ArithmeticError, InvalidOperation):
+                raise NotCovered("division by zero")
+    if kind == "case":
+        operand = evaluate(node[1], leaf) if node[1] is not None else None
+        for condition, result in node[2]:
+            if node[1] is not None:
+                matched = _compare("=", operand, evaluate(condition, leaf))
+            else:
+                matched = evaluate(condition, leaf)
+            if matched is True:
+                return evaluate(result, leaf)
+        return evaluate(node[3], leaf)
+    if kind == "call":
+        return _scalar(node[1], [evaluate(argument, leaf) for argument in node[3]])
+    raise NotCovered(f"unsupported {kind}")
+
+
+_EXPAND = object()
+
+
+def _children(node):
+    kind = node[0]
+    if kind in ("num", "str", "null", "col", "star"):
+        return ()
+    if kind == "cmp":
+        return node[2:]
+    if kind == "op":
+        return node[2:]
+    if kind == "in":
+        return (node[1],) + node[2]
+    if kind in ("is_null", "like", "between"):
+        return tuple(child for child in node[1:] if isinstance(child, tuple))
+    if kind == "case":
+        branches = tuple(part for branch in node[2] for part in branch)
+        return ((node[1],) if node[1] is not None else ()) + branches + (node[3],)
+    if kind == "call":
+        return node[3]
+    return node[1:]
+
+
+class _Answer:
+    """One query evaluated against one rollup; raises NotCovered when the rollup cannot answer it"""
+
+    def __init__(self, plan, rollup):
+        self.plan = plan
+        self.rollup = rollup
+        self.group_keys = {node: position for position, node in enumerate(plan["group_by"])}
+        self.aggregated = bool(plan["group_by"]) or any(self._has_aggregate(node) for node, _ in plan["items"]) \
+            or plan["having"] is not None
+        # Measures that do not re-aggregate need one rollup row per group
+        self.exact_grain = set(plan["group_by"]) == set(rollup.dimension_index)
+        self.aggregates = {}
+
+    def _has_aggregate(self, node):
+        if node[0] == "call" and node[1] in AGGREGATES:
+            return True
+        return any(self._has_aggregate(child) for child in _children(node))
+
+    # Static coverage checks
+
+    def check_row(self, node):
+        """node only reads dimensions (row level)"""
+        if node in self.rollup.dimension_index:
+            return
+        if node[0] == "col":
+            raise NotCovered(f"{node[1]} is not a dimension of {self.rollup.name}")
+        if node[0] == "call":
+            if node[1] in AGGREGATES:
+                raise NotCovered("aggregate at row level")
+            self._check_function(node)
+        for child in _children(node):
+            self.check_row(child)
+
+    def check_group(self, node):
+        """node is a function of the group keys and aggregates"""
+        if node in self.group_keys:
+            return
+        if node[0] == "call" and node[1] in AGGREGATES:
+            self.aggregates[node] = self._aggregate(node)
+            return
+        if node[0] == "col" or node in self.rollup.dimension_index:
+            raise NotCovered("column outside GROUP BY")
+        if node[0] == "call":
+            self._check_function(node)
+        for child in _children(node):
+            self.check_group(child)
+
+    def _check_function(self, node):
+        if node[1] not in SCALAR_FUNCTIONS or node[2]:
+            raise NotCovered(f"function {node[1]}")
+        low, high = ARITY[node[1]]
+        if not low <= len(node[3]) <= high:
+            raise NotCovered(f"{node[1]} arity")
+
+    def _aggregate(self, node):
+        """How an aggregate is computed from the rollup rows: (kind, column or expression)"""
+        name, distinct, arguments = node[1], node[2], node[3]
+        if node in self.rollup.measure_index:
+            position = self.rollup.measure_index[node]
+            if name in ("SUM", "COUNT") and not distinct:
+                return ("sum", position, name == "COUNT")
+            if name in ("MIN", "MAX"):
+                return (name.lower(), position)
+            if self.exact_grain:
+                return ("single", position)
+            raise NotCovered(f"{self.rollup.name} only has {name}{'(DISTINCT)' if distinct else ''} at its own grain")
+        if len(arguments) != 1:
+            raise NotCovered("aggregate arity")
+        argument = arguments[0]
+        if name == "AVG" and not distinct:
+            total = self.rollup.measure_index.get(("call", "SUM", False, arguments))
+            count = self.rollup.measure_index.get(("call", "COUNT", False, arguments))
+            if total is None or count is None:
+                raise NotCovered("AVG without SUM and COUNT measures")
+            return ("avg", total, count)
+        if argument == ("star",):
+            raise NotCovered("COUNT(*) is not a measure")
+        # Aggregates of the dimensions themselves are exact over the rollup rows
+        self.check_row(argument)
+        if name in ("MIN", "MAX"):
+            return (name.lower() + "_of", argument)
+        if name == "COUNT" and distinct:
+            return ("distinct_of", argument)
+        if name == "COUNT":
+            rows = self.rollup.measure_index.get(("call", "COUNT", False, (("star",),)))
+            if rows is None:
+                raise NotCovered("COUNT without a COUNT(*) measure")
+            return ("count_of", argument, rows)
+        raise NotCovered(f"{name} of a dimension")
+
+    def check(self):
+        plan = self.plan
+        if plan["table"] != self.rollup.table:
+            raise NotCovered("table")
+        if plan["where"] is not None:
+            self.check_row(plan["where"])
+        if not self.aggregated:
+            # Rollup rows stand for many base rows; only a DISTINCT projection of dimensions is exact
+            if not plan["distinct"]:
+                raise NotCovered("row-level query")
+            for node, _ in plan["items"]:
+                self.check_row(node)
+        else:
+            for node in plan["group_by"]:
+                self.check_row(node)
+            for node, _ in plan["items"]:
+                self.check_group(node)
+            if plan["having"] is not None:
+                self.check_group(plan["having"])
+        self.order_keys = [self._order_key(*item) for item in plan["order_by"]]
+
+    def _order_key(self, node, descending, nulls_first):
+        """(node, select list position or None, descending, nulls_first) for an ORDER BY item"""
+        items = self.plan["items"]
+        if node[0] == "num":
+            position = int(node[1]) - 1
+            if not 0 <= position < len(items):
+                raise NotCovered("ORDER BY position")
+        elif node[0] == "col" and node[1] in [alias for _, alias in items]:
+            position = [alias for _, alias in items].index(node[1])
+        else:
+            position = next((index for index, (item, _) in enumerate(items) if item == node), None)
+        if position is None:
+            if not self.aggregated:
+                raise NotCovered("ORDER BY outside the DISTINCT select list")
+            self.check_group(node)
+        return node, position, descending, nulls_first
+
+    # Evaluation
+
+    def _aggregate_value(self, spec, rows):
+        kind = spec[0]
+        if kind == "sum":
+            values = [row[spec[1]] for row in rows if row[spec[1]] is not None]
+            if not values:
+                return Decimal(0) if spec[2] else None
+            with localcontext() as context:
+                context.prec = 38
+                return sum(values, Decimal(0))
+        if kind == "single":
+            return rows[0][spec[1]] if rows else None
+        if kind == "avg":
+            total = self._aggregate_value(("sum", spec[1], False), rows)
+            count = self._aggregate_value(("sum", spec[2], True), rows)
+            if total is None or not count:
+                return None
+            with localcontext() as context:
+                context.prec = 38
+                return total / count
+        if kind in ("min", "max"):
+            values = [row[spec[1]] for row in rows if row[spec[1]] is not None]
+        elif kind == "count_of":
+            return sum(
+                (row[spec[2]] for row in rows if evaluate(spec[1], self._row_leaf(row)) is not None), Decimal(0)
+            )
+        else:
+            values = [evaluate(spec[1], self._row_leaf(row)) for row in rows]
+            values = [value for value in values if value is not None]
+            if kind == "distinct_of":
+                return Decimal(len(set(values)))
+        if not values:
+            return None
+        if len({type(value) for value in values}) > 1:
+            raise NotCovered("mixed-type MIN/MAX")
+        return min(values) if kind.startswith("min") else max(values)
+
+    def _row_leaf(self, row):
+        dimension_index = self.rollup.dimension_index
+
+        def leaf(node):
+            position = dimension_index.get(node)
+            return row[position] if position is not None else _EXPAND
+        return leaf
+
+    def _group_leaf(self, key, rows, values):
+        def leaf(node):
+            position = self.group_keys.get(node)
+            if position is not None:
+                return key[position]
+            if node in self.aggregates:
+                if node not in values:
+                    values[node] = self._aggregate_value(self.aggregates[node], rows)
+                return values[node]
+            return _EXPAND
+        return leaf
+
+    def rows(self, source_rows):
+        """[(output values, leaf for ORDER BY expressions)] before ordering"""
+        plan = self.plan
+        if plan["where"] is not None:
+            source_rows = [row for row in source_rows if evaluate(plan["where"], self._row_leaf(row)) is True]
+        if not self.aggregated:
+            output, seen = [], set()
+            for row in source_rows:
+                leaf = self._row_leaf(row)
+                values = tuple(evaluate(node, leaf) for node, _ in plan["items"])
+                if values not in seen:
+                    seen.add(values)
+                    output.append((values, None))
+            return output
+        groups = {}
+        for row in source_rows:
+            leaf = self._row_leaf(row)
+            groups.setdefault(tuple(evaluate(node, leaf) for node in plan["group_by"]), []).append(row)
+        if not plan["group_by"] and not groups:
+            # An aggregate without GROUP BY returns one row even over no rows
+            groups[()] = []
+        output = []
+        for key, rows in groups.items():
+            leaf = self._group_leaf(key, rows, {})
+            if plan["having"] is not None and evaluate(plan["having"], leaf) is not True:
+                continue
+            output.append((tuple(evaluate(node, leaf) for node, _ in plan["items"]), leaf))
+        if plan["distinct"]:
+            unique, seen = [], set()
+            for values, leaf in output:
+                if values not in seen:
+                    seen.add(values)
+                    unique.append((values, leaf))
+            output = unique
+        return output
+
+    def order(self, output):
+        # Stable sorts from the last key to the first; NULLs sort high unless NULLS says otherwise
+        for node, position, descending, nulls_first in reversed(self.order_keys):
+            def sort_key(entry, node=node, position=position, null_high=(nulls_first == descending)):
+                value = entry[0][position] if position is not None else evaluate(node, entry[1])
+                return ((value is None) == null_high, value if value is not None else 0)
+            try:
+                output.sort(key=sort_key, reverse=descending)
+            except TypeError:
+                raise NotCovered("mixed-type ORDER BY")
+        return output
+
+    def result(self, source_rows):
+        plan = self.plan
+        output = self.order(self.rows(source_rows))
+        end = plan["offset"] + plan["fetch"] if plan["fetch"] is not None else None
+        names = plan["names"]
+        return {
+            "columns": names,
+            "rows": [dict(zip(names, (_output(value) for value in values))) for values, _ in output[plan["offset"]:end]],
+        }
+
+
+PO_VALUE_MEASURES = [
+    ("PO_LINES", "COUNT(*)"),
+    ("PO_VALUE", "SUM(TOTAL_PO_VALUE)"),
+    ("RECEIVED_VALUE", "SUM(TOTAL_RECEEVED_VALUE)"),
+    ("PIPELINE_VALUE", "SUM(TOTAL_PIPELINE_VALUE)"),
+]
+
+# Smallest first: a question is answered from the first rollup that covers it
+ROLLUPS = [
+    Rollup("po_by_status", "PO_DATA", [("STATUS", "STATUS")], PO_VALUE_MEASURES + [
+        ("PO_COUNT", "COUNT(DISTINCT PONO)"),
+        ("ITEM_COUNT", "COUNT(DISTINCT ITEMCODE)"),
+        ("SUPPLIER_COUNT", "COUNT(DISTINCT SUPPLIERNAME)"),
+    ]),
+    Rollup("rc_expiry_buckets", "TENDER_DATA", [("RC_EXPIRY_BUCKET", RC_EXPIRY_BUCKET)], [
+        ("ITEM_ROWS", "COUNT(*)"),
+        ("ITEM_COUNT", "COUNT(DISTINCT ITEMCODE)"),
+        ("TENDER_COUNT", "COUNT(DISTINCT TENDERCODE)"),
+    ]),
+    Rollup("po_by_supplier", "PO_DATA", [("SUPPLIERNAME", "SUPPLIERNAME")], PO_VALUE_MEASURES + [
+        ("PO_COUNT", "COUNT(DISTINCT PONO)"),
+        ("ITEM_COUNT", "COUNT(DISTINCT ITEMCODE)"),
+    ]),
+    Rollup("bid_participation", "TENDER_DATA", [("TENDERCODE", "TENDERCODE")], [
+        ("ITEM_ROWS", "COUNT(*)"),
+        ("ITEM_COUNT", "COUNT(DISTINCT ITEMCODE)"),
+        ("COVER_A_BIDS", "SUM(BID_FOUND_IN_COVER_A)"),
+        ("COVER_B_BIDS", "SUM(BID_FOUND_IN_COVER_B)"),
+        ("COVER_C_BIDS", "SUM(BID_FOUND_IN_COVER_C)"),
+        ("ITEMS_WITHOUT_BIDS", "SUM(CASE WHEN NVL(BID_FOUND_IN_COVER_A, 0) = 0 THEN 1 ELSE 0 END)"),
+    ]),
+    Rollup("po_monthly", "PO_DATA", [
+        ("PO_MONTH", "TO_CHAR(PODATE, 'YYYY-MM')"),
+        ("PO_FIN_YEAR", "PO_FIN_YEAR"),
+        ("STATUS", "STATUS"),
+        ("SUPPLIERNAME", "SUPPLIERNAME"),
+    ], PO_VALUE_MEASURES + [
+        ("PONO_ROWS", "COUNT(PONO)"),
+        ("PO_VALUE_ROWS", "COUNT(TOTAL_PO_VALUE)"),
+        ("PO_QTY", "SUM(POQTY)"),
+        ("RECEIVED_QTY", "SUM(RECEIVEDQTY)"),
+        ("PIPELINE_QTY", "SUM(PIPELINE_QTY)"),
+    ]),
+]
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds") if timestamp else None
+
+
+class RollupStore:
+    """In-memory rollups, rebuilt together in the background and matched against the SQL of each request.
+
+    execute(sql) returns a SQL result; snapshot() returns (version, as_of) of the data it reads, where
+    as_of is when that data was last confirmed current (epoch seconds, None for "now"). A rollup set
+    built from another version, or older than twice refresh_seconds, is not served.
+    """
+
+    def __init__(self, execute, snapshot=None, rollups=ROLLUPS, refresh_seconds=900, poll_seconds=30, max_rows=50000):
+        self.execute = execute
+        self.snapshot = snapshot or (lambda: ("", None))
+        self.rollups = list(rollups)
+        self.refresh_seconds = refresh_seconds
+        self.poll_seconds = poll_seconds
+        self.max_rows = max_rows
+        self.built = None
+        self.counters = Counter()
+        self.hits = Counter()
+        self.reasons = Counter()
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def refresh(self):
+        """Rebuild every rollup from the current data; returns {name: row count}"""
+        with self._refresh_lock:
+            version, as_of = self.snapshot()
+            started = time.time()
+            tables = {}
+            for rollup in self.rollups:
+                sql_result = self.execute(rollup.sql())
+                rows = extract_rows(sql_result)
+                if rows is None:
+                    raise RuntimeError(f"rollup {rollup.name}: no rows in the result")
+                if len(rows) > self.max_rows or (isinstance(sql_result, dict) and sql_result.get("_row_limit_reached")):
+                    raise RuntimeError(f"rollup {rollup.name}: more than {self.max_rows} groups")
+                columns = [str(column).upper() for column in result_columns(sql_result, rows)]
+                missing = set(rollup.columns) - set(columns)
+                if missing:
+                    raise RuntimeError(f"rollup {rollup.name}: missing columns {sorted(missing)}")
+                tables[rollup.name] = [
+                    tuple(_stored(value) for value in _cells(row, columns, rollup.columns)) for row in rows
+                ]
+            built = {
+                "tables": tables,
+                "version": version,
+                "built_at": started,
+                "data_as_of": as_of or started,
+            }
+            with self._lock:
+                self.built = built
+            self.counters["refreshes"] += 1
+            return {name: len(rows) for name, rows in tables.items()}
+
+    def start(self):
+        """Keep the rollups current on a daemon thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="rollup-refresh", daemon=True)
+            self._thread.start()
+
+    def _due(self):
+        built = self.built
+        if built is None:
+            return True
+        return self.snapshot()[0] != built["version"] or time.time() - built["built_at"] >= self.refresh_seconds
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._due():
+                    self.refresh()
+                    self.last_error = None
+            except Exception as e:
+                self.counters["refresh_errors"] += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                get_logger().error("rollup_refresh_failed", error=str(e), error_type=type(e).__name__)
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _miss(self, reason):
+        self.reasons[reason] += 1
+        self.counters["misses"] += 1
+        return None
+
+    def answer(self, sql, max_rows=None):
+        """(result, freshness) when a rollup covers the SQL, else None"""
+        built = self.built
+        if built is None:
+            self.start()
+            return self._miss("not_ready")
+        if self.snapshot()[0] != built["version"] or time.time() - built["built_at"] > 2 * self.refresh_seconds:
+            self.start()
+            self._wake.set()
+            return self._miss("stale")
+        plan = plan_query(sql)
+        if isinstance(plan, str):
+            return self._miss("not_covered")
+        for rollup in self.rollups:
+            if rollup.table != plan["table"]:
+                continue
+            answer = _Answer(plan, rollup)
+            try:
+                answer.check()
+                result = answer.result(built["tables"][rollup.name])
+            except NotCovered:
+                continue
+            if max_rows and len(result["rows"]) > max_rows:
+                return self._miss("too_many_rows")
+            self.hits[rollup.name] += 1
+            self.counters["hits"] += 1
+            freshness = {
+                "name": rollup.name,
+                "built_at": _iso(built["built_at"]),
+                "data_as_of": _iso(built["data_as_of"]),
+                "age_seconds": round(time.time() - built["data_as_of"], 1),
+            }
+            return result, freshness
+        return self._miss("not_covered")
+
+    def stats(self):
+        built = self.built
+        stats = {**self.counters, "hits_by_rollup": dict(self.hits), "miss_reasons": dict(self.reasons)}
+        if built is not None:
+            stats["built_at"] = _iso(built["built_at"])
+            stats["data_as_of"] = _iso(built["data_as_of"])
+            stats["rows"] = {name: len(rows) for name, rows in built["tables"].items()}
+        if self.last_error:
+            stats["last_error"] = self.last_error
+        return stats
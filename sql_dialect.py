@@ -0,0 +1,845 @@
+# Oracle -> SQLite translation of generated SQL for the local replica (local_engine.py).
+# Only constructs whose SQLite meaning matches Oracle are translated; anything else raises
+# Untranslatable and the query goes to SQL_ENDPOINT unchanged.
+
+import calendar
+import math
+import re
+from datetime import datetime
+from functools import lru_cache
+
+from sql_validator import ALL_COLUMNS, SCHEMA_CATALOG, tokenize
+
+
+# PO_DATA DATE columns; the replica stores them as 'YYYY-MM-DD HH:MM:SS' text
+DATE_COLUMNS = {"PODATE", "PO_LAST_DAY", "EXTENDED_UP_TO_DATE", "LAST_MRC_DATE", "MIN_MRC_DATE"}
+# TENDER_DATA dates are 'DD-MM-YYYY' strings and only become dates through TO_DATE
+TEXT_DATE_COLUMNS = {column for column in SCHEMA_CATALOG["TENDER_DATA"] if column.endswith("_DATE")}
+TABLES = set(SCHEMA_CATALOG) | {"DUAL"}
+
+KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "GROUP", "BY", "HAVING", "ORDER", "ASC", "DESC", "NULLS", "FIRST", "LAST",
+    "AND", "OR", "NOT", "IN", "IS", "LIKE", "ESCAPE", "BETWEEN", "EXISTS", "AS", "ON", "USING", "JOIN",
+    "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "NATURAL", "UNION", "ALL", "INTERSECT", "MINUS",
+    "EXCEPT", "DISTINCT", "UNIQUE", "CASE", "WHEN", "THEN", "ELSE", "END", "WITH", "OVER", "PARTITION",
+    "ROWS", "ROW", "RANGE", "PRECEDING", "FOLLOWING", "UNBOUNDED", "CURRENT", "FETCH", "NEXT", "ONLY",
+    "OFFSET", "LIMIT",
+}
+# Oracle features without a faithful SQLite equivalent. ROWID passes through to SQLite's rowid: the
+# values differ, but it identifies each replica row, which is all the paging order key needs
+UNSUPPORTED = {
+    "ROWNUM", "CONNECT", "PRIOR", "LEVEL", "START", "SIBLINGS", "PIVOT", "UNPIVOT", "MODEL",
+    "SAMPLE", "INTERVAL", "SYSTIMESTAMP", "LOCALTIMESTAMP", "CURRENT_TIMESTAMP", "ANY",
+    "SOME", "TIES", "PERCENT", "WITHIN", "KEEP", "RIGHT", "FULL", "NATURAL", "LATERAL", "APPLY",
+}
+AGGREGATES = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
+# Same name and meaning in both dialects -> result type (None: type of the first argument)
+SAME_FUNCTIONS = {
+    "ROUND": "number", "ABS": "number", "UPPER": "text", "LOWER": "text", "LENGTH": "number",
+    "TRIM": "text", "LTRIM": "text", "RTRIM": "text", "REPLACE": "text", "NULLIF": None, "COALESCE": None,
+    "ROW_NUMBER": "number", "RANK": "number", "DENSE_RANK": "number", "NTILE": "number", "LAG": None,
+    "LEAD": None, "FIRST_VALUE": None, "LAST_VALUE": None,
+    # Registered on every replica connection (see SQLITE_FUNCTIONS)
+    "CEIL": "number", "FLOOR": "number", "MOD": "number", "POWER": "number", "SQRT": "number",
+    "SIGN": "number",
+}
+COMPARISONS = {"=", "!=", "<>", "<", ">", "<=", ">="}
+SET_OPERATORS = {"UNION", "INTERSECT", "EXCEPT"}
+TRUNC_UNITS = {
+    "DD": "start of day", "DDD": "start of day", "J": "start of day",
+    "MM": "start of month", "MON": "start of month", "MONTH": "start of month",
+    "YYYY": "start of year", "YEAR": "start of year", "Y": "start of year", "YY": "start of year",
+}
+EXTRACT_FIELDS = {"YEAR": "%Y", "MONTH": "%m", "DAY": "%d", "HOUR": "%H", "MINUTE": "%M", "SECOND": "%S"}
+DATE_FORMAT_PATTERN = re.compile(r"YYYY|HH24|MONTH|MON|MI|SS|MM|DD|DY|YY|Q|[-/.,: ]", re.IGNORECASE)
+ISO_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class Untranslatable(Exception):
+    """SQL the replica cannot run with Oracle semantics"""
+
+
+class _Expr:
+    """A translated operand: SQLite text, value type and the bare columns it references outside aggregates"""
+
+    __slots__ = ("sql", "dtype", "columns", "aggregate", "ident")
+
+    def __init__(self, sql, dtype=None, columns=frozenset(), aggregate=False, ident=None):
+        self.sql = sql
+        self.dtype = dtype
+        self.columns = columns
+        self.aggregate = aggregate
+        self.ident = ident
+
+
+def _is_word(item, *words):
+    return isinstance(item, tuple) and item[0] == "word" and (not words or item[1] in words)
+
+
+def _is_op(item, *ops):
+    return isinstance(item, tuple) and item[0] == "op" and (not ops or item[1] in ops)
+
+
+def _sql(items):
+    return " ".join(item.sql if isinstance(item, _Expr) else item[1] for item in items)
+
+
+def _normalized(items):
+    return re.sub(r"\s+", "", _sql(items)).upper()
+
+
+def _split(items, separator=","):
+    parts = [[]]
+    for item in items:
+        if _is_op(item, separator):
+            parts.append([])
+        else:
+            parts[-1].append(item)
+    return parts
+
+
+def _matching_paren(tokens, start):
+    depth = 0
+    for position in range(start, len(tokens)):
+        if tokens[position][1] == "(":
+            depth += 1
+        elif tokens[position][1] == ")":
+            depth -= 1
+            if depth == 0:
+                return position
+    raise Untranslatable("unbalanced parentheses")
+
+
+def _split_arguments(tokens):
+    arguments = [[]]
+    depth = 0
+    for kind, text in tokens:
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif text == "," and depth == 0:
+            arguments.append([])
+            continue
+        arguments[-1].append((kind, text))
+    return arguments if tokens else []
+
+
+def _string_value(item):
+    if isinstance(item, _Expr) and item.dtype == "text" and item.sql.startswith("'"):
+        return item.sql[1:-1].replace("''", "'")
+    return None
+
+
+# Oracle date formats (TO_DATE / TO_CHAR)
+
+@lru_cache(maxsize=64)
+def date_format_tokens(fmt):
+    """Oracle datetime format model -> tokens; raises Untranslatable for unsupported elements"""
+    tokens = []
+    position = 0
+    for match in DATE_FORMAT_PATTERN.finditer(fmt):
+        if match.start() != position:
+            raise Untranslatable(f"date format {fmt!r}")
+        tokens.append(match.group())
+        position = match.end()
+    if position != len(fmt) or not tokens:
+        raise Untranslatable(f"date format {fmt!r}")
+    return tuple(tokens)
+
+
+def _strptime_format(fmt):
+    mapping = {"YYYY": "%Y", "MM": "%m", "DD": "%d", "HH24": "%H", "MI": "%M", "SS": "%S", "MON": "%b"}
+    parts = []
+    for token in date_format_tokens(fmt):
+        if token.upper() in mapping:
+            parts.append(mapping[token.upper()])
+        elif len(token) == 1 and not token.isalpha():
+            parts.append(token)
+        else:
+            raise Untranslatable(f"TO_DATE format {fmt!r}")
+    return "".join(parts)
+
+
+def ora_to_date(value, fmt):
+    """TO_DATE: parse value with an Oracle format model into replica date text (raises like Oracle)"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    return datetime.strptime(value, _strptime_format(fmt)).strftime(ISO_FORMAT)
+
+
+def ora_to_char(value, fmt=None):
+    """TO_CHAR of a replica date (with a format) or a number (without one)"""
+    if value is None:
+        return None
+    if fmt is None:
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+    moment = datetime.strptime(value, ISO_FORMAT)
+    parts = []
+    for token in date_format_tokens(fmt):
+        upper = token.upper()
+        if upper == "YYYY":
+            part = f"{moment.year:04d}"
+        elif upper == "YY":
+            part = f"{moment.year % 100:02d}"
+        elif upper == "MM":
+            part = f"{moment.month:02d}"
+        elif upper == "DD":
+            part = f"{moment.day:02d}"
+        elif upper == "HH24":
+            part = f"{moment.hour:02d}"
+        elif upper == "MI":
+            part = f"{moment.minute:02d}"
+        elif upper == "SS":
+            part = f"{moment.second:02d}"
+        elif upper == "Q":
+            part = str((moment.month - 1) // 3 + 1)
+        elif upper in ("MON", "MONTH", "DY"):
+            if upper == "MON":
+                part = calendar.month_abbr[moment.month]
+            elif upper == "MONTH":
+                # Oracle pads month names to the longest one unless FM is given
+                part = calendar.month_name[moment.month].ljust(9)
+            else:
+                part = calendar.day_abbr[moment.weekday()]
+            # The case of the format element decides the case of the name
+            if token.isupper():
+                part = part.upper()
+            elif token.islower():
+                part = part.lower()
+        else:
+            part = token
+        parts.append(part)
+    return "".join(parts)
+
+
+def ora_add_months(value, months):
+    """ADD_MONTHS: month-end dates stay at month end, other days are clamped to the target month"""
+    if value is None or months is None:
+        return None
+    moment = datetime.strptime(value, ISO_FORMAT)
+    index = moment.year * 12 + moment.month - 1 + int(months)
+    year, month = divmod(index, 12)
+    last_day = calendar.monthrange(year, month + 1)[1]
+    day = last_day if moment.day == calendar.monthrange(moment.year, moment.month)[1] else min(moment.day, last_day)
+    return moment.replace(year=year, month=month + 1, day=day).strftime(ISO_FORMAT)
+
+
+def ora_last_day(value):
+    if value is None:
+        return None
+    moment = datetime.strptime(value, ISO_FORMAT)
+    return moment.replace(day=calendar.monthrange(moment.year, moment.month)[1]).strftime(ISO_FORMAT)
+
+
+def ora_months_between(first, second):
+    """MONTHS_BETWEEN with Oracle's whole-month rule for equal days and month ends (31-day months otherwise)"""
+    if first is None or second is None:
+        return None
+    a = datetime.strptime(first, ISO_FORMAT)
+    b = datetime.strptime(second, ISO_FORMAT)
+    months = (a.year - b.year) * 12 + (a.month - b.month)
+    a_last = a.day == calendar.monthrange(a.year, a.month)[1]
+    b_last = b.day == calendar.monthrange(b.year, b.month)[1]
+    if a.day == b.day or (a_last and b_last):
+        return float(months)
+    a_seconds = a.day * 86400 + a.hour * 3600 + a.minute * 60 + a.second
+    b_seconds = b.day * 86400 + b.hour * 3600 + b.minute * 60 + b.second
+    return months + (a_seconds - b_seconds) / (31 * 86400)
+
+
+def ora_to_number(value):
+    """TO_NUMBER: invalid text raises (ORA-01722) instead of becoming 0 as a SQLite CAST would"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    text = str(value).strip()
+    if not text:
+        return None
+    number = float(text)
+    return int(number) if number.is_integer() and "." not in text and "e" not in text.lower() else number
+
+
+def ora_trunc(value, digits=0):
+    if value is None or digits is None:
+        return None
+    scale = 10 ** int(digits)
+    return math.trunc(value * scale) / scale if digits else math.trunc(value)
+
+
+def _numeric(function):
+    def wrapper(*args):
+        if any(arg is None for arg in args):
+            return None
+        return function(*args)
+    return wrapper
+
+
+def _ora_mod(a, b):
+    # Oracle MOD keeps the sign of the dividend, and MOD(a, 0) is a
+    return a if b == 0 else math.fmod(a, b)
+
+
+# Python implementations registered on every replica connection: name -> (argument count, function)
+SQLITE_FUNCTIONS = {
+    "ORA_TO_DATE": (2, ora_to_date),
+    "ORA_TO_CHAR": (-1, ora_to_char),
+    "ORA_ADD_MONTHS": (2, ora_add_months),
+    "ORA_LAST_DAY": (1, ora_last_day),
+    "ORA_MONTHS_BETWEEN": (2, ora_months_between),
+    "ORA_TO_NUMBER": (1, ora_to_number),
+    "ORA_TRUNC": (-1, ora_trunc),
+    "CEIL": (1, _numeric(math.ceil)),
+    "FLOOR": (1, _numeric(math.floor)),
+    "MOD": (2, _numeric(_ora_mod)),
+    "POWER": (2, _numeric(math.pow)),
+    "SQRT": (1, _numeric(math.sqrt)),
+    "SIGN": (1, _numeric(lambda value: (value > 0) - (value < 0))),
+}
+
+
+class _Translator:
+    def __init__(self, date_aliases=frozenset()):
+        self.date_aliases = date_aliases
+        self.found_date_aliases = set()
+
+    # Tokens -> items
+
+    def level(self, tokens):
+        """Translate the tokens of one parenthesis level into items (_Expr operands, ("word"|"op", text))"""
+        items = []
+        position = 0
+        count = len(tokens)
+        while position < count:
+            kind, text = tokens[position]
+            upper = text.upper()
+            following = tokens[position + 1] if position + 1 < count else ("", "")
+            if kind == "word":
+                if upper in UNSUPPORTED:
+                    raise Untranslatable(upper)
+                if upper in ("OFFSET", "FETCH"):
+                    position = self._row_limit(tokens, position, items)
+                    continue
+                if following[1] == "(" and upper not in KEYWORDS:
+                    end = _matching_paren(tokens, position + 1)
+                    window = end + 1 < count and tokens[end + 1][1].upper() == "OVER"
+                    items.append(self._call(upper, tokens[position + 2:end], window))
+                    position = end + 1
+                    continue
+                if upper in ("DATE", "TIMESTAMP") and following[0] == "string":
+                    literal = following[1][1:-1]
+                    try:
+                        value = datetime.fromisoformat(literal.strip())
+                    except ValueError:
+                        raise Untranslatable(f"{upper} literal {literal!r}")
+                    items.append(_Expr(f"'{value.strftime(ISO_FORMAT)}'", "date"))
+                    position += 2
+                    continue
+                if upper in ("Q", "N", "NQ") and following[0] == "string":
+                    raise Untranslatable("alternative quoting")
+                if upper in ("SYSDATE", "CURRENT_DATE"):
+                    # Autonomous Database runs in UTC, as does SQLite's 'now'
+                    items.append(_Expr("datetime('now')", "date"))
+                elif upper == "NULL":
+                    items.append(_Expr("NULL"))
+                elif upper == "MINUS":
+                    items.append(("word", "EXCEPT"))
+                elif upper in KEYWORDS:
+                    items.append(("word", upper))
+                else:
+                    position = self._identifier(tokens, position, items)
+                    continue
+            elif kind == "quoted":
+                position = self._identifier(tokens, position, items)
+                continue
+            elif kind == "number":
+                items.append(_Expr(text, "number"))
+            elif kind == "string":
+                # Oracle treats '' as NULL
+                items.append(_Expr("NULL") if text == "''" else _Expr(text, "text"))
+            elif text == "(":
+                end = _matching_paren(tokens, position)
+                if tokens[position + 1:end] == [("op", "+")]:
+                    raise Untranslatable("(+) outer join")
+                items.append(self._group(self.level(tokens[position + 1:end])))
+                position = end + 1
+                continue
+            elif text == ";":
+                if position != count - 1:
+                    raise Untranslatable("multiple statements")
+            elif kind == "op" and text != ")":
+                items.append(("op", text))
+            else:
+                raise Untranslatable(f"token {text!r}")
+            position += 1
+        return self._finish(items)
+
+    def _identifier(self, tokens, position, items):
+        parts = [tokens[position]]
+        position += 1
+        while (position + 1 < len(tokens) and tokens[position][1] == "."
+               and (tokens[position + 1][0] in ("word", "quoted") or tokens[position + 1][1] == "*")):
+            parts.append(tokens[position + 1])
+            position += 2
+        if len(parts) > 2 or (len(parts) == 2 and parts[1][1].upper() in TABLES):
+            raise Untranslatable("schema-qualified name")
+        kind, name = parts[-1]
+        bare = name.strip('"') if kind == "quoted" else name.upper()
+        if bare in DATE_COLUMNS or (len(parts) == 1 and bare in self.date_aliases):
+            dtype = "date"
+        elif bare in TEXT_DATE_COLUMNS:
+            dtype = "text"
+        elif bare in ALL_COLUMNS:
+            dtype = "number"
+        else:
+            dtype = None
+        columns = frozenset({bare}) if bare in ALL_COLUMNS else frozenset()
+        sql = ".".join(text for _, text in parts)
+        items.append(_Expr(sql, dtype, columns, ident=bare if name != "*" else None))
+        return position
+
+    def _row_limit(self, tokens, position, items):
+        """OFFSET n ROWS / FETCH FIRST|NEXT n ROWS ONLY -> LIMIT n OFFSET m"""
+        words = [text.upper() for _, text in tokens[position:position + 8]]
+
+        def number_at(index):
+            if position + index < len(tokens) and tokens[position + index][0] == "number":
+                return tokens[position + index][1]
+            return None
+
+        offset = None
+        if words[0] == "OFFSET":
+            offset = number_at(1)
+            if offset is None or len(words) < 3 or words[2] not in ("ROW", "ROWS"):
+                raise Untranslatable("OFFSET clause")
+            position += 3
+            words = words[3:]
+        limit = "-1"
+        if words and words[0] == "FETCH":
+            if len(words) < 2 or words[1] not in ("FIRST", "NEXT"):
+                raise Untranslatable("FETCH clause")
+            value = number_at(2)
+            rest = words[3:5] if value is not None else words[2:4]
+            if rest not in (["ROWS", "ONLY"], ["ROW", "ONLY"]):
+                raise Untranslatable("FETCH clause")
+            limit = value if value is not None else "1"
+            position += 5 if value is not None else 4
+        items.extend([("word", "LIMIT"), _Expr(limit, "number")])
+        if offset is not None:
+            items.extend([("word", "OFFSET"), _Expr(offset, "number")])
+        return position
+
+    def _group(self, inner):
+        if len(inner) == 1 and isinstance(inner[0], _Expr):
+            expr = inner[0]
+            return _Expr(f"({expr.sql})", expr.dtype, expr.columns, expr.aggregate)
+        if inner and (_is_word(inner[0], "SELECT", "WITH")):
+            # Subquery: its columns belong to its own scope
+            return _Expr(f"({_sql(inner)})")
+        operands = [item for item in inner if isinstance(item, _Expr)]
+        arithmetic = all(isinstance(item, _Expr) or _is_op(item, "+", "-", "*", "* 1.0 /") for item in inner)
+        numeric = arithmetic and all(item.dtype == "number" for item in operands)
+        return _Expr(
+            f"({_sql(inner)})",
+            "number" if numeric else None,
+            frozenset().union(*(item.columns for item in operands)),
+            any(item.aggregate for item in operands)
+        )
+
+    # Functions
+
+    def _call(self, name, argument_tokens, window):
+        arguments = [self.level(tokens) for tokens in _split_arguments(argument_tokens)]
+        if any(not argument for argument in arguments):
+            raise Untranslatable(f"empty argument to {name}")
+        texts = [_sql(argument) for argument in arguments]
+        singles = [argument[0] if len(argument) == 1 and isinstance(argument[0], _Expr) else None
+                   for argument in arguments]
+        dtypes = [single.dtype if single is not None else None for single in singles]
+        operands = [item for argument in arguments for item in argument if isinstance(item, _Expr)]
+        columns = frozenset().union(*(item.columns for item in operands))
+        aggregate = any(item.aggregate for item in operands)
+
+        def expr(sql, dtype, is_aggregate=False):
+            if is_aggregate:
+                return _Expr(sql, dtype, frozenset(), True)
+            return _Expr(sql, dtype, columns, aggregate)
+
+        def require(condition, detail):
+            if not condition:
+                raise Untranslatable(f"{name}: {detail}")
+
+        if any(_is_word(item, "FROM", "LEADING", "TRAILING", "BOTH") for argument in arguments for item in argument) \
+                and name != "EXTRACT":
+            raise Untranslatable(f"{name} syntax")
+
+        if name in AGGREGATES:
+            value_types = [item.dtype for item in arguments[0] if isinstance(item, _Expr)] if arguments else []
+            require(len(arguments) == 1, "arguments")
+            if name in ("SUM", "AVG"):
+                require("date" not in value_types and "text" not in value_types, "non-numeric argument")
+            dtype = (value_types[-1] if value_types else None) if name in ("MIN", "MAX") else "number"
+            if window:
+                return _Expr(f"{name}({texts[0]})", dtype)
+            return expr(f"{name}({texts[0]})", dtype, is_aggregate=True)
+        if name in SAME_FUNCTIONS:
+            if name in ("ROUND", "ABS", "CEIL", "FLOOR", "MOD", "POWER", "SQRT", "SIGN"):
+                require(all(dtype not in ("date", "text") for dtype in dtypes), "non-numeric argument")
+            dtype = SAME_FUNCTIONS[name] if SAME_FUNCTIONS[name] or not dtypes else dtypes[0]
+            if window:
+                return _Expr(f"{name}({', '.join(texts)})", dtype)
+            return expr(f"{name}({', '.join(texts)})", dtype)
+        if name in ("NVL", "GREATEST", "LEAST"):
+            require(len(arguments) >= 2 and (name != "NVL" or len(arguments) == 2), "arguments")
+            sqlite_name = {"NVL": "IFNULL", "GREATEST": "MAX", "LEAST": "MIN"}[name]
+            return expr(f"{sqlite_name}({', '.join(texts)})", dtypes[0])
+        if name == "NVL2":
+            require(len(arguments) == 3, "arguments")
+            return expr(f"(CASE WHEN {texts[0]} IS NOT NULL THEN {texts[1]} ELSE {texts[2]} END)", dtypes[1])
+        if name == "DECODE":
+            require(len(arguments) >= 3, "arguments")
+            # DECODE matches NULL to NULL, which is SQLite's IS
+            whens = " ".join(
+                f"WHEN ({texts[0]}) IS ({texts[index]}) THEN {texts[index + 1]}"
+                for index in range(1, len(arguments) - 1, 2)
+            )
+            default = f" ELSE {texts[-1]}" if len(arguments) % 2 == 0 else ""
+            return expr(f"(CASE {whens}{default} END)", dtypes[2])
+        if name == "CONCAT":
+            require(len(arguments) == 2 and "date" not in dtypes, "arguments")
+            return expr(f"(IFNULL({texts[0]}, '') || IFNULL({texts[1]}, ''))", "text")
+        if name == "SUBSTR":
+            require(len(arguments) in (2, 3) and dtypes[0] != "date", "arguments")
+            start = singles[1]
+            sign = 1
+            if start is None and len(arguments[1]) == 2 and _is_op(arguments[1][0], "-"):
+                start, sign = arguments[1][1], -1
+            # Oracle treats a start of 0 as 1; SQLite does not, so only literal starts are taken
+            require(isinstance(start, _Expr) and start.dtype == "number" and start.sql.isdigit(), "start position")
+            start_sql = "1" if start.sql == "0" else ("-" if sign < 0 else "") + start.sql
+            return expr(f"SUBSTR({', '.join([texts[0], start_sql] + texts[2:])})", "text")
+        if name == "INSTR":
+            require(len(arguments) == 2, "arguments")
+            return expr(f"INSTR({texts[0]}, {texts[1]})", "number")
+        if name == "TO_NUMBER":
+            require(len(arguments) == 1, "format")
+            return expr(f"ORA_TO_NUMBER({texts[0]})", "number")
+        if name == "TO_DATE":
+            require(len(arguments) == 2 and _string_value(singles[1]) is not None, "format")
+            fmt = _string_value(singles[1])
+            _strptime_format(fmt)
+            literal = _string_value(singles[0])
+            if literal is not None:
+                try:
+                    return _Expr(f"'{ora_to_date(literal, fmt)}'", "date")
+                except ValueError:
+                    raise Untranslatable(f"TO_DATE literal {literal!r}")
+            require(dtypes[0] != "date", "date argument")
+            return expr(f"ORA_TO_DATE({texts[0]}, {texts[1]})", "date")
+        if name == "TO_CHAR":
+            if len(arguments) == 2:
+                require(dtypes[0] == "date" and _string_value(singles[1]) is not None, "format")
+                date_format_tokens(_string_value(singles[1]))
+                return expr(f"ORA_TO_CHAR({texts[0]}, {texts[1]})", "text")
+            # TO_CHAR(date) would use the session's NLS format
+            require(len(arguments) == 1 and dtypes[0] == "number", "argument")
+            return expr(f"ORA_TO_CHAR({texts[0]})", "text")
+        if name == "TRUNC":
+            require(len(arguments) in (1, 2), "arguments")
+            if dtypes[0] == "date":
+                unit = _string_value(singles[1]) if len(arguments) == 2 else "DD"
+                require(unit is not None and unit.upper() in TRUNC_UNITS, "unit")
+                return expr(f"datetime({texts[0]}, '{TRUNC_UNITS[unit.upper()]}')", "date")
+            require(dtypes[0] == "number" or (dtypes[0] is None and singles[0] is None), "argument")
+            return expr(f"ORA_TRUNC({', '.join(texts)})", "number")
+        if name == "EXTRACT":
+            argument = arguments[0] if len(arguments) == 1 else []
+            require(len(argument) == 3 and _is_word(argument[1], "FROM") and isinstance(argument[2], _Expr)
+                    and argument[2].dtype == "date", "argument")
+            field = argument[0].ident if isinstance(argument[0], _Expr) else None
+            require(field in EXTRACT_FIELDS, "field")
+            source = argument[2]
+            return _Expr(f"CAST(strftime('{EXTRACT_FIELDS[field]}', {source.sql}) AS INTEGER)", "number",
+                         source.columns, source.aggregate)
+        if name in ("ADD_MONTHS", "MONTHS_BETWEEN", "LAST_DAY"):
+            expected = {"ADD_MONTHS": ("date", "number"), "MONTHS_BETWEEN": ("date", "date"), "LAST_DAY": ("date",)}[name]
+            require(len(dtypes) == len(expected), "arguments")
+            require(all(dtype == want or (want == "number" and dtype is None) for dtype, want in zip(dtypes, expected)),
+                    "argument types")
+            return expr(f"ORA_{name}({', '.join(texts)})", "number" if name == "MONTHS_BETWEEN" else "date")
+        raise Untranslatable(f"function {name}")
+
+    # Item-level rewrites
+
+    def _finish(self, items):
+        for position, item in enumerate(items):
+            if _is_op(item, "*", "/", "%"):
+                neighbours = items[max(0, position - 1):position] + items[position + 1:position + 2]
+                if any(isinstance(neighbour, _Expr) and neighbour.dtype == "date" for neighbour in neighbours):
+                    raise Untranslatable("date in multiplication")
+                if item[1] == "%":
+                    raise Untranslatable("% operator")
+                if item[1] == "/":
+                    # Oracle division is exact; integer operands must not truncate
+                    items[position] = ("op", "* 1.0 /")
+        items = self._date_arithmetic(items)
+        items = self._concatenation(items)
+        self._check_comparisons(items)
+        self._collect_date_aliases(items)
+        self._order_nulls(items)
+        self._check_select_blocks(items)
+        return items
+
+    def _date_arithmetic(self, items):
+        position = 0
+        while position < len(items):
+            item = items[position]
+            if not _is_op(item, "+", "-"):
+                position += 1
+                continue
+            left = items[position - 1] if position > 0 else None
+            right = items[position + 1] if position + 1 < len(items) else None
+            if not isinstance(left, _Expr):
+                if isinstance(right, _Expr) and right.dtype == "date":
+                    raise Untranslatable("unary operator on a date")
+                position += 1
+                continue
+            if not isinstance(right, _Expr) or "date" not in (left.dtype, right.dtype):
+                position += 1
+                continue
+            # The numeric side of date +/- n extends over a following * or / chain
+            end = position + 2
+            term = [right]
+            while end + 1 < len(items) and _is_op(items[end], "*", "* 1.0 /") and isinstance(items[end + 1], _Expr):
+                term.extend(items[end:end + 2])
+                end += 2
+            operands = [left] + [entry for entry in term if isinstance(entry, _Expr)]
+            columns = frozenset().union(*(operand.columns for operand in operands))
+            aggregate = any(operand.aggregate for operand in operands)
+            if left.dtype == "date" and right.dtype == "date" and len(term) == 1:
+                if item[1] != "-":
+                    raise Untranslatable("date + date")
+                merged = _Expr(f"(julianday({left.sql}) - julianday({right.sql}))", "number", columns, aggregate)
+            elif left.dtype == "date" and all(entry.dtype == "number" for entry in term if isinstance(entry, _Expr)):
+                sign = "" if item[1] == "+" else "-"
+                merged = _Expr(f"datetime({left.sql}, printf('%+.6f days', {sign}({_sql(term)})))", "date", columns, aggregate)
+            elif right.dtype == "date" and len(term) == 1 and left.dtype == "number" and item[1] == "+":
+                merged = _Expr(f"datetime({right.sql}, printf('%+.6f days', {left.sql}))", "date", columns, aggregate)
+            else:
+                raise Untranslatable("date arithmetic")
+            items[position - 1:end] = [merged]
+        return items
+
+    def _concatenation(self, items):
+        position = 0
+        while position < len(items):
+            if not _is_op(items[position], "||"):
+                position += 1
+                continue
+            start = position - 1
+            end = position
+            while end < len(items) and _is_op(items[end], "||"):
+                end += 2
+            chain = items[start:end]
+            operands = chain[::2]
+            if not all(isinstance(operand, _Expr) for operand in operands) or len(operands) != len(chain[1::2]) + 1:
+                raise Untranslatable("|| operands")
+            if any(operand.dtype == "date" for operand in operands):
+                raise Untranslatable("date in ||")
+            before = items[start - 1] if start > 0 else None
+            after = items[end] if end < len(items) else None
+            if _is_op(before, "+", "-", "*", "* 1.0 /") or _is_op(after, "+", "-", "*", "* 1.0 /"):
+                raise Untranslatable("|| mixed with arithmetic")
+            # Oracle concatenation skips NULLs
+            sql = " || ".join(f"IFNULL({operand.sql}, '')" for operand in operands)
+            items[start:end] = [_Expr(
+                f"({sql})",
+                "text",
+                frozenset().union(*(operand.columns for operand in operands)),
+                any(operand.aggregate for operand in operands)
+            )]
+            position = start + 1
+        return items
+
+    def _check_comparisons(self, items):
+        for position, item in enumerate(items):
+            if not (_is_op(item, *COMPARISONS) or _is_word(item, "LIKE", "BETWEEN", "IN")):
+                continue
+            left = items[position - 1] if position > 0 else None
+            right = items[position + 1] if position + 1 < len(items) else None
+            types = {operand.dtype for operand in (left, right) if isinstance(operand, _Expr)}
+            # Oracle converts the string with the session date format; text comparison would not
+            if "date" in types and ("text" in types or _is_word(item, "LIKE", "IN")):
+                raise Untranslatable("date compared with text")
+            if _is_word(item, "BETWEEN") and isinstance(left, _Expr) and left.dtype == "date":
+                bounds = [items[index] for index in (position + 1, position + 3) if index < len(items)]
+                if any(not isinstance(bound, _Expr) or bound.dtype != "date" for bound in bounds):
+                    raise Untranslatable("date BETWEEN non-dates")
+
+    def _collect_date_aliases(self, items):
+        for position, item in enumerate(items[:-1]):
+            if not isinstance(item, _Expr) or item.dtype != "date":
+                continue
+            following = items[position + 1]
+            if _is_word(following, "AS") and position + 2 < len(items) and isinstance(items[position + 2], _Expr):
+                following = items[position + 2]
+            if isinstance(following, _Expr) and following.ident and following.ident not in ALL_COLUMNS:
+                self.found_date_aliases.add(following.ident)
+
+    def _order_nulls(self, items):
+        """Oracle sorts NULLs last ascending and first descending; SQLite does the opposite"""
+        position = 0
+        while position < len(items) - 1:
+            if not (_is_word(items[position], "ORDER") and _is_word(items[position + 1], "BY")):
+                position += 1
+                continue
+            start = position + 2
+            end = start
+            while end < len(items) and not _is_word(items[end], "LIMIT", *SET_OPERATORS):
+                end += 1
+            rebuilt = []
+            for index, key in enumerate(_split(items[start:end])):
+                if index:
+                    rebuilt.append(("op", ","))
+                rebuilt.extend(key)
+                if not any(_is_word(part, "NULLS") for part in key):
+                    rebuilt.extend([("word", "NULLS"), ("word", "FIRST" if _is_word(key[-1], "DESC") else "LAST")])
+            items[start:end] = rebuilt
+            position = start + len(rebuilt)
+
+    def _check_select_blocks(self, items):
+        """Reject what Oracle would reject but SQLite accepts: ungrouped columns, select aliases in WHERE"""
+        blocks = [[]]
+        for item in items:
+            if _is_word(item, *SET_OPERATORS):
+                blocks.append([])
+            else:
+                blocks[-1].append(item)
+        for block in blocks:
+            select = next((index for index, item in enumerate(block) if _is_word(item, "SELECT")), None)
+            if select is None:
+                continue
+            clauses = {}
+            current = "SELECT"
+            clauses[current] = []
+            for position, item in enumerate(block[select + 1:], start=select + 1):
+                if _is_word(item, "FROM", "WHERE", "HAVING", "LIMIT") or (
+                        _is_word(item, "GROUP", "ORDER") and position + 1 < len(block) and _is_word(block[position + 1], "BY")):
+                    current = item[1]
+                    clauses[current] = []
+                elif not (_is_word(item, "BY") and block[position - 1] in (("word", "GROUP"), ("word", "ORDER"))):
+                    clauses[current].append(item)
+            select_items = _split([item for item in clauses["SELECT"] if not _is_word(item, "DISTINCT", "UNIQUE", "ALL")])
+            aliases = set()
+            expressions = []
+            for select_item in select_items:
+                if len(select_item) >= 2 and isinstance(select_item[-1], _Expr) and select_item[-1].ident \
+                        and not _is_op(select_item[-2]):
+                    aliases.add(select_item[-1].ident)
+                    select_item = select_item[:-2] if _is_word(select_item[-2], "AS") else select_item[:-1]
+                expressions.append(select_item)
+            for item in clauses.get("WHERE", []):
+                if isinstance(item, _Expr) and item.ident in aliases and item.ident not in ALL_COLUMNS:
+                    raise Untranslatable("select alias in WHERE")
+            grouped = "GROUP" in clauses or "HAVING" in clauses or any(
+                isinstance(item, _Expr) and item.aggregate for expression in expressions for item in expression
+            )
+            if not grouped:
+                continue
+            keys = _split(clauses.get("GROUP", [])) if clauses.get("GROUP") else []
+            key_sql = {_normalized(key) for key in keys}
+            key_columns = {key[0].ident for key in keys if len(key) == 1 and isinstance(key[0], _Expr) and key[0].ident}
+
+            def covered(expression):
+                if not expression or _normalized(expression) in key_sql:
+                    return True
+                if any(_is_op(item, "*") and len(expression) == 1 for item in expression):
+                    return False
+                referenced = set().union(*(item.columns for item in expression if isinstance(item, _Expr)))
+                return referenced <= key_columns
+
+            for expression in expressions + [clauses.get("HAVING", [])]:
+                if not covered(expression):
+                    raise Untranslatable("column not in GROUP BY")
+            if len(blocks) == 1:
+                for key in _split(clauses.get("ORDER", [])):
+                    key = [item for item in key if not _is_word(item, "ASC", "DESC", "NULLS", "FIRST", "LAST")]
+                    if len(key) == 1 and isinstance(key[0], _Expr) and (key[0].ident in aliases or key[0].dtype == "number"
+                                                                        and key[0].sql.isdigit()):
+                        continue
+                    if not covered(key):
+                        raise Untranslatable("ORDER BY column not in GROUP BY")
+
+
+def output_names(tokens):
+    """Oracle's column labels for the outermost select list, or None when it selects *"""
+    significant = [(kind, text) for kind, text in tokens if kind not in ("space", "comment")]
+    depth = 0
+    start = None
+    for position, (kind, text) in enumerate(significant):
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and kind == "word" and text.upper() == "SELECT":
+            start = position + 1
+            break
+    if start is None:
+        return None
+    items = [[]]
+    depth = 0
+    for kind, text in significant[start:]:
+        if depth == 0 and kind == "word" and text.upper() == "FROM":
+            break
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and text == ",":
+            items.append([])
+            continue
+        items[-1].append((kind, text))
+    if items[0] and items[0][0][0] == "word" and items[0][0][1].upper() in ("DISTINCT", "UNIQUE", "ALL"):
+        items[0] = items[0][1:]
+    names = []
+    for item in items:
+        if not item or item[-1][1] == "*":
+            return None
+        last_kind, last_text = item[-1]
+        previous = item[-2] if len(item) >= 2 else None
+        is_alias = previous is not None and last_kind in ("word", "quoted") and (
+            previous[1].upper() == "AS" or previous[1] == ")" or previous[0] in ("word", "quoted", "string", "number")
+        ) and previous[1] != "." and last_text.upper() not in KEYWORDS
+        is_column = len(item) == 1 or (len(item) == 3 and item[1][1] == ".")
+        if (is_alias or is_column) and last_kind in ("word", "quoted"):
+            names.append(last_text.strip('"') if last_kind == "quoted" else last_text.upper())
+        else:
+            names.append("".join(text if kind in ("string", "quoted") else text.upper() for kind, text in item))
+    return names
+
+
+def _translate(sql, date_aliases=frozenset()):
+    tokens = tokenize(sql)
+    if any(kind == "other" for kind, _ in tokens):
+        raise Untranslatable("unsupported character")
+    for (kind, _), (next_kind, _) in zip(tokens, tokens[1:]):
+        if kind == "number" and next_kind == "word":
+            raise Untranslatable("number literal")
+    translator = _Translator(date_aliases)
+    significant = [(kind, text) for kind, text in tokens if kind not in ("space", "comment")]
+    items = translator.level(significant)
+    return _sql(items), output_names(tokens), translator.found_date_aliases
+
+
+@lru_cache(maxsize=1024)
+def translate(sql):
+    """Oracle SQL -> (SQLite SQL, Oracle column labels or None); raises Untranslatable"""
+    sqlite_sql, names, date_aliases = _translate(sql)
+    if date_aliases:
+        # Aliases of date expressions are dates wherever an outer query uses them
+        sqlite_sql, names, _ = _translate(sql, frozenset(date_aliases))
+    return sqlite_sql, names
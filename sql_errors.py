@@ -0,0 +1,86 @@
+# Classification of SQL execution errors for the self-repair loop
+
+import re
+
+
+ORA_CODE_PATTERN = re.compile(r"\b(ORA|PLS)-(\d{5})\b")
+
+# Errors in the SQL text itself: the generator can fix these given the message
+RETRYABLE_CODES = {
+    "ORA-00900",  # invalid SQL statement
+    "ORA-00904",  # invalid identifier
+    "ORA-00905",  # missing keyword
+    "ORA-00906",  # missing left parenthesis
+    "ORA-00907",  # missing right parenthesis
+    "ORA-00909",  # invalid number of arguments
+    "ORA-00911",  # invalid character
+    "ORA-00917",  # missing comma
+    "ORA-00918",  # column ambiguously defined
+    "ORA-00920",  # invalid relational operator
+    "ORA-00921",  # unexpected end of SQL command
+    "ORA-00923",  # FROM keyword not found where expected
+    "ORA-00932",  # inconsistent datatypes
+    "ORA-00933",  # SQL command not properly ended
+    "ORA-00934",  # group function is not allowed here
+    "ORA-00935",  # group function is nested too deeply
+    "ORA-00936",  # missing expression
+    "ORA-00937",  # not a single-group group function
+    "ORA-00942",  # table or view does not exist
+    "ORA-00979",  # not a GROUP BY expression
+    "ORA-01722",  # invalid number
+    "ORA-01741",  # illegal zero-length identifier
+    "ORA-01747",  # invalid column specification
+    "ORA-01756",  # quoted string not properly terminated
+    "ORA-01790",  # expression must have same datatype as corresponding expression
+    "ORA-01830",  # date format picture ends before converting entire input string
+    "ORA-01840",  # input value not long enough for date format
+    "ORA-01843",  # not a valid month
+    "ORA-01858",  # a non-numeric character was found where a numeric was expected
+    "ORA-01861",  # literal does not match format string
+    "ORA-01476",  # divisor is equal to zero
+    "ORA-30483",  # window functions are not allowed here
+}
+
+# Errors a different query cannot fix (infrastructure, limits, cancellation)
+NON_RETRYABLE_CODES = {
+    "ORA-00054",  # resource busy
+    "ORA-01013",  # user requested cancel (statement timeout)
+    "ORA-01017",  # invalid username/password
+    "ORA-01652",  # unable to extend temp segment
+    "ORA-03113",  # end-of-file on communication channel
+    "ORA-03114",  # not connected to ORACLE
+    "ORA-04031",  # unable to allocate shared memory
+    "ORA-12170",  # connect timeout
+    "ORA-12514",  # listener does not know of service
+    "ORA-12541",  # no listener
+}
+
+
+def error_message(sql_result):
+    """Error text from an execute_sql error payload"""
+    error = sql_result.get("error") if isinstance(sql_result, dict) else sql_result
+    if isinstance(error, dict):
+        error = error.get("message") or error.get("detail") or error
+    return str(error)
+
+
+def classify_sql_error(sql_result):
+    """Return (code, retryable) for an execute_sql error payload.
+
+    Validator rejections and ORA errors in the SQL text are retryable; transport failures,
+    timeouts and database-side resource errors are not.
+    """
+    message = error_message(sql_result)
+    match = ORA_CODE_PATTERN.search(message)
+    if match:
+        code = f"{match.group(1)}-{match.group(2)}"
+        if code in NON_RETRYABLE_CODES:
+            return code, False
+        # Unknown ORA codes in the 009xx/017xx ranges are parse/semantic errors
+        return code, code in RETRYABLE_CODES or match.group(2)[:3] in ("009", "017")
+    if message.startswith("SQL rejected before execution"):
+        # Non-SELECT statements are not regenerated
+        return "REJECTED", not any(reason in message for reason in ("forbidden keyword", "multiple statements", "only SELECT"))
+    if message.startswith("SQL execution failed"):
+        return "TRANSPORT", False
+    return "UNKNOWN", False
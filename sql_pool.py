@@ -0,0 +1,102 @@
+# urllib3 connection pool for SQL_ENDPOINT with queue/connect timings and jittered retries.
+# Imported by SqlTransport on first use, so urllib3 stays out of the function's cold start.
+
+import random
+import socket
+import threading
+import time
+
+import urllib3
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import HTTPError, MaxRetryError
+from urllib3.util import Retry, Timeout, make_headers
+
+
+# Per-thread timings of the request in flight (pool and connection hooks write here)
+current = threading.local()
+
+KEEPALIVE_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+
+def _record(key, seconds):
+    metrics = getattr(current, "metrics", None)
+    if metrics is not None:
+        metrics[key] = metrics.get(key, 0.0) + seconds * 1000
+
+
+def _count(key):
+    metrics = getattr(current, "metrics", None)
+    if metrics is not None:
+        metrics[key] = metrics.get(key, 0) + 1
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _record("connect_ms", time.perf_counter() - started)
+        _count("connections_opened")
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _record("connect_ms", time.perf_counter() - started)
+        _count("connections_opened")
+
+
+class _TimedPoolMixin:
+    def _get_conn(self, timeout=None):
+        # Time spent waiting for a free connection (block=True pools wait here)
+        started = time.perf_counter()
+        conn = super()._get_conn(timeout=timeout)
+        _record("queue_ms", time.perf_counter() - started)
+        return conn
+
+
+class TimedHTTPConnectionPool(_TimedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(_TimedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class JitteredRetry(Retry):
+    """Exponential backoff with +/-50% jitter so concurrent retries do not arrive in lockstep"""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return backoff * random.uniform(0.5, 1.5) if backoff else 0
+
+
+def build_pool(pool_size, connect_timeout, read_timeout, retries, backoff_factor, keepalive):
+    """Returns (pool_manager, timeout, retry_policy) for SqlTransport"""
+    timeout = Timeout(connect=connect_timeout, read=read_timeout)
+    # POST is retried only when the endpoint cannot have run the SQL (connect failures) or a gateway
+    # answered 502/503/504. Read errors are not retried: after a read timeout the query may still be
+    # running, and sending it again would double the database load. Idle keep-alive connections the
+    # server closed are detected and replaced by the pool before the request is sent.
+    retry_policy = JitteredRetry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"POST"}),
+        backoff_factor=backoff_factor,
+        raise_on_status=False,
+    )
+    headers = make_headers(accept_encoding=True, keep_alive=keepalive)
+    headers["Content-Type"] = "application/json"
+    pool = urllib3.PoolManager(
+        num_pools=2,
+        maxsize=pool_size,
+        block=True,
+        headers=headers,
+        socket_options=KEEPALIVE_SOCKET_OPTIONS if keepalive else HTTPConnection.default_socket_options,
+    )
+    pool.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+    return pool, timeout, retry_policy
@@ -0,0 +1,195 @@
+# Row-limit and COUNT(*) probe rewriting of generated SQL (runs after validation)
+
+import threading
+
+from result_encoding import extract_rows, result_columns, row_values
+from sql_validator import tokenize
+
+
+AGGREGATE_FUNCTIONS = {"SUM", "COUNT", "AVG", "MIN", "MAX", "LISTAGG", "MEDIAN", "STDDEV", "VARIANCE"}
+
+
+def _top_level(tokens):
+    """Significant (kind, text) tokens outside any parentheses"""
+    depth = 0
+    top_level = []
+    for kind, text in tokens:
+        if kind in ("space", "comment"):
+            continue
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0:
+            top_level.append((kind, text.upper()))
+    return top_level
+
+
+def _last_select(tokens):
+    """Significant tokens of the outermost SELECT (after any WITH clause), keeping nested parentheses"""
+    depth = 0
+    start = 0
+    significant = [(kind, text) for kind, text in tokens if kind not in ("space", "comment")]
+    for position, (kind, text) in enumerate(significant):
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and kind == "word" and text.upper() == "SELECT":
+            start = position
+    return significant[start:]
+
+
+def row_bound(sql):
+    """Why the query already returns a bounded number of rows, or None when it is unbounded"""
+    tokens = tokenize(sql)
+    top_level = _top_level(tokens)
+    words = {text for kind, text in top_level if kind == "word"}
+    if "FETCH" in words or "OFFSET" in words:
+        return "row_limit"
+    if "ROWNUM" in words:
+        return "rownum"
+    if words & {"UNION", "INTERSECT", "MINUS"}:
+        return None
+    # SELECT SUM(...) FROM ... without GROUP BY returns a single row; scalar subqueries
+    # in the select list do not count
+    outer = _last_select(tokens)
+    depth = 0
+    subquery_depth = None
+    select_list = []
+    for position, (kind, text) in enumerate(outer[1:], start=1):
+        if depth == 0 and kind == "word" and text.upper() == "FROM":
+            break
+        if text == "(":
+            depth += 1
+            if subquery_depth is None and outer[position + 1:position + 2] and outer[position + 1][1].upper() in ("SELECT", "WITH"):
+                subquery_depth = depth
+        elif text == ")":
+            if subquery_depth == depth:
+                subquery_depth = None
+            depth -= 1
+        if subquery_depth is None:
+            select_list.append((kind, text.upper()))
+    has_aggregate = any(
+        kind == "word" and text in AGGREGATE_FUNCTIONS and select_list[position + 1:position + 2] == [("op", "(")]
+        for position, (kind, text) in enumerate(select_list)
+    )
+    if has_aggregate and "GROUP" not in words and "OVER" not in words:
+        return "aggregate"
+    return None
+
+
+def order_key(sql):
+    """ORDER BY clause that makes OFFSET/FETCH pages repeatable across executions.
+
+    "" when the query already orders its rows at the top level, every select-list position when
+    the list has no "*", ROWID for SELECT * from a single table, or None when no stable key is known
+    (Oracle returns unordered rows in any order, so pages of such a query could skip or repeat rows).
+    """
+    tokens = tokenize(sql)
+    top_level = _top_level(tokens)
+    if any(top_level[position:position + 2] == [("word", "ORDER"), ("word", "BY")] for position in range(len(top_level))):
+        return ""
+    outer = _last_select(tokens)
+    depth = 0
+    items = 1
+    star = False
+    previous = "SELECT"
+    position = 1
+    for position, (kind, text) in enumerate(outer[1:], start=1):
+        upper = text.upper()
+        if depth == 0 and kind == "word" and upper == "FROM":
+            break
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and text == ",":
+            items += 1
+        elif depth == 0 and text == "*" and previous in ("SELECT", "DISTINCT", "UNIQUE", "ALL", ",", "."):
+            star = True
+        previous = upper
+    if not star:
+        return " ORDER BY " + ", ".join(str(index) for index in range(1, items + 1))
+    # SELECT * FROM <table> [alias] [WHERE ...]: ROWID identifies each row
+    words = {text for kind, text in top_level if kind == "word"}
+    source = []
+    for kind, text in outer[position + 1:]:
+        if kind == "word" and text.upper() in ("WHERE", "GROUP", "HAVING", "CONNECT", "START"):
+            break
+        source.append((kind, text.upper()))
+    single_table = (
+        source and source[0][0] == "word" and len(source) <= 4
+        and all(kind in ("word", "quoted") or text == "." for kind, text in source)
+        and not {text for kind, text in source if kind == "word"} & {"JOIN", "NATURAL", "CROSS", "APPLY"}
+    )
+    if items == 1 and single_table and not words & {"WITH", "DISTINCT", "UNIQUE", "GROUP", "UNION", "INTERSECT", "MINUS"}:
+        return " ORDER BY ROWID"
+    return None
+
+
+def limit_sql(sql, limit, offset=0):
+    """Page an unbounded SELECT; returns (sql, applied).
+
+    Fetches limit + 1 rows so the caller can tell whether more rows exist without counting, adding
+    order_key so later pages line up. Queries that already bound their rows (FETCH, ROWNUM, a single
+    aggregate row) and queries without a stable order are unchanged.
+    """
+    if row_bound(sql) is not None:
+        return sql, False
+    order = order_key(sql)
+    if order is None:
+        return sql, False
+    sql = sql.strip().rstrip(";").rstrip()
+    # Trailing line comments would swallow the appended clause
+    if tokenize(sql)[-1][0] == "comment":
+        sql += "\n"
+    offset_clause = f" OFFSET {int(offset)} ROWS" if offset else ""
+    return f"{sql}{order}{offset_clause} FETCH NEXT {int(limit) + 1} ROWS ONLY", True
+
+
+def page_sql(sql, limit, offset=0):
+    """limit + 1 rows starting at offset, wrapping queries that already bound their own rows.
+
+    None for an unbounded query without a stable order: a re-run could not return the same page.
+    """
+    paged_sql, applied = limit_sql(sql, limit, offset)
+    if applied:
+        return paged_sql
+    if row_bound(sql) is None:
+        return None
+    offset_clause = f" OFFSET {int(offset)} ROWS" if offset else ""
+    return f"SELECT * FROM (\n{sql.strip().rstrip(';')}\n){offset_clause} FETCH NEXT {int(limit) + 1} ROWS ONLY"
+
+
+def count_sql(sql):
+    """COUNT(*) probe for the total row count of a query"""
+    return f"SELECT COUNT(*) AS TOTAL_ROWS FROM (\n{sql.strip().rstrip(';')}\n)"
+
+
+def probe_count(count_result):
+    """Total rows from a count_sql result, or None"""
+    rows = extract_rows(count_result)
+    if not rows:
+        return None
+    values = row_values(rows[0], result_columns(count_result, rows[:1]))
+    try:
+        return int(values[0])
+    except (IndexError, TypeError, ValueError):
+        return None
+
+
+class SqlRewriteStats:
+    """Counts limited, already-bounded, unordered (left unpaged) and probed queries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"limited": 0, "bounded": 0, "unordered": 0, "has_more": 0, "count_probes": 0, "count_probes_skipped": 0}
+
+    def record(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
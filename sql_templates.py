@@ -0,0 +1,383 @@
+# Deterministic SQL templates for high-frequency question shapes (skips the LLM)
+
+import re
+import threading
+
+from cache import normalize_query
+from sql_validator import RC_EXPIRY_BUCKET
+
+
+# Words that may pad any templated question without changing its meaning
+FILLER_TOKENS = {
+    "how", "many", "can", "you", "i", "want", "need", "know", "see", "do", "does",
+    "have", "has", "there", "currently", "current", "now", "today", "kindly",
+    "provide", "fetch", "report", "view", "check", "s",
+    "a", "an", "the", "in", "for", "of", "on", "to", "this", "that", "these", "those", "is", "are", "was",
+    "were", "be", "me", "my", "please", "show", "list", "give", "get", "display", "tell", "find", "what",
+    "which", "all", "with", "and", "from", "details", "detail",
+}
+
+# Words that signal the question is NOT a plain item search (let the LLM handle it)
+NON_ITEM_WORDS = {
+    "tender", "tenders", "supplier", "suppliers", "vendor", "vendors", "rc", "rcs",
+    "rate", "contract", "contracts", "expiry", "expiring", "expired", "overdue",
+    "delayed", "value", "values", "total", "top", "month", "monthly", "year",
+    "by", "wise", "each", "per", "count", "number", "all", "every", "between",
+    "than", "less", "more", "greater", "above", "below", "last", "next", "days",
+    "pipeline", "lakhs", "crores", "category", "categories", "status",
+}
+
+PO_WORDS = {"po", "pos", "purchase", "order", "orders"}
+
+TENDER_TOKEN = re.compile(r"^tender_(\d+)(_r)?$")
+
+# Dosage forms that mark a phrase as an item name without an explicit "item" cue, with the stem they
+# are searched by: item names use the singular ("Paracetamol Tablet IP"), so "tablets" must not reach the LIKE
+ITEM_FORM_WORDS = {
+    "tablet": "TABLET", "tablets": "TABLET", "tab": "TAB", "tabs": "TABLET",
+    "injection": "INJECTION", "injections": "INJECTION", "inj": "INJ",
+    "capsule": "CAPSULE", "capsules": "CAPSULE", "cap": "CAP", "caps": "CAPSULE",
+    "syrup": "SYRUP", "syrups": "SYRUP", "suspension": "SUSPENSION", "suspensions": "SUSPENSION",
+    "ointment": "OINTMENT", "ointments": "OINTMENT", "cream": "CREAM", "creams": "CREAM",
+    "drops": "DROP", "gel": "GEL", "gels": "GEL", "lotion": "LOTION", "lotions": "LOTION",
+    "solution": "SOLUTION", "solutions": "SOLUTION", "infusion": "INFUSION", "infusions": "INFUSION",
+    "powder": "POWDER", "powders": "POWDER", "inhaler": "INHALER", "inhalers": "INHALER",
+    "vial": "VIAL", "vials": "VIAL", "ampoule": "AMPOULE", "ampoules": "AMPOULE",
+    "spray": "SPRAY", "sprays": "SPRAY", "sachet": "SACHET", "sachets": "SACHET",
+    "suppository": "SUPPOSITORY", "suppositories": "SUPPOSITORY",
+}
+
+# Item search phrasings; "item" is the item name as typed by the user, "cue" an explicit "item(s)" before it
+ITEM_PATTERNS = [
+    ("po_issued_for_item", re.compile(
+        r"^(?:has|have|was|were)\s+(?:a\s+|the\s+|any\s+)?pos?\s+(?:been\s+)?issued\s+(?:for|to)\s+(?:the\s+)?(?P<cue>items?\s+)?(?P<item>.+?)\??$",
+        re.IGNORECASE)),
+    ("supply_status_for_item", re.compile(
+        r"^(?:what\s+is\s+|show\s+(?:me\s+)?)?(?:the\s+)?(?:po\s+)?supply\s+status\s+(?:of|for)\s+(?:the\s+)?(?:po\s+for\s+)?(?P<cue>items?\s+)?(?P<item>.+?)\??$",
+        re.IGNORECASE)),
+    ("po_details_for_item", re.compile(
+        r"^(?:show|list|get|display)?\s*(?:me\s+)?(?:the\s+|all\s+)?(?:po|pos|purchase\s+orders?)(?:\s+details)?\s+(?:for|of)\s+(?:the\s+)?(?P<cue>items?\s+)?(?P<item>.+?)\??$",
+        re.IGNORECASE)),
+]
+
+ITEM_TEMPLATES = {
+    "po_issued_for_item": (
+        "SELECT DISTINCT SUPPLIERNAME, PONO, PODATE, ITEMNAME FROM PO_DATA "
+        "WHERE PODATE IS NOT NULL AND {item_filter} ORDER BY PODATE DESC"
+    ),
+    "supply_status_for_item": (
+        "SELECT PONO, ITEMNAME, POQTY, RECEIVEDQTY, (RECEIVEDQTY / NULLIF(POQTY, 0)) * 100 AS Percentage_Supplied, STATUS "
+        "FROM PO_DATA WHERE {item_filter} ORDER BY PONO"
+    ),
+    "po_details_for_item": (
+        "SELECT PONO, SUPPLIERNAME, ITEMNAME, POQTY, RECEIVEDQTY, (RECEIVEDQTY / NULLIF(POQTY, 0)) * 100 AS Percentage_Supplied, STATUS, PODATE "
+        "FROM PO_DATA WHERE {item_filter} ORDER BY PODATE DESC"
+    ),
+}
+
+
+def item_filter(item_phrase, cued=False, known_item=None):
+    """Build the UPPER(ITEMNAME) LIKE filter for an item phrase, or None if it is not clearly an item.
+
+    The phrase must follow an explicit "item" cue, name a dosage form, or be confirmed by
+    known_item(words); a bare word ("Cipla", "March", "pending") is left to the LLM. Dosage forms
+    are searched by their singular stem (python -m doctest sql_templates.py checks these):
+
+    >>> item_filter("paracetamol tablets")
+    "UPPER(ITEMNAME) LIKE '%PARACETAMOL%' AND UPPER(ITEMNAME) LIKE '%TABLET%'"
+    >>> item_filter("tablets")
+    "UPPER(ITEMNAME) LIKE '%TABLET%'"
+    >>> item_filter("amoxicillin caps")
+    "UPPER(ITEMNAME) LIKE '%AMOXICILLIN%' AND UPPER(ITEMNAME) LIKE '%CAPSULE%'"
+    >>> item_filter("ceftriaxone injections"), item_filter("atropine vials"), item_filter("adrenaline ampoules")
+    ("UPPER(ITEMNAME) LIKE '%CEFTRIAXONE%' AND UPPER(ITEMNAME) LIKE '%INJECTION%'", "UPPER(ITEMNAME) LIKE '%ATROPINE%' AND UPPER(ITEMNAME) LIKE '%VIAL%'", "UPPER(ITEMNAME) LIKE '%ADRENALINE%' AND UPPER(ITEMNAME) LIKE '%AMPOULE%'")
+    >>> item_filter("cipla") is None
+    True
+    """
+    words = item_phrase.strip().split()
+    if not 1 <= len(words) <= 4:
+        return None
+    for word in words:
+        if not re.fullmatch(r"[A-Za-z][A-Za-z0-9\-]*", word) or word.lower() in NON_ITEM_WORDS:
+            return None
+    if not cued and not any(word.lower() in ITEM_FORM_WORDS for word in words):
+        if known_item is None or not known_item([word.upper() for word in words]):
+            return None
+    stems = [ITEM_FORM_WORDS.get(word.lower(), word.upper()) for word in words]
+    return " AND ".join(f"UPPER(ITEMNAME) LIKE '%{stem}%'" for stem in stems)
+
+
+def _tender_code(tokens):
+    """Return the canonical tender code ("161(R)") if exactly one tender is referenced"""
+    codes = [TENDER_TOKEN.match(token) for token in tokens]
+    codes = [match for match in codes if match]
+    if len(codes) != 1:
+        return None
+    code = codes[0].group(1)
+    return f"{code}(R)" if codes[0].group(2) else code
+
+
+def _only(tokens, allowed):
+    """True when every token is in the allowed vocabulary (or filler)"""
+    return all(token in allowed or token in FILLER_TOKENS for token in tokens)
+
+
+def _match_tender_bids(tokens):
+    code = _tender_code(tokens)
+    if code is None or not tokens & {"bids", "bid", "bidders", "bidder", "participation"}:
+        return None
+    allowed = {"bids", "bid", "bidders", "bidder", "participation", "found", "received",
+               "items", "item", "cover", "covers", "b", "c", "count", "counts", "vendor"}
+    if not _only(tokens - {t for t in tokens if TENDER_TOKEN.match(t)}, allowed):
+        return None
+    return (
+        "SELECT TENDERCODE, ITEMCODE, ITEMNAME, BID_FOUND_IN_COVER_A, BID_FOUND_IN_COVER_B, BID_FOUND_IN_COVER_C "
+        f"FROM TENDER_DATA WHERE TENDERCODE = '{code}' ORDER BY ITEMCODE"
+    )
+
+
+def _match_tender_status(tokens):
+    code = _tender_code(tokens)
+    if code is None or not tokens & {"status", "stage", "lifecycle", "timeline"}:
+        return None
+    allowed = {"status", "stage", "wise", "lifecycle", "timeline", "tender", "overall"}
+    if not _only(tokens - {t for t in tokens if TENDER_TOKEN.match(t)}, allowed):
+        return None
+    return (
+        "SELECT DISTINCT TENDERCODE, TENDERID, TENDERSTARTDATE, SUBMISSIONLASTDATE, COV_A_OPEN_DATE, COV_B_OPEN_DATE, "
+        "PRICE_BID_OPEN_DATE, TENDER_STATUS, NO_OF_EXTENSIONS "
+        f"FROM TENDER_DATA WHERE TENDERCODE = '{code}' FETCH FIRST 1 ROWS ONLY"
+    )
+
+
+def _match_rc_expiring(tokens):
+    if not tokens & {"rc", "rcs", "contract", "contracts"} or not tokens & {"expiring", "expire", "expires", "expiry"}:
+        return None
+    numbers = [token for token in tokens if token.isdigit()]
+    if len(numbers) != 1 or not 0 < int(numbers[0]) <= 3650:
+        return None
+    allowed = {"rc", "rcs", "rate", "contract", "contracts", "expiring", "expire", "expires", "expiry",
+               "items", "item", "days", "next", "within", "will", "going", "soon", "due", "op_le", "op_lt"}
+    if not _only(tokens - set(numbers), allowed):
+        return None
+    return (
+        "SELECT ITEMCODE, ITEMNAME, ITEM_RC_STATUS, ITEM_RC_DAYS_REMAINING FROM TENDER_DATA "
+        f"WHERE ITEM_RC_STATUS = 'RC Valid' AND ITEM_RC_DAYS_REMAINING BETWEEN 0 AND {int(numbers[0])} "
+        "ORDER BY ITEM_RC_DAYS_REMAINING ASC"
+    )
+
+
+def _match_rc_expired(tokens):
+    if "expired" not in tokens or not tokens & {"rc", "rcs", "contract", "contracts"}:
+        return None
+    allowed = {"expired", "rc", "rcs", "rate", "contract", "contracts", "items", "item", "already"}
+    if not _only(tokens, allowed):
+        return None
+    return (
+        "SELECT TENDERCODE, ITEMCODE, ITEMNAME, ITEM_RC_END_DATE, ITEM_RC_STATUS FROM TENDER_DATA "
+        "WHERE ITEM_RC_STATUS = 'RC Expired'"
+    )
+
+
+def _match_overdue_pos(tokens):
+    if "overdue" not in tokens or not tokens & PO_WORDS:
+        return None
+    allowed = PO_WORDS | {"overdue", "items", "item", "pending", "delivery"}
+    if not _only(tokens, allowed):
+        return None
+    return (
+        "SELECT PONO, SUPPLIERNAME, ITEMNAME, PODATE, PO_LAST_DAY, STATUS FROM PO_DATA "
+        "WHERE PO_LAST_DAY IS NOT NULL AND PO_LAST_DAY < SYSDATE AND STATUS != 'Supplied' ORDER BY PO_LAST_DAY"
+    )
+
+
+def _match_total_value(tokens):
+    if "total" not in tokens or not tokens & {"value", "amount"}:
+        return None
+    column = "TOTAL_PIPELINE_VALUE" if "pipeline" in tokens else "TOTAL_PO_VALUE"
+    allowed = PO_WORDS | {"total", "value", "amount", "pipeline", "crores", "crore", "lakhs", "lakh", "rs", "inr", "overall"}
+    if not _only(tokens, allowed):
+        return None
+    if tokens & {"crores", "crore"}:
+        return f"SELECT ROUND(SUM({column}) / 100, 2) AS Total_Crores FROM PO_DATA"
+    return f"SELECT ROUND(SUM({column}), 2) AS Total_Lakhs FROM PO_DATA"
+
+
+# Aggregate questions whose SQL the rollups cover (rollups.py); only registered when the rollup store
+# is enabled, and only for breakdowns: counts ("number of suppliers") and single periods ("this year")
+# go to the LLM
+VALUE_WORDS = {"value", "values", "amount", "spend", "spending", "total", "totals"}
+UNIT_WORDS = {"crores", "crore", "lakhs", "lakh", "rs", "inr"}
+BREAKDOWN_WORDS = {"by", "wise", "each", "per", "breakdown", "summary", "distribution"}
+COUNT_WORDS = {"count", "counts", "number", "many"}
+PERIOD_WORDS = {"this", "that", "current", "currently", "last", "previous", "next", "now", "today"}
+
+
+def _breakdown(tokens, extra_cues=frozenset()):
+    """True for a breakdown question that names no single period or year"""
+    if tokens & PERIOD_WORDS or any(any(char.isdigit() for char in token) for token in tokens):
+        return False
+    return bool(tokens & (BREAKDOWN_WORDS | extra_cues))
+
+
+def _value_expression(tokens):
+    if tokens & {"crores", "crore"}:
+        return "ROUND(SUM(TOTAL_PO_VALUE) / 100, 2) AS Total_Value_Crores"
+    return "ROUND(SUM(TOTAL_PO_VALUE), 2) AS Total_Value_Lakhs"
+
+
+def _match_value_by_month(tokens):
+    if not tokens & {"month", "monthly", "months"} or not tokens & VALUE_WORDS or tokens & COUNT_WORDS:
+        return None
+    if not _breakdown(tokens, {"monthly", "months", "trend"}):
+        return None
+    allowed = PO_WORDS | VALUE_WORDS | UNIT_WORDS | BREAKDOWN_WORDS | {"month", "monthly", "months", "trend"}
+    if not _only(tokens, allowed):
+        return None
+    return (
+        f"SELECT TO_CHAR(PODATE, 'YYYY-MM') AS PO_MONTH, COUNT(*) AS PO_Lines, {_value_expression(tokens)} "
+        "FROM PO_DATA WHERE TO_CHAR(PODATE, 'YYYY-MM') IS NOT NULL GROUP BY TO_CHAR(PODATE, 'YYYY-MM') ORDER BY PO_MONTH"
+    )
+
+
+def _match_value_by_fin_year(tokens):
+    year_words = {"year", "years", "yearly", "fy", "annual", "annually"}
+    if not tokens & year_words or not tokens & VALUE_WORDS or tokens & COUNT_WORDS:
+        return None
+    if not _breakdown(tokens, {"years", "yearly", "annual", "annually", "trend"}):
+        return None
+    allowed = PO_WORDS | VALUE_WORDS | UNIT_WORDS | BREAKDOWN_WORDS | year_words | {"financial", "trend"}
+    if not _only(tokens, allowed):
+        return None
+    return (
+        f"SELECT PO_FIN_YEAR, COUNT(*) AS PO_Lines, {_value_expression(tokens)} "
+        "FROM PO_DATA GROUP BY PO_FIN_YEAR ORDER BY PO_FIN_YEAR"
+    )
+
+
+def _match_supplier_totals(tokens):
+    if not tokens & {"supplier", "suppliers", "vendor", "vendors"} or not tokens & VALUE_WORDS or tokens & COUNT_WORDS:
+        return None
+    if not _breakdown(tokens):
+        return None
+    allowed = PO_WORDS | VALUE_WORDS | UNIT_WORDS | BREAKDOWN_WORDS | {"supplier", "suppliers", "vendor", "vendors"}
+    if not _only(tokens, allowed):
+        return None
+    return (
+        f"SELECT SUPPLIERNAME, COUNT(DISTINCT PONO) AS PO_Count, {_value_expression(tokens)}, "
+        "ROUND(SUM(TOTAL_PIPELINE_VALUE), 2) AS Pipeline_Value_Lakhs "
+        "FROM PO_DATA GROUP BY SUPPLIERNAME ORDER BY 3 DESC"
+    )
+
+
+def _match_supply_status_counts(tokens):
+    if not tokens & {"status", "statuses"} or not _breakdown(tokens, {"counts", "statuses"}):
+        return None
+    allowed = PO_WORDS | BREAKDOWN_WORDS | {"supply", "status", "statuses", "lines", "line", "counts", "count"}
+    if not _only(tokens, allowed):
+        return None
+    return (
+        "SELECT STATUS, COUNT(DISTINCT PONO) AS PO_Count, COUNT(*) AS PO_Lines, "
+        "ROUND(SUM(TOTAL_PO_VALUE), 2) AS Total_Value_Lakhs FROM PO_DATA GROUP BY STATUS ORDER BY PO_Lines DESC, STATUS"
+    )
+
+
+def _match_rc_expiry_buckets(tokens):
+    if not tokens & {"rc", "rcs", "contract", "contracts"} or not tokens & {"expiry", "expiring", "expired", "expire"}:
+        return None
+    # "How many RCs expired" is a count, not the bucket table
+    if tokens & {"many", "number"} or not _breakdown(tokens, {"buckets", "bucket"}):
+        return None
+    allowed = BREAKDOWN_WORDS | {"rc", "rcs", "rate", "contract", "contracts", "expiry", "expiring", "expired",
+                                 "expire", "buckets", "bucket", "items", "item", "counts", "count"}
+    if not _only(tokens, allowed):
+        return None
+    return (
+        f"SELECT {RC_EXPIRY_BUCKET} AS RC_Expiry_Bucket, COUNT(DISTINCT ITEMCODE) AS Items "
+        f"FROM TENDER_DATA GROUP BY {RC_EXPIRY_BUCKET} ORDER BY RC_Expiry_Bucket"
+    )
+
+
+def _match_bid_participation(tokens):
+    if _tender_code(tokens) is not None or not tokens & {"bid", "bids", "bidders", "bidder", "participation"}:
+        return None
+    if not tokens & {"tender", "tenders"} or not _breakdown(tokens):
+        return None
+    allowed = BREAKDOWN_WORDS | {"bid", "bids", "bidders", "bidder", "participation", "tender", "tenders",
+                                 "received", "found", "cover", "covers"}
+    if not _only(tokens, allowed):
+        return None
+    return (
+        "SELECT TENDERCODE, COUNT(*) AS Items, SUM(BID_FOUND_IN_COVER_A) AS Cover_A_Bids, "
+        "SUM(BID_FOUND_IN_COVER_B) AS Cover_B_Bids, SUM(BID_FOUND_IN_COVER_C) AS Cover_C_Bids, "
+        "SUM(CASE WHEN NVL(BID_FOUND_IN_COVER_A, 0) = 0 THEN 1 ELSE 0 END) AS Items_Without_Bids "
+        "FROM TENDER_DATA GROUP BY TENDERCODE ORDER BY TENDERCODE"
+    )
+
+
+TOKEN_RULES = [
+    ("tender_bids", _match_tender_bids),
+    ("tender_status", _match_tender_status),
+    ("rc_expiring_within_days", _match_rc_expiring),
+    ("rc_expired", _match_rc_expired),
+    ("overdue_pos", _match_overdue_pos),
+    ("total_value", _match_total_value),
+]
+
+ROLLUP_TOKEN_RULES = [
+    ("rc_expiry_buckets", _match_rc_expiry_buckets),
+    ("po_value_by_month", _match_value_by_month),
+    ("po_value_by_fin_year", _match_value_by_fin_year),
+    ("supplier_totals", _match_supplier_totals),
+    ("supply_status_counts", _match_supply_status_counts),
+    ("bid_participation_by_tender", _match_bid_participation),
+]
+
+
+def match_template(user_query, known_item=None, rollup_intents=False):
+    """Return (template_name, sql) for a recognized question shape, else None.
+
+    known_item(words), when given, confirms that an uncued phrase names an item in the data;
+    rollup_intents adds the aggregate questions the rollups answer.
+    """
+    tokens = set(normalize_query(user_query).split())
+    if not tokens:
+        return None
+    for name, rule in TOKEN_RULES + (ROLLUP_TOKEN_RULES if rollup_intents else []):
+        sql = rule(tokens)
+        if sql:
+            return name, sql
+
+    text = re.sub(r"\s+", " ", (user_query or "").strip())
+    for name, pattern in ITEM_PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        item_clause = item_filter(match.group("item"), bool(match.group("cue")), known_item)
+        if item_clause:
+            return name, ITEM_TEMPLATES[name].format(item_filter=item_clause)
+    return None
+
+
+class SqlSourceStats:
+    """Counts where each request's SQL came from (template, cache, llm, ...)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.templates = {}
+
+    def record(self, source, template_name=None):
+        with self._lock:
+            self.counts[source] = self.counts.get(source, 0) + 1
+            if template_name:
+                self.templates[template_name] = self.templates.get(template_name, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.counts.values())
+            rates = {
+                f"{source}_rate": round(count / total, 4) if total else 0.0
+                for source, count in self.counts.items()
+            }
+            return {"total": total, **self.counts, **rates, "templates": dict(self.templates)}
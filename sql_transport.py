@@ -0,0 +1,193 @@
+# Pooled, instrumented HTTP transport for SQL_ENDPOINT
+
+import json
+import threading
+import time
+
+from json_stream import RowStreamParser
+
+
+# Response bytes read per chunk while streaming rows
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class SqlEndpointError(Exception):
+    """The endpoint answered with an {"error": ...} body"""
+
+
+class SqlTransport:
+    """POSTs SQL to the endpoint over a bounded keep-alive pool; returns (result, metrics)"""
+
+    def __init__(self, endpoint, pool_size=8, connect_timeout=3.0, read_timeout=30.0, retries=2,
+                 backoff_factor=0.2, keepalive=True, pool_timeout=None):
+        self.endpoint = endpoint
+        self.pool_timeout = pool_timeout
+        self.pool_settings = (pool_size, connect_timeout, read_timeout, retries, backoff_factor, keepalive)
+        self.pool = None
+        self._lock = threading.Lock()
+        self.totals = {"requests": 0, "errors": 0, "retries": 0, "connections_opened": 0, "bytes": 0}
+
+    def _pool(self):
+        """The urllib3 pool, built on first use; returns the sql_pool module"""
+        import sql_pool
+
+        if self.pool is None:
+            with self._lock:
+                if self.pool is None:
+                    pool, self.timeout, self.retries = sql_pool.build_pool(*self.pool_settings)
+                    self.pool = pool
+        return sql_pool
+
+    def warm_up(self, connections=1):
+        """Build the pool and open keep-alive connections to the endpoint ahead of the first query"""
+        self._pool()
+        pool = self.pool.connection_from_url(self.endpoint)
+        opened = [pool._get_conn() for _ in range(connections)]
+        try:
+            for conn in opened:
+                if conn.sock is None:
+                    conn.connect()
+        finally:
+            for conn in opened:
+                pool._put_conn(conn)
+
+    def _open(self, payload):
+        """Send the request; returns the response with headers read and the body unread"""
+        self._pool()
+        return self.pool.request(
+            "POST",
+            self.endpoint,
+            body=json.dumps(payload),
+            timeout=self.timeout,
+            retries=self.retries,
+            preload_content=False,
+            decode_content=True,
+            pool_timeout=self.pool_timeout,
+        )
+
+    def post_json(self, payload, max_rows=None, max_bytes=None):
+        """POST payload and parse the JSON response incrementally as it arrives.
+
+        Rows are decoded chunk by chunk (the body is never held as one bytes/str copy). Reading
+        stops once max_rows rows or max_bytes decoded bytes have arrived; the result is then
+        marked with _row_limit_reached.
+        """
+        sql_pool = self._pool()
+        metrics = {"queue_ms": 0.0, "connect_ms": 0.0, "connections_opened": 0}
+        sql_pool.current.metrics = metrics
+        started = time.perf_counter()
+        http_response = None
+        capped = False
+        try:
+            http_response = self._open(payload)
+            metrics["ttfb_ms"] = (time.perf_counter() - started) * 1000
+            metrics["status"] = http_response.status
+            retry_history = http_response.retries.history if http_response.retries else ()
+            metrics["retries"] = len(retry_history)
+
+            parser = RowStreamParser()
+            rows = []
+            decoded_bytes = 0
+            for chunk in http_response.stream(STREAM_CHUNK_BYTES, decode_content=True):
+                decoded_bytes += len(chunk)
+                rows.extend(parser.feed(chunk))
+                if (max_rows is not None and len(rows) >= max_rows) or (max_bytes is not None and decoded_bytes >= max_bytes):
+                    capped = not parser.done
+                    break
+            if capped:
+                if max_rows is not None:
+                    del rows[max_rows:]
+                # The rest of the body is abandoned; the connection cannot be reused
+                http_response.close()
+            else:
+                rows.extend(parser.finish())
+            metrics["bytes"] = http_response.tell()
+            metrics["decoded_bytes"] = decoded_bytes
+            metrics["rows"] = len(rows)
+            result = parser.result(rows)
+            if capped:
+                metrics["row_limit_reached"] = True
+                if not isinstance(result, dict):
+                    result = {"rows": result}
+                result["_row_limit_reached"] = True
+                result["_rows_received"] = len(rows)
+        except sql_pool.MaxRetryError as e:
+            metrics["retries"] = self.retries.total
+            result = {"error": f"SQL execution failed: {type(e.reason).__name__}: {e.reason}"}
+        except (sql_pool.HTTPError, OSError) as e:
+            result = {"error": f"SQL execution failed: {type(e).__name__}: {e}"}
+        except ValueError as e:
+            status = http_response.status if http_response is not None else None
+            result = {"error": f"SQL execution failed: invalid JSON response (HTTP {status}): {e}"}
+        finally:
+            if http_response is not None:
+                http_response.release_conn()
+            sql_pool.current.metrics = None
+        metrics["total_ms"] = (time.perf_counter() - started) * 1000
+        metrics["transfer_ms"] = metrics["total_ms"] - metrics.get("ttfb_ms", metrics["total_ms"])
+        metrics = {key: round(value, 1) if isinstance(value, float) else value for key, value in metrics.items()}
+        self._update_totals(metrics, isinstance(result, dict) and "error" in result)
+        return result, metrics
+
+    def iter_rows(self, payload, max_rows=None, metrics=None):
+        """POST payload and yield rows as they are parsed; no rows are kept.
+
+        Failures raise (urllib3 HTTPError/OSError, ValueError for invalid JSON, SqlEndpointError for
+        an {"error": ...} body). metrics, when given, receives bytes, rows and row_limit_reached, plus
+        "columns" when the endpoint sends an explicit column list ahead of the rows.
+        """
+        metrics = {} if metrics is None else metrics
+        http_response = self._open(payload)
+        rows_seen = 0
+        completed = False
+        failed = False
+        try:
+            metrics["status"] = http_response.status
+            parser = RowStreamParser()
+            for chunk in http_response.stream(STREAM_CHUNK_BYTES, decode_content=True):
+                for row in parser.feed(chunk):
+                    if rows_seen == 0 and parser.envelope and "columns" in parser.envelope:
+                        metrics["columns"] = parser.envelope["columns"]
+                    if max_rows is not None and rows_seen >= max_rows:
+                        metrics["row_limit_reached"] = True
+                        break
+                    rows_seen += 1
+                    yield row
+                if metrics.get("row_limit_reached"):
+                    break
+            if not metrics.get("row_limit_reached"):
+                for row in parser.finish():
+                    if max_rows is not None and rows_seen >= max_rows:
+                        metrics["row_limit_reached"] = True
+                        break
+                    rows_seen += 1
+                    yield row
+                if parser.envelope and "error" in parser.envelope:
+                    raise SqlEndpointError(parser.envelope["error"])
+                completed = True
+        except Exception:
+            failed = True
+            raise
+        finally:
+            metrics["bytes"] = http_response.tell()
+            metrics["rows"] = rows_seen
+            if not completed:
+                # Abandoned mid-body; the connection cannot be reused
+                http_response.close()
+            http_response.release_conn()
+            self._update_totals({"bytes": metrics["bytes"]}, failed)
+
+    def _update_totals(self, metrics, failed):
+        with self._lock:
+            self.totals["requests"] += 1
+            self.totals["errors"] += int(failed)
+            self.totals["retries"] += metrics.get("retries", 0)
+            self.totals["connections_opened"] += metrics.get("connections_opened", 0)
+            self.totals["bytes"] += metrics.get("bytes", 0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.totals)
+        # Connection reuse: requests served without opening a new connection
+        stats["reuse_rate"] = round(1 - stats["connections_opened"] / stats["requests"], 4) if stats["requests"] else 0.0
+        return stats
@@ -0,0 +1,317 @@
+# Local validation and deterministic repair of generated Oracle SQL (runs before SQL_ENDPOINT)
+
+import re
+import threading
+
+
+# Columns of the two tables, as documented in the SQL generation prompt
+SCHEMA_CATALOG = {
+    "PO_DATA": {
+        "MCID", "CATEGORY", "SUPPLIERNAME", "PONO", "ITEMTYPENAME", "ITEMCODE", "ITEMNAME", "STRENGTH1",
+        "VED", "UNIT", "PODATE", "POQTY", "RECEIVEDQTY", "RECEIVED%", "PIPELINE_QTY", "PO_TIMELINE",
+        "PO_LAST_DAY", "IS_EXTENDED", "EXTENDED_UP_TO_DATE", "LAST_MRC_DATE", "MIN_MRC_DATE",
+        "DAYS_LAST_TO_FIRST_MRC", "TIMLY_SUPPLIED", "DAYSTAKENSUPPLY_FIRST_MRC", "STATUS",
+        "SUPPLIED_PIPELINE_REC_PER_STATUS", "NIBREQ", "STERLITY_REQ", "PO_DATEFY", "AI_FIN_YEAR",
+        "PO_FIN_YEAR", "TENDER_NO", "TOTAL_PO_VALUE", "TOTAL_RECEEVED_VALUE", "TOTAL_PIPELINE_VALUE",
+        "BASERATEINRS", "TAX%", "HOLD_STOCK",
+    },
+    "TENDER_DATA": {
+        "CATEGORY", "ITEMCODE", "ITEMNAME", "STRENGTH", "UNIT", "TENDERID", "TENDERCODE",
+        "TENDERSTARTDATE", "SUBMISSIONLASTDATE", "NO_OF_EXTENSIONS", "COV_A_OPEN_DATE", "COV_B_OPEN_DATE",
+        "PRICE_BID_OPEN_DATE", "BID_FOUND_IN_COVER_A", "BID_FOUND_IN_COVER_B", "BID_FOUND_IN_COVER_C",
+        "TENDER_STATUS", "TENDER_RC_STATUS", "TENDER_RC_START_DATE", "TENDER_RC_END_DATE",
+        "TENDER_RC_DAYS_REMAINING", "ITEM_RC_STATUS", "ITEM_RC_START_DATE", "ITEM_RC_END_DATE",
+        "ITEM_RC_DAYS_REMAINING", "ISEDL2021", "ISEDL2025", "IS_ACTIVE",
+    },
+}
+ALL_COLUMNS = set().union(*SCHEMA_CATALOG.values())
+# RC expiry bucket of a TENDER_DATA row, shared by the aggregate templates and the rollups
+RC_EXPIRY_BUCKET = (
+    "CASE WHEN ITEM_RC_STATUS = 'RC Expired' OR ITEM_RC_DAYS_REMAINING < 0 THEN 'Expired' "
+    "WHEN ITEM_RC_DAYS_REMAINING <= 30 THEN 'Expiring within 30 days' "
+    "WHEN ITEM_RC_DAYS_REMAINING > 30 THEN 'Valid beyond 30 days' ELSE 'No RC' END"
+)
+# Tables that may appear in FROM besides the catalog (and CTE names)
+SYSTEM_TABLES = {"DUAL"}
+# Columns the model invents, and what they mean
+COLUMN_ALIASES = {"EDL": "ISEDL2025"}
+
+FORBIDDEN_KEYWORDS = {
+    "INSERT", "UPDATE", "DELETE", "MERGE", "DROP", "CREATE", "ALTER", "TRUNCATE", "GRANT", "REVOKE",
+    "EXECUTE", "EXEC", "BEGIN", "DECLARE", "CALL", "COMMIT", "ROLLBACK", "RENAME", "LOCK",
+}
+CLAUSE_KEYWORDS = {"SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "CONNECT", "START", "FETCH", "OFFSET", "WITH", "UNION", "INTERSECT", "MINUS"}
+JOIN_END_KEYWORDS = {"ON", "USING", "WHERE", "GROUP", "HAVING", "ORDER", "JOIN", "INNER", "LEFT", "RIGHT",
+                     "FULL", "CROSS", "OUTER", "NATURAL", "UNION", "INTERSECT", "MINUS", "FETCH", "OFFSET", "CONNECT", "START"}
+VALUE_CONTEXT = {"=", "!=", "<>", "<", ">", "<=", ">=", "LIKE", "IN", "THEN", "ELSE", "WHEN", "BETWEEN", "AND", "NVL", "||"}
+# Tokens after which a quoted identifier is a reference rather than an alias definition
+USAGE_PREFIXES = VALUE_CONTEXT | {
+    "SELECT", "DISTINCT", "WHERE", "OR", "NOT", "BY", "ON", "CASE", "HAVING", "IS",
+    "+", "-", "*", "/", "(", ",",
+}
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"[^"]*")
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$#]*)
+  | (?P<op><=|>=|<>|!=|\|\||[=<>(),.;*+\-/%])
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+class SqlRejected(Exception):
+    """SQL that cannot be repaired into a safe, schema-valid SELECT"""
+
+
+def tokenize(sql):
+    """Split SQL into (kind, text) tokens; whitespace and comments are kept so the SQL can be rebuilt"""
+    return [(match.lastgroup, match.group()) for match in TOKEN_PATTERN.finditer(sql)]
+
+
+def _significant(tokens):
+    return [index for index, (kind, _) in enumerate(tokens) if kind not in ("space", "comment")]
+
+
+def _token_at(significant, position):
+    return significant[position] if position < len(significant) else ("", "")
+
+
+def _received_pct_expression(qualifier):
+    prefix = f"{qualifier}." if qualifier else ""
+    return f"({prefix}RECEIVEDQTY / NULLIF({prefix}POQTY, 0)) * 100"
+
+
+def _repair(tokens, repairs):
+    """Rewrite the known-bad patterns in place on the token list"""
+    # Unquoted TAX% / RECEIVED%: identifier immediately followed by "%"
+    index = 0
+    while index < len(tokens) - 1:
+        kind, text = tokens[index]
+        if kind == "word" and tokens[index + 1] == ("op", "%") and f"{text.upper()}%" in ALL_COLUMNS:
+            tokens[index:index + 2] = [("quoted", f'"{text.upper()}%"')]
+            repairs.append("quote_percent_column")
+        index += 1
+
+    significant = _significant(tokens)
+    quoted_aliases = {
+        tokens[significant[position + 1]][1].upper()
+        for position in range(len(significant) - 1)
+        if tokens[significant[position]][1].upper() == "AS" and tokens[significant[position + 1]][0] == "quoted"
+    }
+
+    clause = {}
+    depth = 0
+    for position, index in enumerate(significant):
+        kind, text = tokens[index]
+        upper = text.upper()
+        previous = tokens[significant[position - 1]][1].upper() if position > 0 else ""
+        following = tokens[significant[position + 1]][1].upper() if position + 1 < len(significant) else ""
+        if text == "(":
+            depth += 1
+            clause[depth] = None
+            continue
+        if text == ")":
+            depth -= 1
+            continue
+        if kind == "word" and upper in CLAUSE_KEYWORDS:
+            clause[depth] = upper
+            continue
+
+        if kind == "quoted":
+            name = text[1:-1]
+            if name.upper() == "RECEIVED%":
+                # "RECEIVED%" fails with ORA-00904; compute it from the quantities instead
+                qualifier = None
+                if previous == "." and position >= 2:
+                    qualifier = tokens[significant[position - 2]][1]
+                    tokens[significant[position - 2]] = ("space", "")
+                    tokens[significant[position - 1]] = ("space", "")
+                expression = _received_pct_expression(qualifier)
+                in_select_list = clause.get(depth) == "SELECT" and following in (",", "FROM", "")
+                tokens[index] = ("word", expression + (' AS "RECEIVED%"' if in_select_list else ""))
+                repairs.append("received_pct_expression")
+            elif name.upper() in COLUMN_ALIASES:
+                tokens[index] = ("word", COLUMN_ALIASES[name.upper()])
+                repairs.append("edl_column")
+            elif name.upper() not in ALL_COLUMNS and name.upper() not in quoted_aliases and previous != "AS" and (
+                    previous in VALUE_CONTEXT or (previous == "," and clause.get(depth) != "SELECT") or previous == "("):
+                # Double-quoted string literal: Oracle reads it as an identifier
+                tokens[index] = ("string", "'" + name.replace("'", "''") + "'")
+                repairs.append("double_quoted_literal")
+        elif kind == "word" and upper in COLUMN_ALIASES and previous != "AS" and following != "(":
+            tokens[index] = ("word", COLUMN_ALIASES[upper])
+            repairs.append("edl_column")
+
+    # LIMIT n -> FETCH FIRST n ROWS ONLY
+    significant = _significant(tokens)
+    for position, index in enumerate(significant[:-1]):
+        if tokens[index][1].upper() == "LIMIT" and tokens[significant[position + 1]][0] == "number":
+            count = tokens[significant[position + 1]][1]
+            tokens[index] = ("word", f"FETCH FIRST {count} ROWS ONLY")
+            tokens[significant[position + 1]] = ("space", "")
+            repairs.append("limit_to_fetch")
+
+    # Trailing semicolons
+    while tokens and (tokens[-1][0] == "space" or tokens[-1] == ("op", ";")):
+        if tokens[-1] == ("op", ";"):
+            repairs.append("trailing_semicolon")
+        tokens.pop()
+    return tokens
+
+
+def _table_references(tokens):
+    """Tables named in FROM / JOIN lists, a map of alias -> table, and CTE names"""
+    significant = [tokens[index] for index in _significant(tokens)]
+    ctes = set()
+    for position, (kind, text) in enumerate(significant[:-2]):
+        if kind == "word" and significant[position + 1][1].upper() == "AS" and significant[position + 2][1] == "(":
+            previous = significant[position - 1][1].upper() if position else ""
+            if previous in ("WITH", ","):
+                ctes.add(text.upper())
+
+    tables = []
+    aliases = {}
+    openers = []
+    from_depth = None
+    expecting_table = False
+    for position, (kind, text) in enumerate(significant):
+        upper = text.upper()
+        if expecting_table:
+            expecting_table = False
+            if text != "(":
+                table = upper.strip('"')
+                next_position = position + 1
+                if _token_at(significant, next_position)[1] == ".":
+                    # schema.table
+                    table = _token_at(significant, next_position + 1)[1].upper().strip('"')
+                    next_position += 2
+                tables.append(table)
+                aliases[table] = table
+                if _token_at(significant, next_position)[1].upper() == "AS":
+                    next_position += 1
+                alias_kind, alias = _token_at(significant, next_position)
+                if alias_kind in ("word", "quoted") and alias.upper() not in JOIN_END_KEYWORDS:
+                    aliases[alias.upper().strip('"')] = table
+                continue
+        if text == "(":
+            openers.append(significant[position - 1][1].upper() if position else "")
+        elif text == ")":
+            if from_depth == len(openers):
+                from_depth = None
+            if openers:
+                openers.pop()
+        elif kind == "word" and upper == "FROM":
+            # EXTRACT(YEAR FROM PODATE) / TRIM(x FROM y) are not table references
+            if openers and openers[-1] in ("EXTRACT", "TRIM", "SUBSTRING"):
+                continue
+            expecting_table = True
+            from_depth = len(openers)
+        elif kind == "word" and upper == "JOIN":
+            expecting_table = True
+        elif kind == "word" and upper in CLAUSE_KEYWORDS and from_depth == len(openers):
+            from_depth = None
+        elif text == "," and from_depth == len(openers):
+            # Comma-separated FROM lists: FROM PO_DATA p, TENDER_DATA t
+            expecting_table = True
+    return tables, aliases, ctes
+
+
+def _validate(tokens):
+    """Raise SqlRejected for statements that must not reach the database"""
+    significant = [tokens[index] for index in _significant(tokens)]
+    if not significant:
+        raise SqlRejected("empty SQL")
+    first = significant[0][1].upper()
+    if first not in ("SELECT", "WITH") and significant[0][1] != "(":
+        raise SqlRejected(f"only SELECT queries are allowed (got {first})")
+    for kind, text in significant:
+        if kind == "word" and text.upper() in FORBIDDEN_KEYWORDS:
+            raise SqlRejected(f"forbidden keyword {text.upper()}")
+        if text == ";":
+            raise SqlRejected("multiple statements")
+
+    tables, aliases, ctes = _table_references(tokens)
+    for table in tables:
+        if table not in SCHEMA_CATALOG and table not in SYSTEM_TABLES and table not in ctes:
+            raise SqlRejected(f"unknown table {table}")
+
+    # Qualified columns (p.COLUMN) must exist in the aliased table
+    for position in range(1, len(significant) - 1):
+        if significant[position][1] != ".":
+            continue
+        qualifier = significant[position - 1][1].upper().strip('"')
+        column = significant[position + 1][1].upper().strip('"')
+        table = aliases.get(qualifier)
+        if table in SCHEMA_CATALOG and column != "*" and column not in SCHEMA_CATALOG[table]:
+            raise SqlRejected(f"unknown column {qualifier}.{column}")
+
+    # Quoted identifiers used as values must be catalog columns or aliases defined in the query
+    defined = set()
+    used = []
+    for position, (kind, text) in enumerate(significant):
+        if kind != "quoted":
+            continue
+        previous = significant[position - 1][1].upper() if position else ""
+        if previous == ".":
+            continue
+        if previous in USAGE_PREFIXES:
+            used.append(text.upper())
+        else:
+            # SELECT SUM(x) AS "Total" / SUM(x) "Total" / FROM PO_DATA "p"
+            defined.add(text.upper())
+    for text in used:
+        name = text[1:-1]
+        if name not in ALL_COLUMNS and text not in defined and name not in aliases and name not in ctes:
+            raise SqlRejected(f"unknown column {text}")
+
+
+def validate_sql(sql):
+    """Repair known schema pitfalls and validate; returns (sql, repairs, rejection_reason)"""
+    repairs = []
+    tokens = _repair(tokenize(sql.strip()), repairs)
+    repaired_sql = "".join(text for _, text in tokens).strip()
+    try:
+        _validate(tokenize(repaired_sql))
+    except SqlRejected as e:
+        return repaired_sql, repairs, str(e)
+    return repaired_sql, repairs, None
+
+
+class SqlValidatorStats:
+    """Counts validated, repaired and rejected SQL, by repair kind and rejection reason"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.validated = 0
+        self.repaired = 0
+        self.rejected = 0
+        self.repairs = {}
+        self.rejections = {}
+
+    def record(self, repairs, rejection=None):
+        with self._lock:
+            self.validated += 1
+            if repairs:
+                self.repaired += 1
+            for repair in repairs:
+                self.repairs[repair] = self.repairs.get(repair, 0) + 1
+            if rejection:
+                self.rejected += 1
+                # Group reasons without their specific table/column names
+                reason = rejection.split(" (")[0]
+                if reason.startswith(("unknown", "forbidden")):
+                    reason = reason.rsplit(" ", 1)[0]
+                self.rejections[reason] = self.rejections.get(reason, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "validated": self.validated,
+                "repaired": self.repaired,
+                "rejected": self.rejected,
+                "repairs": dict(self.repairs),
+                "rejections": dict(self.rejections),
+            }
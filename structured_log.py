@@ -0,0 +1,240 @@
+# Structured JSON logging: size-capped fields, row-count summaries, sampled payloads, async buffered writer
+
+import atexit
+import datetime
+import json
+import queue
+import random
+import sys
+import threading
+import traceback
+
+from result_encoding import extract_rows, result_columns
+
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+# Room kept for a "...[+N bytes]" or "...[+N more]" truncation marker
+MARKER_BYTES = 32
+
+
+def cap_text(text, max_bytes):
+    """text cut to max_bytes of UTF-8, with a marker saying how much was dropped"""
+    encoded = text.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode("utf-8", errors="ignore") + f"...[+{len(encoded) - max_bytes} bytes]"
+
+
+def _truncate(value, budget):
+    """A copy of value that stops walking once about budget bytes are kept, and the bytes kept.
+
+    Strings are cut to the remaining budget and lists and dicts end with a marker counting the
+    items left out, so a large result is never serialized whole just to be cut.
+    """
+    if isinstance(value, str):
+        text = cap_text(value, max(budget - MARKER_BYTES, 0))
+        return text, len(text.encode("utf-8")) + 2
+    if isinstance(value, dict):
+        truncated, items = {}, value.items()
+    elif isinstance(value, (list, tuple)):
+        truncated, items = [], enumerate(value)
+    else:
+        return value, len(str(value))
+    used = 2
+    for index, (key, item) in enumerate(items):
+        # Stop once the next item could not keep more than its own marker
+        if used + 2 * MARKER_BYTES >= budget:
+            marker = f"...[+{len(value) - index} more]"
+            if isinstance(truncated, dict):
+                truncated["..."] = marker
+            else:
+                truncated.append(marker)
+            return truncated, used + len(marker) + 3
+        if isinstance(truncated, dict):
+            used += len(str(key)) + 3
+        child, size = _truncate(item, budget - used - MARKER_BYTES)
+        used += size + 1
+        if isinstance(truncated, dict):
+            truncated[key] = child
+        else:
+            truncated.append(child)
+    return truncated, used
+
+
+def cap_value(value, max_bytes):
+    """A log field no larger than max_bytes once serialized; larger structures are cut while walking them"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return cap_text(value, max_bytes)
+    truncated, _ = _truncate(value, max_bytes)
+    encoded = json.dumps(truncated, default=str, separators=(",", ":"), ensure_ascii=False)
+    if len(encoded.encode("utf-8")) <= max_bytes:
+        return truncated
+    # Escapes and markers can push the walked copy past the estimate; it is small by now
+    return cap_text(encoded, max_bytes)
+
+
+def summarize_result(sql_result, sample_rows=0):
+    """Row count, columns and the first sample_rows rows of a SQL result (or its error) instead of the rows"""
+    if isinstance(sql_result, dict) and "error" in sql_result:
+        return {"error": sql_result["error"]}
+    rows = extract_rows(sql_result)
+    if rows is None:
+        return {"type": type(sql_result).__name__}
+    summary = {"rows": len(rows), "columns": result_columns(sql_result, rows[:50])}
+    if isinstance(sql_result, dict):
+        summary.update({key: value for key, value in sql_result.items() if key.startswith("_")})
+    if sample_rows:
+        summary["sample"] = rows[:sample_rows]
+    return summary
+
+
+class AsyncLogWriter:
+    """Queues log lines and writes them from a daemon thread in batches, off the request path.
+
+    The queue is bounded; when it is full, lines are dropped and counted rather than blocking.
+    """
+
+    def __init__(self, stream=None, max_lines=10000, batch_lines=256):
+        self.stream = stream or sys.stdout
+        self.batch_lines = batch_lines
+        self._queue = queue.Queue(maxsize=max_lines)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def write(self, line):
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            # Block for the first line, then take whatever else is already queued
+            lines = [self._queue.get()]
+            while len(lines) < self.batch_lines:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            except Exception:
+                pass
+            for _ in lines:
+                self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued line is written"""
+        self._queue.join()
+
+
+class SyncLogWriter:
+    """Writes each line immediately (local runs and tests)"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.dropped = 0
+
+    def write(self, line):
+        self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def flush(self):
+        self.stream.flush()
+
+
+class StructuredLogger:
+    """JSON log records with every field capped at field_max_bytes.
+
+    Verbose payloads (result rows, full LLM output) go in payload= and are only logged for a
+    payload_sample_rate fraction of records, each capped at payload_max_bytes.
+    """
+
+    def __init__(self, writer, level="info", field_max_bytes=2048, payload_sample_rate=0.0,
+                 payload_max_bytes=16384):
+        self.writer = writer
+        self.level = LEVELS.get(level, LEVELS["info"])
+        self.field_max_bytes = field_max_bytes
+        self.payload_sample_rate = payload_sample_rate
+        self.payload_max_bytes = payload_max_bytes
+        self._context = threading.local()
+        self.records = 0
+        self.sampled = 0
+
+    def bind(self, **fields):
+        """Fields added to every record logged from this thread (e.g. request_id); None values unbind"""
+        context = dict(getattr(self._context, "fields", {}))
+        context.update(fields)
+        self._context.fields = {key: value for key, value in context.items() if value is not None}
+
+    def context(self):
+        """The fields bound on this thread, to bind on worker threads of the same request"""
+        return dict(getattr(self._context, "fields", {}))
+
+    def log(self, level, event, payload=None, **fields):
+        if LEVELS[level] < self.level:
+            return
+        record = {
+            "ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": level,
+            "event": event,
+        }
+        record.update(getattr(self._context, "fields", {}))
+        for key, value in fields.items():
+            record[key] = cap_value(value, self.field_max_bytes)
+        if payload and self.payload_sample_rate and random.random() < self.payload_sample_rate:
+            record["payload"] = {key: cap_value(value, self.payload_max_bytes) for key, value in payload.items()}
+            self.sampled += 1
+        self.records += 1
+        self.writer.write(json.dumps(record, default=str, separators=(",", ":"), ensure_ascii=False))
+
+    def debug(self, event, **fields):
+        self.log("debug", event, **fields)
+
+    def info(self, event, **fields):
+        self.log("info", event, **fields)
+
+    def warning(self, event, **fields):
+        self.log("warning", event, **fields)
+
+    def error(self, event, **fields):
+        self.log("error", event, **fields)
+
+    def exception(self, event, error, **fields):
+        """Error record with the exception and its (capped) traceback"""
+        self.log(
+            "error",
+            event,
+            error=str(error),
+            error_type=type(error).__name__,
+            traceback=traceback.format_exc(),
+            **fields
+        )
+
+    def flush(self):
+        self.writer.flush()
+
+    def stats(self):
+        return {"records": self.records, "sampled_payloads": self.sampled, "dropped": self.writer.dropped}
+
+
+# The process logger for modules below func (caches, clients, engines); func installs its configured
+# logger with set_logger before building them, and scripts that never do get a synchronous default
+_logger = None
+
+
+def set_logger(logger):
+    global _logger
+    _logger = logger
+
+
+def get_logger():
+    global _logger
+    if _logger is None:
+        _logger = StructuredLogger(SyncLogWriter())
+    return _logger
@@ -0,0 +1,222 @@
+# Statistical summary of a full SQL result set for the narrative prompt
+
+import math
+from functools import lru_cache
+
+from result_encoding import extract_rows, normalize_number, result_columns, row_values
+
+
+# Monetary columns (stored in Lakhs) used for top-K group rollups
+MONETARY_COLUMNS = ("TOTAL_PO_VALUE", "TOTAL_PIPELINE_VALUE", "TOTAL_RECEEVED_VALUE")
+# Status-like columns reported as full distributions
+STATUS_COLUMNS = ("STATUS", "TENDER_RC_STATUS", "ITEM_RC_STATUS", "TENDER_STATUS")
+# Preferred dimensions for monetary group rollups
+GROUP_COLUMNS = ("SUPPLIERNAME", "ITEMNAME", "CATEGORY", "STATUS", "PO_FIN_YEAR", "TENDERCODE", "VED")
+QUANTILES = (0.25, 0.5, 0.75, 0.95)
+TOP_K = 10
+MAX_GROUP_CARDINALITY = 5000
+
+
+def _to_float(value):
+    """Numeric value of a cell, or None for blanks and non-numeric text"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if isinstance(value, float) and math.isnan(value) else float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(",", ""))
+        except ValueError:
+            return None
+    return None
+
+
+def _column_values(rows, columns):
+    """Column-major view of the rows"""
+    values = {column: [] for column in columns}
+    for row in rows:
+        for column, value in zip(columns, row_values(row, columns)):
+            values[column].append(value)
+    return values
+
+
+@lru_cache(maxsize=None)
+def _numpy():
+    """NumPy, imported on first use (it is only needed for summaries), or None when not installed"""
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover - NumPy is optional; pure Python fallback below
+        return None
+    return numpy
+
+
+def _numeric_stats(numbers):
+    np = _numpy()
+    if np is not None:
+        array = np.asarray(numbers, dtype=float)
+        quantiles = np.quantile(array, QUANTILES)
+        stats = {
+            "sum": float(array.sum()),
+            "min": float(array.min()),
+            "max": float(array.max()),
+            "mean": float(array.mean()),
+        }
+    else:
+        ordered = sorted(numbers)
+        quantiles = [_quantile(ordered, q) for q in QUANTILES]
+        stats = {
+            "sum": math.fsum(ordered),
+            "min": ordered[0],
+            "max": ordered[-1],
+            "mean": math.fsum(ordered) / len(ordered),
+        }
+    for q, value in zip(QUANTILES, quantiles):
+        stats[f"p{int(q * 100)}"] = float(value)
+    return {key: normalize_number(round(value, 4)) for key, value in stats.items()}
+
+
+def _quantile(ordered, q):
+    """Linear-interpolated quantile of a sorted list (same method as numpy.quantile)"""
+    position = (len(ordered) - 1) * q
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _value_counts(values):
+    counts = {}
+    for value in values:
+        key = "N/A" if value is None or value == "" else str(value)
+        counts[key] = counts.get(key, 0) + 1
+    return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+
+def _group_sums(keys, numbers):
+    """Sum and count of numbers per key, largest sums first"""
+    np = _numpy()
+    if np is not None:
+        labels, inverse = np.unique(np.asarray(keys, dtype=object).astype(str), return_inverse=True)
+        weights = np.asarray(numbers, dtype=float)
+        sums = np.bincount(inverse, weights=np.nan_to_num(weights), minlength=len(labels))
+        counts = np.bincount(inverse, minlength=len(labels))
+        order = np.argsort(-sums)[:TOP_K]
+        return [[str(labels[i]), normalize_number(round(float(sums[i]), 4)), int(counts[i])] for i in order]
+    totals = {}
+    for key, number in zip(keys, numbers):
+        total = totals.setdefault(str(key), [0.0, 0])
+        total[0] += 0.0 if number is None or math.isnan(number) else number
+        total[1] += 1
+    ordered = sorted(totals.items(), key=lambda item: -item[1][0])[:TOP_K]
+    return [[key, normalize_number(round(total, 4)), count] for key, (total, count) in ordered]
+
+
+def stratified_sample(rows, strata, sample_size):
+    """Proportional, evenly spaced sample of row indexes per stratum (at least one per stratum)"""
+    if sample_size <= 0:
+        return []
+    if len(rows) <= sample_size:
+        return list(range(len(rows)))
+    groups = {}
+    for index, key in enumerate(strata):
+        groups.setdefault(key, []).append(index)
+    picked = []
+    for members in groups.values():
+        share = max(1, round(sample_size * len(members) / len(rows)))
+        step = len(members) / share
+        picked.extend(members[int(i * step)] for i in range(min(share, len(members))))
+    picked.sort()
+    if len(picked) > sample_size:
+        # More strata than sample slots (or rounding overshoot): thin evenly across all strata
+        step = len(picked) / sample_size
+        picked = [picked[int(i * step)] for i in range(sample_size)]
+    return picked
+
+
+def _summarize_columns(sql_result):
+    """(summary without its sample, rows, columns, strata keys), or None when the result has no rows"""
+    rows = extract_rows(sql_result)
+    if rows is None:
+        return None
+    columns = result_columns(sql_result, rows)
+    values = _column_values(rows, columns)
+    upper_names = {column.upper(): column for column in columns}
+
+    column_stats = {}
+    numeric_columns = {}
+    categorical_columns = []
+    for column in columns:
+        cells = values[column]
+        non_null = [value for value in cells if value is not None and value != ""]
+        numbers = [_to_float(value) for value in non_null]
+        if non_null and all(number is not None for number in numbers):
+            numeric_columns[column] = [_to_float(value) for value in cells]
+            stats = {"type": "numeric", "count": len(numbers), "nulls": len(cells) - len(numbers)}
+            stats.update(_numeric_stats(numbers))
+        else:
+            counts = _value_counts(cells)
+            categorical_columns.append(column)
+            stats = {
+                "type": "categorical",
+                "count": len(non_null),
+                "nulls": len(cells) - len(non_null),
+                "distinct": len(counts),
+                "top": list(counts.items())[:TOP_K],
+            }
+        column_stats[column] = stats
+
+    top_groups = {}
+    for monetary in MONETARY_COLUMNS:
+        measure = upper_names.get(monetary)
+        if measure not in numeric_columns:
+            continue
+        numbers = [math.nan if number is None else number for number in numeric_columns[measure]]
+        for dimension in GROUP_COLUMNS:
+            group_column = upper_names.get(dimension)
+            if group_column is None or group_column not in categorical_columns:
+                continue
+            if column_stats[group_column]["distinct"] > MAX_GROUP_CARDINALITY:
+                continue
+            top_groups[f"{measure} by {group_column}"] = _group_sums(values[group_column], numbers)
+
+    distributions = {}
+    for status in STATUS_COLUMNS:
+        column = upper_names.get(status)
+        if column is not None:
+            distributions[column] = _value_counts(values[column])
+
+    # Stratify the sample by the first status column, else the lowest-cardinality category
+    stratify_by = next(iter(distributions), None)
+    if stratify_by is None and categorical_columns:
+        stratify_by = min(categorical_columns, key=lambda column: column_stats[column]["distinct"])
+    strata = [str(key) for key in values[stratify_by]] if stratify_by else [None] * len(rows)
+
+    summary = {
+        "total_rows": len(rows),
+        "columns": column_stats,
+        "top_groups_by_value": top_groups,
+        "status_distributions": distributions,
+        "sample": {"stratified_by": stratify_by, "columns": columns, "rows": []},
+    }
+    return summary, rows, columns, strata
+
+
+def summarize_sql_result_samples(sql_result, sample_sizes):
+    """Yield the summary with each of sample_sizes rows sampled; the statistics are computed once.
+
+    Consumers stop iterating at the first summary that fits, so later samples are never drawn.
+    """
+    summarized = _summarize_columns(sql_result)
+    if summarized is None:
+        return
+    summary, rows, columns, strata = summarized
+    for sample_size in sample_sizes:
+        sample_indexes = stratified_sample(rows, strata, sample_size)
+        yield {
+            **summary,
+            "sample": {**summary["sample"], "rows": [row_values(rows[index], columns) for index in sample_indexes]},
+        }
+
+
+def summarize_sql_result(sql_result, sample_size=50):
+    """Summarize every row: column stats, monetary top-K groups, status distributions, sample"""
+    return next(summarize_sql_result_samples(sql_result, [sample_size]), None)
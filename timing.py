@@ -0,0 +1,106 @@
+# Per-request stage timings and counters: Server-Timing header, _timings block, timing log records
+
+import contextlib
+import re
+import threading
+import time
+
+
+# The timer of the request running on this thread (worker threads start their own)
+_current = threading.local()
+
+# Server-Timing metric names are HTTP tokens
+_TOKEN_PATTERN = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+
+class Timer:
+    """Wall-clock spans per stage (repeated stages accumulate) plus counters (tokens, rows, bytes)"""
+
+    def __init__(self, name="request"):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name, ms):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + ms, count + 1)
+
+    def count(self, key, value=1):
+        if value is not None:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def summary(self):
+        """The _timings block: total, per-stage ms (and call counts when repeated), counters"""
+        spans = {}
+        for name, (ms, count) in self.spans.items():
+            spans[name] = {"ms": round(ms, 1), "count": count} if count > 1 else round(ms, 1)
+        return {"total_ms": round(self.elapsed_ms(), 1), "stages": spans, "counters": dict(self.counters)}
+
+    def server_timing(self):
+        """Server-Timing header value, e.g. 'generate_sql;dur=812.4, execute_sql;dur=95.1, total;dur=1650.2'"""
+        metrics = [f"{_TOKEN_PATTERN.sub('_', name)};dur={ms:.1f}" for name, (ms, _) in self.spans.items()]
+        metrics.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(metrics)
+
+    def record(self):
+        """Fields of the JSON timing log line: every stage in ms, for p50/p95/p99 aggregation downstream"""
+        return {
+            "name": self.name,
+            "total_ms": round(self.elapsed_ms(), 1),
+            "stages_ms": {name: round(ms, 1) for name, (ms, _) in self.spans.items()},
+            "counters": dict(self.counters),
+        }
+
+
+def start(name="request"):
+    """Start a timer for the request on this thread"""
+    timer = Timer(name)
+    _current.timer = timer
+    return timer
+
+
+def current():
+    return getattr(_current, "timer", None)
+
+
+def finish(timer):
+    """Detach timer from this thread (when it is still the current one)"""
+    if current() is timer:
+        _current.timer = None
+
+
+@contextlib.contextmanager
+def span(name):
+    """Time a stage of the current request; a no-op outside one"""
+    timer = current()
+    if timer is None:
+        yield
+        return
+    with timer.span(name):
+        yield
+
+
+def count(key, value=1):
+    """Add to a counter of the current request (tokens, rows, bytes)"""
+    timer = current()
+    if timer is not None:
+        timer.count(key, value)
+
+
+def add(name, ms):
+    """Record a stage measured elsewhere (e.g. by the SQL transport)"""
+    timer = current()
+    if timer is not None:
+        timer.add(name, ms)
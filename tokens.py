@@ -0,0 +1,86 @@
+# Token counting and prompt budgeting for the Cohere calls
+
+import os
+
+from structured_log import get_logger
+
+
+class HeuristicTokenCounter:
+    """Approximate token count (4 characters per token)"""
+
+    name = "heuristic"
+
+    def count(self, text):
+        return len(text) // 4
+
+
+class TokenizerFileCounter:
+    """Exact counts from a local tokenizer.json loaded with the `tokenizers` package (no network).
+
+    Neither the file nor the package ships with the function; deployments that want exact counts add both.
+    """
+
+    def __init__(self, path):
+        from tokenizers import Tokenizer
+        self._tokenizer = Tokenizer.from_file(path)
+        self.name = f"tokenizer:{os.path.basename(path)}"
+
+    def count(self, text):
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def load_token_counter(path=None):
+    """Use the tokenizer at path when it can be loaded, else fall back to the heuristic"""
+    if not path:
+        return HeuristicTokenCounter()
+    if not os.path.exists(path):
+        get_logger().warning("tokenizer_not_found", path=path)
+        return HeuristicTokenCounter()
+    try:
+        return TokenizerFileCounter(path)
+    except Exception as e:
+        get_logger().error("tokenizer_load_failed", path=path, error=str(e))
+    return HeuristicTokenCounter()
+
+
+class TokenBudget:
+    """Splits the model context window between preamble, message, output and result data"""
+
+    def __init__(self, context_window, max_output_tokens, data_cap=None, safety_margin=0.02):
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.data_cap = data_cap
+        self.safety_margin = safety_margin
+
+    def available_for_data(self, preamble_tokens, message_tokens=0):
+        """Tokens left for the formatted result after reserving everything else"""
+        reserved = preamble_tokens + message_tokens + self.max_output_tokens
+        available = int((self.context_window - reserved) * (1 - self.safety_margin))
+        if self.data_cap is not None:
+            available = min(available, self.data_cap)
+        return max(available, 0)
+
+
+def fit_rows_to_budget(rows, budget_tokens, count_row):
+    """Choose (top_n, bottom_n) so head and tail rows together fill budget_tokens.
+
+    Rows are taken alternately from the start and the end, so the sample keeps the
+    top/bottom shape of the old fixed 20 + 20 truncation but uses the whole budget.
+    Only rows that end up in the sample are counted.
+    """
+    top_n = 0
+    bottom_n = 0
+    used = 0
+    take_top = True
+    while top_n + bottom_n < len(rows):
+        row = rows[top_n] if take_top else rows[len(rows) - 1 - bottom_n]
+        cost = count_row(row)
+        if used + cost > budget_tokens:
+            break
+        used += cost
+        if take_top:
+            top_n += 1
+        else:
+            bottom_n += 1
+        take_top = not take_top
+    return top_n, bottom_n
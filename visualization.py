@@ -0,0 +1,141 @@
+# Deterministic chart recommendation from the shape of a SQL result (no LLM call)
+
+import re
+
+from result_encoding import extract_rows, result_columns
+
+
+# Rows inspected when profiling column types
+PROFILE_ROWS = 200
+# Most slices a pie chart may have
+PIE_MAX_SLICES = 8
+
+DATE_NAME_PATTERN = re.compile(r"(DATE|_DAY$|^MONTH|_MONTH$|MONTH_|^YEAR|_YEAR$|FIN_YEAR|PERIOD)", re.IGNORECASE)
+DATE_VALUE_PATTERN = re.compile(
+    r"^(\d{4}-\d{1,2}(-\d{1,2})?([ T]\d{1,2}:\d{2}(:\d{2})?.*)?|\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|"
+    r"\d{1,2}-[A-Za-z]{3}-\d{2,4}|[A-Za-z]{3}-\d{2,4})$"
+)
+# Numeric columns that identify rows rather than measure them
+IDENTIFIER_PATTERN = re.compile(r"(^|_)(NO|ID|CODE|PONO|ITEMCODE|TENDERID|TENDERCODE)$|^(PONO|ITEMCODE|TENDERID|TENDERCODE|SR|SNO)$", re.IGNORECASE)
+# Questions asking for parts of a whole
+SHARE_PATTERN = re.compile(r"\b(share|shares|proportion|percentage|percent|distribution|breakdown|split|composition|mix)\b|%", re.IGNORECASE)
+# Measure pairs that add up to a whole and are drawn stacked
+STACKED_MEASURES = (
+    {"TOTAL_RECEEVED_VALUE", "TOTAL_PIPELINE_VALUE"},
+    {"RECEIVEDQTY", "PENDINGQTY"},
+)
+
+
+def default_visualization():
+    """Visualization object used when no chart fits the data"""
+    return {
+        "chartType": None,
+        "title": "Auto-generated Chart",
+        "xAxis": None,
+        "yAxis": None,
+        "mode": None
+    }
+
+
+def _is_number(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    if isinstance(value, str):
+        try:
+            float(value.replace(",", ""))
+            return True
+        except ValueError:
+            return False
+    return False
+
+
+def _column_value(row, index, column):
+    if isinstance(row, dict):
+        return row.get(column)
+    if isinstance(row, (list, tuple)):
+        return row[index] if index < len(row) else None
+    return row
+
+
+def profile_columns(rows, columns):
+    """Classify each column as date / numeric / identifier / categorical, with its cardinality"""
+    sample = rows[:PROFILE_ROWS]
+    profiles = {}
+    for index, column in enumerate(columns):
+        values = [_column_value(row, index, column) for row in sample]
+        present = [value for value in values if value is not None and value != ""]
+        numeric = bool(present) and all(_is_number(value) for value in present)
+        if DATE_NAME_PATTERN.search(column) or (present and not numeric and all(
+                isinstance(value, str) and DATE_VALUE_PATTERN.match(value.strip()) for value in present)):
+            kind = "date"
+        elif numeric and IDENTIFIER_PATTERN.search(column):
+            kind = "identifier"
+        elif numeric:
+            kind = "numeric"
+        else:
+            kind = "categorical"
+        profiles[column] = {
+            "kind": kind,
+            "distinct": len({str(value) for value in present}),
+            "negative": numeric and any(float(str(value).replace(",", "")) < 0 for value in present),
+        }
+    return profiles
+
+
+def _label(column):
+    return column.replace("_", " ").strip().title()
+
+
+def _title(measures, x_axis):
+    return f"{', '.join(_label(measure) for measure in measures)} by {_label(x_axis)}"
+
+
+def recommend_visualization(sql_result, user_query=""):
+    """Pick chartType, axes and mode from column types and cardinalities"""
+    rows = extract_rows(sql_result)
+    if not rows or len(rows) < 2:
+        return default_visualization()
+    columns = result_columns(sql_result, rows)
+    profiles = profile_columns(rows, columns)
+
+    measures = [column for column in columns if profiles[column]["kind"] == "numeric"]
+    dates = [column for column in columns if profiles[column]["kind"] == "date"]
+    categories = [column for column in columns if profiles[column]["kind"] in ("categorical", "identifier")]
+    if not measures:
+        return default_visualization()
+
+    # Trends over time: date column on the x axis
+    if dates:
+        x_axis = dates[0]
+        return {
+            "chartType": "line",
+            "title": f"{', '.join(_label(measure) for measure in measures)} over {_label(x_axis)}",
+            "xAxis": x_axis,
+            "yAxis": measures,
+            "mode": "single" if len(measures) == 1 else "grouped"
+        }
+
+    if not categories:
+        return default_visualization()
+    # Prefer a readable label column over identifiers (ITEMNAME over ITEMCODE)
+    labels = [column for column in categories if profiles[column]["kind"] == "categorical"] or categories
+    x_axis = labels[0]
+
+    if len(measures) == 1:
+        measure = measures[0]
+        few_slices = profiles[x_axis]["distinct"] <= PIE_MAX_SLICES and len(rows) <= PIE_MAX_SLICES
+        if few_slices and not profiles[measure]["negative"] and SHARE_PATTERN.search(user_query or ""):
+            return {"chartType": "pie", "title": _title(measures, x_axis), "xAxis": x_axis, "yAxis": measures, "mode": "single"}
+        return {"chartType": "bar", "title": _title(measures, x_axis), "xAxis": x_axis, "yAxis": measures, "mode": "single"}
+
+    upper_measures = {measure.upper() for measure in measures}
+    stacked = any(upper_measures == parts for parts in STACKED_MEASURES)
+    return {
+        "chartType": "bar",
+        "title": _title(measures, x_axis),
+        "xAxis": x_axis,
+        "yAxis": measures,
+        "mode": "stacked" if stacked else "grouped"
+    }